@@ -0,0 +1,212 @@
+"""End-to-end benchmarks of the conversion on a ladder of backup sizes.
+
+Usage:
+
+    python -m benchmarks.run [--sizes tiny,small] [--output results.json]
+                             [--compare previous.json]
+
+Every size is converted in a fresh interpreter, so that its peak RSS is
+its own. The results file records, for every size, the wall time of the
+whole conversion and of each of its stages, the peak RSS and the number
+of questions converted per second. Results files from two commits can be
+compared with --compare.
+
+The time `moodle2pretext --help` takes is recorded too, and the run fails
+if it is over STARTUP_BUDGET.
+"""
+
+import argparse
+import json
+import os
+from os import path
+import platform
+import resource
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+import time
+
+from benchmarks.synthetic_backup import BackupSpec, writeBackup
+
+SIZES = {
+    "tiny":
+        BackupSpec(quizzes=2, sections=1, bankEntries=12, questionsPerQuiz=5),
+    "small":
+        BackupSpec(quizzes=8, sections=3, bankEntries=120, questionsPerQuiz=12),
+    "medium":
+        BackupSpec(
+            quizzes=30, sections=8, bankEntries=800, questionsPerQuiz=20),
+    "large":
+        BackupSpec(
+            quizzes=120, sections=20, bankEntries=5000, questionsPerQuiz=30),
+}
+
+DEFAULT_SIZES = ["tiny", "small", "medium"]
+
+# Most seconds `moodle2pretext --help` may take
+STARTUP_BUDGET = 0.5
+
+# Modules that must not be loaded before the arguments are parsed
+HEAVY_MODULES = (
+    "bs4", "jinja2", "lxml", "ptx_formatter", "moodle2pretext.course")
+
+HELP_COMMAND = "from moodle2pretext.main import run; run()"
+
+
+def measure(backup: str, workDir: str) -> dict:
+  """Runs the conversion of backup in this process and measures it."""
+  from moodle2pretext.course import Course
+  from moodle2pretext.options import ConversionOptions
+  from moodle2pretext.utils.profiler import profiler
+
+  # Tracing memory would slow down the conversion being timed
+  profiler.start(traceMemory=False)
+  start = time.perf_counter()
+  # Caches kept across runs would leave every run after the first with
+  # nothing to do
+  course = Course.fromZip(
+      backup,
+      path.join(workDir, "output"),
+      options=ConversionOptions(execCache=False, formatCache=False))
+  wall = time.perf_counter() - start
+  profiler.stop()
+  questions = course.questionCount
+  # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+  peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform != "darwin":
+    peakRss *= 1024
+  return {
+      "wall": wall,
+      "questions": questions,
+      "questionsPerSecond": questions / wall,
+      "stages":
+          {
+              span.name: span.wall
+              for span in profiler.spans
+              if span.category == "stage"
+          },
+      "totals": profiler.totals(),
+      "peakRss": peakRss,
+  }
+
+
+def measureStartup(runs: int = 5) -> float:
+  """Fastest of several runs of `moodle2pretext --help`, in seconds."""
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", HELP_COMMAND, "--help"],
+        capture_output=True,
+        check=True)
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+def loadedHeavyModules() -> list[str]:
+  """The heavy modules that loading the command line pulls in."""
+  code = (
+      "import sys, moodle2pretext.main; "
+      f"print(' '.join(m for m in sys.modules if m.startswith({HEAVY_MODULES})))"
+  )
+  child = subprocess.run(
+      [sys.executable, "-c", code], capture_output=True, text=True, check=True)
+  return child.stdout.split()
+
+
+def runSize(name: str, spec: BackupSpec) -> dict:
+  with TemporaryDirectory() as tempDir:
+    backup = path.join(tempDir, f"{name}.mbz")
+    writeBackup(backup, spec)
+    child = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--measure", backup, tempDir],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=path.dirname(path.dirname(path.abspath(__file__))))
+    result = json.loads(child.stdout.splitlines()[-1])
+    result.update(
+        size=name, spec=spec.toDict(), backupBytes=path.getsize(backup))
+  return result
+
+
+def currentCommit() -> str | None:
+  try:
+    return subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=path.dirname(__file__)).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def runBenchmarks(sizes: list[str]) -> dict:
+  return {
+      "commit": currentCommit(),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "cpus": os.cpu_count(),
+      "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "startup": measureStartup(),
+      "startupBudget": STARTUP_BUDGET,
+      "results": [runSize(name, SIZES[name]) for name in sizes],
+  }
+
+
+def formatResults(results: dict, previous: dict | None = None) -> str:
+  before = {
+      result["size"]: result
+      for result in (previous or {}).get("results", [])
+  }
+  lines = [
+      f"{'size':<8}{'questions':>10}{'wall (s)':>10}{'q/s':>10}"
+      f"{'peak RSS (MB)':>15}{'vs previous':>13}"
+  ]
+  for result in results["results"]:
+    change = ""
+    if result["size"] in before:
+      change = f"{result['wall'] / before[result['size']]['wall']:.2f}x"
+    lines.append(
+        f"{result['size']:<8}{result['questions']:>10}"
+        f"{result['wall']:>10.2f}{result['questionsPerSecond']:>10.1f}"
+        f"{result['peakRss'] / 2**20:>15.1f}{change:>13}")
+  return "\n".join(lines)
+
+
+def main(argv: list[str]) -> None:
+  parser = argparse.ArgumentParser(
+      prog="python -m benchmarks.run", description=__doc__.split("\n")[0])
+  parser.add_argument(
+      "--sizes",
+      default=",".join(DEFAULT_SIZES),
+      help=f"Comma separated sizes, out of: {', '.join(SIZES)}")
+  parser.add_argument(
+      "--output", default="benchmark-results.json", help="Results file")
+  parser.add_argument(
+      "--compare", help="Results file of a previous run to compare with")
+  parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+  if args.measure:
+    print(json.dumps(measure(*args.measure)))
+    return
+  sizes = args.sizes.split(",")
+  unknown = [size for size in sizes if size not in SIZES]
+  if unknown:
+    parser.error(f"Unknown sizes: {', '.join(unknown)}")
+  results = runBenchmarks(sizes)
+  with open(args.output, "w") as f:
+    json.dump(results, f, indent=2)
+  previous = None
+  if args.compare:
+    with open(args.compare) as f:
+      previous = json.load(f)
+  print(formatResults(results, previous))
+  print(f"startup: {results['startup']:.3f}s (budget {STARTUP_BUDGET}s)")
+  if results["startup"] > STARTUP_BUDGET:
+    sys.exit("Startup is over its budget")
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
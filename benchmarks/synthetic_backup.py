@@ -0,0 +1,286 @@
+"""Generator of synthetic Moodle backups, for benchmarks and tests.
+
+The backups have the layout and the elements of a real `.mbz` export, as
+far as the converter reads them: a question bank with every supported
+question type, quizzes referencing entries of the bank, sections ordering
+the quizzes, and images and datafiles stored by content hash.
+"""
+
+from dataclasses import asdict, dataclass, field
+from hashlib import sha1
+from io import BytesIO
+import random
+import tarfile
+from typing import Self
+from xml.sax.saxutils import escape
+
+QUESTION_TYPES = (
+    "multichoice",
+    "match",
+    "shortanswer",
+    "numerical",
+    "coderunner",
+    "description",
+)
+
+
+@dataclass
+class BackupSpec:
+  """The shape of a synthetic backup."""
+  quizzes: int = 4
+  sections: int = 2
+  # Number of question bank entries, some of which no quiz uses
+  bankEntries: int = 40
+  questionsPerQuiz: int = 8
+  # Relative number of questions of each type
+  typeWeights: dict[str, int] = field(
+      default_factory=lambda: dict(
+          multichoice=4, match=1, shortanswer=2, numerical=1, coderunner=2,
+          description=1))
+  # Fraction of question texts that include an image
+  imageRate: float = 0.3
+  imageBytes: int = 20 * 1024
+  # Fraction of coderunner questions that read a datafile
+  datafileRate: float = 0.5
+  seed: int = 0
+
+  def toDict(self: Self) -> dict:
+    return asdict(self)
+
+
+class BackupWriter:
+  """Builds the members of a synthetic backup and writes them as a tar.gz."""
+
+  def __init__(self: Self, spec: BackupSpec):
+    self.spec = spec
+    self.reset()
+
+  def reset(self: Self) -> None:
+    """Starts over from the seed, so that every backup built is the same."""
+    self.random = random.Random(self.spec.seed)
+    self.files: list[str] = []
+    self.blobs: dict[str, bytes] = {}
+    self.nextId = 1
+    self.questionTypes: list[str] = []
+
+  def newId(self: Self) -> int:
+    self.nextId += 1
+    return self.nextId
+
+  def write(self: Self, filename: str) -> None:
+    members = self.makeMembers()
+    with tarfile.open(filename, "w:gz") as tar:
+      for name, contents in members.items():
+        tarInfo = tarfile.TarInfo(name)
+        tarInfo.size = len(contents)
+        tar.addfile(tarInfo, BytesIO(contents))
+
+  def makeMembers(self: Self) -> dict[str, bytes]:
+    self.reset()
+    members = {"moodle_backup.xml": b"<moodle_backup></moodle_backup>"}
+    entries = [
+        self.makeEntry(entryId) for entryId in range(self.spec.bankEntries)
+    ]
+    members["questions.xml"] = (
+        "<question_categories><question_category id=\"1\">"
+        "<question_bank_entries>" + "".join(entries) +
+        "</question_bank_entries></question_category></question_categories>"
+    ).encode("utf-8")
+    moduleIds = []
+    for quiz in range(self.spec.quizzes):
+      moduleId = 100 + quiz
+      moduleIds.append(moduleId)
+      members[f"activities/quiz_{moduleId}/quiz.xml"] = self.makeQuiz(
+          quiz, moduleId).encode("utf-8")
+    for number in range(self.spec.sections):
+      sequence = moduleIds[number::self.spec.sections]
+      members[f"sections/section_{number + 1}/section.xml"] = self.makeSection(
+          number + 1, sequence).encode("utf-8")
+    members["files.xml"] = ("<files>" + "".join(self.files) +
+                            "</files>").encode("utf-8")
+    for contentHash, contents in self.blobs.items():
+      members[f"files/{contentHash[:2]}/{contentHash}"] = contents
+    return members
+
+  def pickType(self: Self) -> str:
+    types = list(self.spec.typeWeights)
+    weights = [self.spec.typeWeights[t] for t in types]
+    return self.random.choices(types, weights)[0]
+
+  def makeEntry(self: Self, entryId: int) -> str:
+    qType = self.pickType()
+    self.questionTypes.append(qType)
+    questionId = self.newId()
+    body = getattr(self, f"make_{qType}")(questionId)
+    return (
+        f"<question_bank_entry id=\"{entryId}\">"
+        "<question_version><question_versions id=\"1\"><version>1</version>"
+        f"<questions><question id=\"{questionId}\">"
+        f"<parent>0</parent><name>{qType}_{entryId}</name>"
+        f"<questiontext>{escape(self.makeText(questionId, entryId))}"
+        "</questiontext><questiontextformat>1</questiontextformat>"
+        "<generalfeedback></generalfeedback>"
+        f"<qtype>{qType}</qtype>{body}"
+        "</question></questions></question_versions></question_version>"
+        "</question_bank_entry>")
+
+  def makeText(self: Self, questionId: int, entryId: int) -> str:
+    text = (
+        f"<h3>Question {entryId}</h3><p>Consider the <b>following</b> "
+        f"situation, number {entryId}.</p><ul><li>First point</li>"
+        "<li>Second point with <code>some_code()</code></li></ul>")
+    if self.random.random() < self.spec.imageRate:
+      filename = f"figure{entryId}.png"
+      self.addFile(
+          questionId, "questiontext", filename, "image/png", self.makeImage())
+      text += (
+          f"<p><img src=\"@@PLUGINFILE@@/{filename}\" alt=\"\" "
+          "width=\"300\" height=\"200\"></p>")
+    return text
+
+  def makeImage(self: Self) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + self.random.randbytes(self.spec.imageBytes)
+
+  def addFile(
+      self: Self,
+      itemId: int,
+      fileArea: str,
+      filename: str,
+      mimeType: str,
+      contents: bytes) -> None:
+    contentHash = sha1(contents).hexdigest()
+    self.blobs[contentHash] = contents
+    self.files.append(
+        f"<file id=\"{len(self.files) + 1}\">"
+        f"<contenthash>{contentHash}</contenthash><contextid>1</contextid>"
+        f"<component>question</component><filearea>{fileArea}</filearea>"
+        f"<itemid>{itemId}</itemid><filepath>/</filepath>"
+        f"<filename>{filename}</filename><filesize>{len(contents)}</filesize>"
+        f"<mimetype>{mimeType}</mimetype>"
+        "<timecreated>0</timecreated><timemodified>0</timemodified></file>")
+
+  def make_multichoice(self: Self, questionId: int) -> str:
+    answers = "".join(
+        f"<answer id=\"{self.newId()}\">"
+        f"<answertext>{escape(f'<p>Choice {index}</p>')}</answertext>"
+        f"<answerformat>1</answerformat><fraction>{1 if index == 0 else 0}"
+        f"</fraction><feedback>{escape(feedback)}</feedback>"
+        "<feedbackformat>1</feedbackformat></answer>"
+        for index, feedback in enumerate(
+            ["<p>Correct!</p>", "", "Incorrect", ""]))
+    return (
+        "<plugin_qtype_multichoice_question><answers>" + answers +
+        "</answers><multichoice id=\"1\"><single>1</single>"
+        "<shuffleanswers>1</shuffleanswers></multichoice>"
+        "</plugin_qtype_multichoice_question>")
+
+  def make_match(self: Self, questionId: int) -> str:
+    matches = "".join(
+        f"<match id=\"{self.newId()}\">"
+        f"<questiontext>{escape(f'<p>Statement {index}</p>')}</questiontext>"
+        "<questiontextformat>1</questiontextformat>"
+        f"<answertext>Answer {index}</answertext></match>"
+        for index in range(4))
+    return (
+        "<plugin_qtype_match_question><matchoptions id=\"1\">"
+        "<shuffleanswers>1</shuffleanswers></matchoptions><matches>" + matches +
+        "</matches></plugin_qtype_match_question>")
+
+  def make_shortanswer(self: Self, questionId: int) -> str:
+    answers = "".join(
+        f"<answer id=\"{self.newId()}\"><answertext>{text}</answertext>"
+        f"<answerformat>0</answerformat><fraction>{fraction}</fraction>"
+        f"<feedback>{escape(feedback)}</feedback>"
+        "<feedbackformat>1</feedbackformat></answer>"
+        for text, fraction, feedback in [
+            ("answer", "1.0000000", "<p>Correct!</p>"), (
+                "Answer", ".5000000", "<p>Mind the case.</p>")
+        ])
+    return (
+        "<plugin_qtype_shortanswer_question><answers>" + answers +
+        "</answers><shortanswer id=\"1\"><usecase>1</usecase></shortanswer>"
+        "</plugin_qtype_shortanswer_question>")
+
+  def make_numerical(self: Self, questionId: int) -> str:
+    answerIds = [self.newId(), self.newId()]
+    answers = "".join(
+        f"<answer id=\"{answerId}\"><answertext>{value}</answertext>"
+        f"<answerformat>0</answerformat><fraction>{fraction}</fraction>"
+        f"<feedback>{feedback}</feedback><feedbackformat>1</feedbackformat>"
+        "</answer>" for answerId, value, fraction, feedback in zip(
+            answerIds, ["42", "40"], ["1.0000000", "0.5000000"],
+            ["Correct!", "Almost!"]))
+    records = "".join(
+        f"<numerical_record id=\"{index}\"><answer>{answerId}</answer>"
+        f"<tolerance>{tolerance}</tolerance></numerical_record>"
+        for index, (answerId,
+                    tolerance) in enumerate(zip(answerIds, ["0.5", "2"])))
+    return (
+        "<plugin_qtype_numerical_question><answers>" + answers +
+        "</answers><numerical_units></numerical_units><numerical_records>" +
+        records + "</numerical_records></plugin_qtype_numerical_question>")
+
+  def make_coderunner(self: Self, questionId: int) -> str:
+    answer = "def triple(x):\n    return 3 * x\n"
+    # Pairs of test code and whether the case is an example
+    cases = [
+        ("print(triple(2))", 1), ("print(triple('ab'))", 1),
+        ("print(triple(0))", 0)
+    ]
+    if self.random.random() < self.spec.datafileRate:
+      self.addFile(
+          questionId, "datafile", "numbers.txt", "text/plain", b"1\n2\n3\n")
+      cases.append(
+          (
+              "with open('numbers.txt') as f:\n"
+              "    print(sum(triple(int(line)) for line in f))",
+              1))
+    testCases = "".join(
+        f"<coderunner_testcase id=\"{self.newId()}\">"
+        f"<testcode>{escape(code)}</testcode><testtype>0</testtype>"
+        f"<expected></expected><useasexample>{example}</useasexample>"
+        "<display>SHOW</display><mark>1.000</mark><stdin></stdin>"
+        "<extra></extra></coderunner_testcase>" for code, example in cases)
+    return (
+        "<plugin_qtype_coderunner_question><coderunner_options>"
+        "<coderunner_option id=\"1\"><coderunnertype>python3</coderunnertype>"
+        "<answerpreload>def triple(x):\n    pass\n</answerpreload>"
+        "<template>$@NULL@$</template>"
+        f"<answer>{escape(answer)}</answer></coderunner_option>"
+        "</coderunner_options><coderunner_testcases>" + testCases +
+        "</coderunner_testcases></plugin_qtype_coderunner_question>")
+
+  def make_description(self: Self, questionId: int) -> str:
+    return ""
+
+  def makeQuiz(self: Self, quiz: int, moduleId: int) -> str:
+    count = min(self.spec.questionsPerQuiz, self.spec.bankEntries)
+    entryIds = self.random.sample(range(self.spec.bankEntries), count)
+    instances = "".join(
+        f"<question_instance id=\"{self.newId()}\"><slot>{slot + 1}</slot>"
+        "<question_reference id=\"1\"><component>mod_quiz</component>"
+        f"<questionbankentryid>{entryId}</questionbankentryid>"
+        "<version>$@NULL@$</version></question_reference>"
+        "</question_instance>" for slot, entryId in enumerate(entryIds))
+    intro = escape(f"<p>Introduction to quiz {quiz}.</p>")
+    return (
+        f"<activity id=\"{quiz + 1}\" moduleid=\"{moduleId}\" "
+        f"modulename=\"quiz\" contextid=\"{moduleId}\">"
+        f"<quiz id=\"{quiz + 1}\"><name>Quiz {quiz}</name>"
+        f"<intro>{intro}</intro><introformat>1</introformat>"
+        f"<question_instances>{instances}</question_instances></quiz>"
+        "</activity>")
+
+  def makeSection(self: Self, number: int, moduleIds: list[int]) -> str:
+    return (
+        f"<section id=\"{number}\"><number>{number}</number>"
+        f"<name>Section {number}</name><summary></summary>"
+        f"<sequence>{','.join(str(m) for m in moduleIds)}</sequence>"
+        "</section>")
+
+
+def writeBackup(filename: str, spec: BackupSpec) -> BackupWriter:
+  """Writes a backup with the given shape to filename."""
+  writer = BackupWriter(spec)
+  writer.write(filename)
+  return writer
@@ -1,2 +1,19 @@
-from moodle2pretext.assignment import Assignment
-from moodle2pretext.question import Question
+"""Converts the quizzes and question bank of a Moodle backup to PreTeXt."""
+
+# The classes are imported on first use, so that the command line can
+# start and parse its arguments without loading the converter.
+LAZY_ATTRIBUTES = {
+    "Assignment": "moodle2pretext.assignment",
+    "Question": "moodle2pretext.question",
+}
+
+
+def __getattr__(name: str):
+  if name in LAZY_ATTRIBUTES:
+    from importlib import import_module
+    return getattr(import_module(LAZY_ATTRIBUTES[name]), name)
+  raise AttributeError(f"module 'moodle2pretext' has no attribute '{name}'")
+
+
+def __dir__() -> list[str]:
+  return sorted(list(globals()) + list(LAZY_ATTRIBUTES))
@@ -0,0 +1,260 @@
+"""Module that reads the members of a Moodle backup.
+
+Backups come in several formats, told apart by their first bytes:
+
+- gzipped tar, the usual `.mbz`, and plain tar. A tar archive is read
+  exactly once, in order, since gzip streams cannot seek backwards without
+  decompressing again from the start. Every member we care about is sorted
+  into a `MemberRole` and spooled to a work directory, from which the later
+  stages can read it in whatever order they need.
+- ZIP, which newer Moodle versions produce. Its central directory lists
+  where every member starts, so members are read straight from the archive.
+- A backup that is already extracted to a directory, whose files are read
+  where they are.
+
+`openBackup` picks the reader for a backup. Every reader offers the same
+`names` and `open` methods, and is closed once the conversion is done with
+it.
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from enum import Enum
+from mmap import ACCESS_READ, mmap
+from os import makedirs, path, walk
+from pathlib import Path
+from re import compile
+from shutil import copyfileobj
+from tarfile import open as tarOpen
+import threading
+from typing import BinaryIO, Self
+from zipfile import ZipFile
+
+# Size of the chunks used when copying a member out of the archive
+CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGICS = (b"PK\x03\x04", b"PK\x05\x06")
+# The magic of a tar archive is at offset 257 of its first header
+TAR_MAGIC_OFFSET = 257
+TAR_MAGIC = b"ustar"
+
+
+class BackupFormat(Enum):
+  GZIP_TAR = "gzip-tar"
+  TAR = "tar"
+  ZIP = "zip"
+  DIRECTORY = "directory"
+
+
+class MemberRole(Enum):
+  FILES = "files.xml"
+  QUESTIONS = "questions.xml"
+  QUIZ = "quiz"
+  SECTION = "section"
+  ASSET = "asset"
+
+
+ROLE_PATTERNS = [
+    (MemberRole.FILES, compile(r"files\.xml")),
+    (MemberRole.QUESTIONS, compile(r"questions\.xml")),
+    (MemberRole.QUIZ, compile(r"activities/quiz_[0-9]+/quiz\.xml")),
+    (MemberRole.SECTION, compile(r"sections/section_[0-9]+/section\.xml")),
+    (MemberRole.ASSET, compile(r"files/[0-9a-f]{2}/[0-9a-f]+")),
+]
+
+
+def roleOf(name: str) -> MemberRole | None:
+  """Returns the role of an archive member, or None if we don't need it."""
+  for role, pattern in ROLE_PATTERNS:
+    if pattern.fullmatch(name):
+      return role
+  return None
+
+
+def detectFormat(backup: Path | str) -> BackupFormat:
+  """Tells the format of a backup from its first bytes."""
+  if path.isdir(backup):
+    return BackupFormat.DIRECTORY
+  with open(backup, "rb") as f:
+    header = f.read(TAR_MAGIC_OFFSET + len(TAR_MAGIC))
+  if header.startswith(GZIP_MAGIC):
+    return BackupFormat.GZIP_TAR
+  if header.startswith(ZIP_MAGICS):
+    return BackupFormat.ZIP
+  if header[TAR_MAGIC_OFFSET:] == TAR_MAGIC:
+    return BackupFormat.TAR
+  raise ValueError(f"Unrecognized backup format: {backup}")
+
+
+def openBackup(backup: Path | str, workDir: str) -> "BackupReader":
+  """Returns a reader for the backup, with its members indexed."""
+  match detectFormat(backup):
+    case BackupFormat.GZIP_TAR:
+      return ArchiveReader(backup, workDir).read()
+    case BackupFormat.TAR:
+      return ArchiveReader(backup, workDir, compressed=False).read()
+    case BackupFormat.ZIP:
+      return ZipReader(backup).read()
+    case BackupFormat.DIRECTORY:
+      return DirectoryReader(backup).read()
+
+
+class BackupReader(ABC):
+  """The members of a backup, by role.
+
+  Members are kept in the order in which they appear in the backup.
+  Subclasses index them in `read`, and give access to their contents.
+  """
+
+  def __init__(self, backup: Path | str):
+    self.backup = backup
+    self.members: dict[MemberRole, list[str]] = {role: [] for role in MemberRole}
+
+  def __enter__(self: Self) -> Self:
+    return self
+
+  def __exit__(self: Self, *_) -> None:
+    self.close()
+
+  @abstractmethod
+  def read(self) -> Self:
+    ...
+
+  def index(self, name: str) -> bool:
+    """Records the member if we need it, and returns whether we do."""
+    role = roleOf(name)
+    if role is None:
+      return False
+    self.members[role].append(name)
+    return True
+
+  def names(self, role: MemberRole) -> list[str]:
+    return self.members[role]
+
+  @abstractmethod
+  def open(self, name: str) -> BinaryIO:
+    ...
+
+  def pathTo(self, name: str) -> str | None:
+    """Where the member is on disk, if it is a file of its own."""
+    return None
+
+  @contextmanager
+  def openMapped(self, name: str) -> Iterator[BinaryIO]:
+    """Opens the member for reading, as a memory map when it is a file on
+    disk, so that parsers read it without copying it first."""
+    with self.open(name) as f:
+      yield f
+
+  def close(self) -> None:
+    """Releases what the reader keeps open."""
+
+
+class OnDiskReader(BackupReader):
+  """A reader whose members are each a file on disk."""
+
+  def open(self, name: str) -> BinaryIO:
+    return open(self.pathTo(name), "rb")
+
+  @contextmanager
+  def openMapped(self, name: str) -> Iterator[BinaryIO]:
+    with open(self.pathTo(name), "rb") as f:
+      # Empty files cannot be mapped
+      if path.getsize(f.name) == 0:
+        yield f
+        return
+      with mmap(f.fileno(), 0, access=ACCESS_READ) as mapped:
+        yield mapped
+
+
+class ArchiveReader(OnDiskReader):
+  """Indexes the members of a tar backup in one streaming pass, spooling
+  the ones we need to workDir."""
+
+  def __init__(self, backup: Path | str, workDir: str, compressed: bool = True):
+    super().__init__(backup)
+    self.workDir = workDir
+    self.mode = "r|gz" if compressed else "r|"
+    self.spooled: dict[str, str] = {}
+
+  def read(self) -> Self:
+    with tarOpen(self.backup, self.mode) as tar:
+      for tarInfo in tar:
+        if tarInfo.isfile() and self.index(tarInfo.name):
+          self.spool(tarInfo.name, tar.extractfile(tarInfo))
+    return self
+
+  def spool(self, name: str, stream: BinaryIO) -> None:
+    target = path.join(self.workDir, name)
+    makedirs(path.dirname(target), exist_ok=True)
+    with open(target, "wb") as out:
+      copyfileobj(stream, out, CHUNK_SIZE)
+    self.spooled[name] = target
+
+  def pathTo(self, name: str) -> str:
+    if name not in self.spooled:
+      raise KeyError(f"Cannot find archive member: {name}")
+    return self.spooled[name]
+
+
+class ZipReader(BackupReader):
+  """Reads the members of a ZIP backup in place, through its central
+  directory."""
+
+  def __init__(self, backup: Path | str):
+    super().__init__(backup)
+    # Opened in each process that reads from it, by the first thread that
+    # needs it
+    self.zipFile: ZipFile | None = None
+    self.lock = threading.Lock()
+
+  def __getstate__(self) -> dict:
+    # Neither the open archive nor the lock can be pickled
+    return {**self.__dict__, "zipFile": None, "lock": None}
+
+  def __setstate__(self, state: dict) -> None:
+    self.__dict__.update(state)
+    self.lock = threading.Lock()
+
+  def archive(self) -> ZipFile:
+    with self.lock:
+      if self.zipFile is None:
+        self.zipFile = ZipFile(self.backup)
+      return self.zipFile
+
+  def read(self) -> Self:
+    for zipInfo in self.archive().infolist():
+      if not zipInfo.is_dir():
+        self.index(zipInfo.filename)
+    return self
+
+  def open(self, name: str) -> BinaryIO:
+    if roleOf(name) is None:
+      raise KeyError(f"Cannot find archive member: {name}")
+    return self.archive().open(name)
+
+  def close(self) -> None:
+    with self.lock:
+      if self.zipFile is not None:
+        self.zipFile.close()
+        self.zipFile = None
+
+
+class DirectoryReader(OnDiskReader):
+  """Reads the files of a backup that is already extracted."""
+
+  def read(self) -> Self:
+    for root, directories, files in walk(self.backup):
+      # Walk in a stable order, as there is no archive order to follow
+      directories.sort()
+      for filename in sorted(files):
+        name = path.relpath(path.join(root, filename), self.backup)
+        self.index(name.replace(path.sep, "/"))
+    return self
+
+  def pathTo(self, name: str) -> str:
+    if roleOf(name) is None:
+      raise KeyError(f"Cannot find archive member: {name}")
+    return path.join(self.backup, *name.split("/"))
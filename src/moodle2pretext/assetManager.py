@@ -1,16 +1,33 @@
-from re import compile
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import TextIOWrapper
 import shutil
+import sys
+from functools import partial
 from typing import Self
-from collections.abc import Generator
-from tarfile import TarFile
+from collections.abc import Callable, Generator, Iterable
+from uuid import uuid4
 from xml.dom.minidom import parse
 from xml.dom import Node
 from dataclasses import dataclass
-from os import makedirs
+from os import link, makedirs, remove, replace
 from os import path
-from io import BytesIO
 
-from moodle2pretext.utils import getFirstInt, getFirstText
+from lxml import etree
+
+from moodle2pretext.archiveReader import BackupReader, MemberRole
+from moodle2pretext.utils.images import ImageOptimizer
+from moodle2pretext.utils.profiler import profiler
+from moodle2pretext.utils.xml_stream import iterElements, iterTexts, readAttributes
+
+# Size of the buffer used when copying an asset out of the backup
+COPY_BUFFER_SIZE = 1024 * 1024
+# Number of threads writing assets while the questions are converted
+EXPORT_THREADS = 4
+
+if sys.platform == "linux":
+  import fcntl
+  # The ioctl that makes a file share the blocks of another (linux/fs.h)
+  FICLONE = 0x40049409
 
 
 @dataclass
@@ -27,28 +44,121 @@ class Asset:
   timeModified: int
 
   @staticmethod
-  def fromEntry(e: Node) -> Self:
-    asset = Asset(
-        int(e.attributes["id"].value),
-        getFirstInt(e, "itemid"),
-        getFirstText(e, "contenthash"),
-        getFirstText(e, "filepath"),
-        getFirstText(e, "filename"),
-        getFirstText(e, "filearea"),
-        getFirstText(e, "filesize"),
-        getFirstText(e, "mimetype"),
-        getFirstInt(e, "timecreated"),
-        getFirstInt(e, "timemodified"))
-    return asset
+  def fromElement(e: etree._Element) -> Self:
+    """Reads the asset from a streamed file element of files.xml."""
+
+    def text(tag: str) -> str:
+      value = e.findtext(tag)
+      if value is None:
+        raise RuntimeError("No child tag: " + tag)
+      return value
+
+    return Asset(
+        int(e.get("id")),
+        int(text("itemid")),
+        text("contenthash"),
+        text("filepath"),
+        text("filename"),
+        text("filearea"),
+        int(text("filesize")),
+        text("mimetype"),
+        int(text("timecreated")),
+        int(text("timemodified")))
 
   def getPathToResource(self: Self) -> str:
     return path.join("files", self.contentHash[:2], self.contentHash)
 
 
+class AssetCatalogue:
+  """The assets listed in files.xml, indexed for constant time lookups."""
+
+  def __init__(self, assets: list[Asset]):
+    self.byName: dict[tuple[int, str], Asset] = {}
+    self.byArea: dict[tuple[int, str], list[Asset]] = {}
+    for asset in assets:
+      # files.xml order decides between assets with the same name
+      self.byName.setdefault((asset.itemId, asset.fileName), asset)
+      self.byArea.setdefault((asset.itemId, asset.fileArea), []).append(asset)
+
+  def find(self, itemId: int, fileName: str) -> Asset | None:
+    return self.byName.get((itemId, fileName))
+
+  def inArea(self, itemId: int, fileArea: str) -> list[Asset]:
+    return self.byArea.get((itemId, fileArea), [])
+
+
+def placeFile(target: str, make: Callable[[str], None]) -> None:
+  """Calls make with a new path next to target, then renames that path to
+  target. An existing target is replaced without ever being opened, as it
+  may be a link to a file that must not change."""
+  temp = path.join(
+      path.dirname(target), f".{path.basename(target)}.{uuid4().hex}.tmp")
+  try:
+    make(temp)
+    # Renaming a link onto another link to the same file does nothing
+    if path.exists(target) and path.samefile(temp, target):
+      remove(temp)
+    else:
+      replace(temp, target)
+  except BaseException:
+    if path.lexists(temp):
+      remove(temp)
+    raise
+
+
+def writeNew(contents: bytes, target: str) -> None:
+  with open(target, "xb") as f:
+    f.write(contents)
+
+
+def linkOrCopyNew(source: str, target: str) -> None:
+  try:
+    link(source, target)
+  except OSError:
+    shutil.copyfile(source, target)
+
+
+def linkOrCopy(source: str, target: str) -> None:
+  """Makes target a hard link to source, or a copy where links are not
+  possible."""
+  placeFile(target, partial(linkOrCopyNew, source))
+
+
+def cloneFile(source: str, target: str) -> None:
+  """Makes target a copy of source without copying its bytes, when the
+  file system allows: as a reflink, else as a hard link. Failing both, the
+  kernel copies the file."""
+
+  def make(temp: str) -> None:
+    if sys.platform == "linux":
+      try:
+        with open(source, "rb") as src, open(temp, "xb") as dst:
+          fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+      except OSError:
+        if path.lexists(temp):
+          remove(temp)
+    linkOrCopyNew(source, temp)
+
+  placeFile(target, make)
+
+
+def linkWhenWritten(first: Future[str], target: str) -> str:
+  # The first write was submitted earlier, so it has started by now
+  linkOrCopy(first.result(), target)
+  return target
+
+
 class AssetManager:
 
-  def __init__(self, tar: TarFile, directory: str):
-    self.tar = tar
+  def __init__(
+      self,
+      archive: BackupReader,
+      directory: str,
+      images: ImageOptimizer | None = None):
+    self.archive = archive
+    # Optimizes the images written, if set
+    self.images = images
     self.imageDir = path.join(directory, "assets", "images")
     self.sourceDir = path.join(directory, "source")
     makedirs(self.imageDir)
@@ -59,34 +169,150 @@ class AssetManager:
         directory,
         dirs_exist_ok=True)
 
-    entries = self.parseXML("files.xml").getElementsByTagName("file")
-    self.assets: list[Asset] = [Asset.fromEntry(e) for e in entries]
+    # Stream files.xml, so that its document is never held in full
+    self.assets: list[Asset] = [
+        Asset.fromElement(e) for e in self.iterElements("files.xml", "file")
+    ]
+    self.catalogue = AssetCatalogue(self.assets)
+    # Links handed out so far, by (itemId, fileName)
+    self.located: dict[tuple[int, str], str] = {}
+    # The first write of the contents of each content hash, which returns
+    # where they were written
+    self.extracted: dict[str, Future[str]] = {}
+    # Writes run on a thread pool, overlapped with the conversion, and are
+    # waited on by finishExports
+    self.exports: ThreadPoolExecutor | None = None
+    self.pendingExports: list[Future[str]] = []
+
+  def __getstate__(self) -> dict:
+    # Worker processes write the assets they locate with their own pool
+    return {
+        **self.__dict__, "extracted": {}, "exports": None, "pendingExports": []
+    }
 
   def parseXML(self: Self, filename: str) -> Node:
-    return parse(self.tar.extractfile(filename))
+    with self.archive.openMapped(filename) as f:
+      return parse(f)
+
+  def parseList(self: Self, role: MemberRole) -> Generator[Node, None, None]:
+    """Parses each member with the role in turn. A document is released
+    once the next one is asked for, so it must not be used after that."""
+    return self.parseEach(self.archive.names(role))
+
+  def parseEach(self: Self,
+                names: Iterable[str]) -> Generator[Node, None, None]:
+    for name in names:
+      document = self.parseXML(name)
+      yield document
+      # Break the cycles of the DOM, so its memory is freed right away
+      document.unlink()
 
-  def parseList(self: Self, regex: str) -> Generator[Node, None, None]:
-    prog = compile(regex)
-    for tarInfo in self.tar.getmembers():
-      if prog.match(tarInfo.name):
-        yield parse(self.tar.extractfile(tarInfo))
+  def iterTexts(self: Self, filename: str,
+                tag: str) -> Generator[str, None, None]:
+    with self.archive.openMapped(filename) as f:
+      yield from iterTexts(f, tag)
+
+  def readAttributes(self: Self, filename: str, tag: str) -> dict[str, str]:
+    with self.archive.openMapped(filename) as f:
+      return readAttributes(f, tag)
+
+  def iterElements(self: Self, filename: str,
+                   tag: str) -> Generator[etree._Element, None, None]:
+    with self.archive.openMapped(filename) as f:
+      yield from iterElements(f, tag)
 
   def getAssetAsFileHandler(self, asset: Asset):
-    return self.tar.extractfile(asset.getPathToResource())
+    return self.archive.open(asset.getPathToResource())
 
   def getAssetAsString(self, asset: Asset) -> str:
-    with self.getAssetAsFileHandler(asset) as f:
-      return f.read().decode("utf-8")
+    # Decoded as it is read, so the raw bytes are never held in full
+    with TextIOWrapper(self.getAssetAsFileHandler(asset), "utf-8") as f:
+      return f.read()
 
   def locateResource(self, itemId: int | str, filepath: str) -> str:
-    for asset in self.assets:
-      if asset.itemId == int(itemId) and asset.fileName == filepath:
-        baseFilename = f"{itemId}-{filepath}"
-        f = self.getAssetAsFileHandler(asset)
-        with open(path.join(self.imageDir, baseFilename), "wb") as out:
-          out.write(f.read())
-        return path.join("images", baseFilename)
-    raise Exception(f"Cannot find: {itemId} {filepath}")
+    key = (int(itemId), filepath)
+    if key not in self.located:
+      asset = self.catalogue.find(*key)
+      if asset is None:
+        raise Exception(f"Cannot find: {itemId} {filepath}")
+      baseFilename = f"{itemId}-{filepath}"
+      converted = None
+      if self.optimizes(asset) and self.images.converts:
+        # The name depends on whether the image converts, so that is
+        # found out before the link is handed out
+        converted = self.optimizeAsset(asset)
+        if converted is not None:
+          baseFilename = self.images.rename(baseFilename)
+      self.exportAsset(asset, path.join(self.imageDir, baseFilename), converted)
+      self.located[key] = path.join("images", baseFilename)
+    return self.located[key]
+
+  def exportAsset(
+      self, asset: Asset, target: str, contents: bytes | None = None) -> None:
+    """Starts writing the asset contents, or the given contents instead,
+    at target. Each content hash is only extracted once, later copies are
+    linked to that first file."""
+    if self.exports is None:
+      self.exports = ThreadPoolExecutor(max_workers=EXPORT_THREADS)
+    first = self.extracted.get(asset.contentHash)
+    if first is None:
+      export = self.exports.submit(
+          profiler.call,
+          "asset",
+          asset.fileName,
+          self.writeAsset,
+          asset,
+          target,
+          contents)
+      self.extracted[asset.contentHash] = export
+    else:
+      export = self.exports.submit(linkWhenWritten, first, target)
+    self.pendingExports.append(export)
+
+  def optimizes(self, asset: Asset) -> bool:
+    return self.images is not None and self.images.accepts(asset.mimeType)
+
+  def optimizeAsset(self, asset: Asset) -> bytes | None:
+    return self.images.optimize(
+        asset.contentHash,
+        asset.mimeType,
+        asset.fileSize,
+        partial(self.getAssetAsFileHandler, asset))
+
+  def writeAsset(
+      self, asset: Asset, target: str, contents: bytes | None = None) -> str:
+    # Images that are converted were optimized when they were located
+    if contents is None and self.optimizes(asset) and not self.images.converts:
+      contents = self.optimizeAsset(asset)
+    if contents is not None:
+      placeFile(target, partial(writeNew, contents))
+      return target
+    source = self.archive.pathTo(asset.getPathToResource())
+    if source is not None:
+      cloneFile(source, target)
+    else:
+      placeFile(target, partial(self.copyAsset, asset))
+    return target
+
+  def copyAsset(self, asset: Asset, target: str) -> None:
+    with self.getAssetAsFileHandler(asset) as f, open(target, "xb") as out:
+      shutil.copyfileobj(f, out, COPY_BUFFER_SIZE)
+
+  def finishExports(self) -> None:
+    """Waits until every asset located so far is written, raising the
+    first error of any of the writes."""
+    try:
+      for export in self.pendingExports:
+        export.result()
+    finally:
+      self.cancelExports()
+
+  def cancelExports(self) -> None:
+    """Stops the writes that have not started, and waits for the others."""
+    if self.exports is not None:
+      self.exports.shutdown(cancel_futures=True)
+      self.exports = None
+    self.pendingExports = []
 
   def createSourceFile(self, filename, contents: str) -> None:
     with open(path.join(self.sourceDir, filename), "w") as f:
@@ -96,7 +322,6 @@ class AssetManager:
     """For now, return list of the datafiles linked to a specific item id."""
     return {
         asset.fileName: self.getAssetAsString(asset)
-        for asset in self.assets
-        if asset.itemId == int(itemId) and asset.fileArea == "datafile" and
-        asset.fileName != "."
+        for asset in self.catalogue.inArea(int(itemId), "datafile")
+        if asset.fileName != "."
     }
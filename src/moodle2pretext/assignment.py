@@ -1,7 +1,8 @@
 from typing import Self
 from xml.dom import Node
 
-from moodle2pretext.question import Question, questionFromEntry
+from moodle2pretext.question import Question
+from moodle2pretext.questionBank import QuestionBank
 from moodle2pretext.utils import getFirst, getFirstText, getText
 from moodle2pretext.utils.html import simplifyHTML
 
@@ -15,7 +16,7 @@ class Assignment:
     self.questions = questions
 
   @staticmethod
-  def fromFile(document: Node, all_questions: list[Node]) -> Self:
+  def fromFile(document: Node, questionBank: QuestionBank) -> Self:
     id = getFirst(document, "activity").attributes["moduleid"].value
     quizEl = getFirst(document, "quiz")
     name = getFirstText(quizEl, "name")
@@ -24,11 +25,4 @@ class Assignment:
         getText(entry)
         for entry in quizEl.getElementsByTagName("questionbankentryid")
     ]
-    questions = {
-        entry.getAttribute("id"): questionFromEntry(entry)
-        for entry in all_questions
-        if entry.getAttribute("id") in qbEntries
-    }
-    questionsInOrder = [questions[entry] for entry in qbEntries]
-
-    return Assignment(id, name, intro, questionsInOrder)
+    return Assignment(id, name, intro, questionBank.resolve(qbEntries))
@@ -0,0 +1,156 @@
+"""Module that converts many Moodle backups in one run.
+
+Courses converted in the same process share the warm state of the
+converter: loaded modules, compiled templates, the HTML conversion cache
+and the interpreter pool that runs CodeRunner examples. With more than
+one job, courses are spread over worker processes that each keep their
+own warm state from one course to the next.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from glob import escape, glob
+import os
+from os import path
+import time
+import traceback
+from typing import Self
+
+from moodle2pretext.options import ConversionOptions
+
+BACKUP_EXTENSION = ".mbz"
+
+
+@dataclass
+class CourseResult:
+  backup: str
+  output: str
+  seconds: float = 0.0
+  assignments: int = 0
+  questions: int = 0
+  # Description of the error that stopped the conversion, if any
+  error: str | None = None
+
+  @property
+  def succeeded(self: Self) -> bool:
+    return self.error is None
+
+
+def findBackups(source: str) -> list[str]:
+  """The backups in a directory, or the files matching a glob pattern."""
+  if path.isdir(source):
+    return sorted(glob(path.join(escape(source), f"*{BACKUP_EXTENSION}")))
+  return sorted(filename for filename in glob(source) if path.isfile(filename))
+
+
+def outputLocations(backups: list[str], outputRoot: str) -> list[str]:
+  """One output directory per backup, named after it, under outputRoot.
+
+  Backups with the same name get a numbered suffix, skipping the names of
+  the other backups.
+  """
+  names = []
+  for backup in backups:
+    name = path.basename(backup)
+    if name.endswith(BACKUP_EXTENSION):
+      name = name[:-len(BACKUP_EXTENSION)]
+    names.append(name)
+  used = set(names)
+  seen = set()
+  locations = []
+  for name in names:
+    if name in seen:
+      suffix = 2
+      while f"{name}-{suffix}" in used:
+        suffix += 1
+      name = f"{name}-{suffix}"
+      used.add(name)
+    seen.add(name)
+    locations.append(path.join(outputRoot, name))
+  return locations
+
+
+def courseOptions(
+    options: ConversionOptions, courseJobs: int) -> ConversionOptions:
+  """The options of each course when courseJobs are converted at the same
+  time. Unless given, the cores running example cases are split between
+  them, as each course process has its own interpreter pool."""
+  if options.execJobs is not None or courseJobs <= 1:
+    return options
+  return replace(options, execJobs=max(1, (os.cpu_count() or 1) // courseJobs))
+
+
+def convertCourse(
+    backup: str, output: str, overwrite: bool,
+    options: ConversionOptions) -> CourseResult:
+  """Converts one backup, turning any error into a failed result."""
+  from moodle2pretext.course import Course
+
+  result = CourseResult(backup, output)
+  start = time.perf_counter()
+  try:
+    course = Course.fromZip(backup, output, overwrite, options)
+    result.assignments = course.assignmentCount
+    result.questions = course.questionCount
+  except Exception as error:
+    traceback.print_exc()
+    result.error = f"{type(error).__name__}: {error}"
+  result.seconds = time.perf_counter() - start
+  return result
+
+
+def convertAll(
+    backups: list[str],
+    outputRoot: str,
+    overwrite: bool = False,
+    options: ConversionOptions | None = None,
+    courseJobs: int = 1) -> list[CourseResult]:
+  """Converts each backup into its own directory under outputRoot.
+
+  Returns the result of each course, in the order of backups. A course
+  that fails does not stop the others.
+  """
+  options = courseOptions(options or ConversionOptions(), courseJobs)
+  outputs = outputLocations(backups, outputRoot)
+  if courseJobs <= 1:
+    return [
+        convertCourse(backup, output, overwrite, options)
+        for backup, output in zip(backups, outputs)
+    ]
+  results = []
+  with ProcessPoolExecutor(max_workers=courseJobs) as pool:
+    futures = [
+        pool.submit(convertCourse, backup, output, overwrite, options)
+        for backup, output in zip(backups, outputs)
+    ]
+    for backup, output, future in zip(backups, outputs, futures):
+      try:
+        results.append(future.result())
+      except Exception as error:
+        # The worker process itself died
+        results.append(
+            CourseResult(
+                backup, output, error=f"{type(error).__name__}: {error}"))
+  return results
+
+
+def formatSummary(results: list[CourseResult]) -> str:
+  nameWidth = max(
+      [len("course")] + [len(path.basename(r.output)) for r in results])
+  lines = [
+      f"{'course':<{nameWidth}}  {'status':<6}{'quizzes':>9}"
+      f"{'questions':>11}{'time (s)':>10}"
+  ]
+  for result in results:
+    status = "ok" if result.succeeded else "FAILED"
+    lines.append(
+        f"{path.basename(result.output):<{nameWidth}}  {status:<6}"
+        f"{result.assignments:>9}{result.questions:>11}"
+        f"{result.seconds:>10.2f}")
+  failed = [result for result in results if not result.succeeded]
+  lines.append(
+      f"{len(results) - len(failed)} of {len(results)} courses converted in "
+      f"{sum(r.seconds for r in results):.2f}s of course time")
+  for result in failed:
+    lines.append(f"{result.backup}: {result.error}")
+  return "\n".join(lines)
@@ -1,12 +1,17 @@
+from collections.abc import Iterable, Iterator
+import gc
 from pathlib import Path
-from tarfile import open as tarOpen, TarFile
 from typing import Self
-from tempfile import TemporaryDirectory
-import os
-import shutil
 
+from moodle2pretext.archiveReader import BackupReader, MemberRole, openBackup
 from moodle2pretext.assignment import Assignment
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.questionBank import QuestionBank
 from moodle2pretext.section import Section
+from moodle2pretext.utils.html import conversionCache
+from moodle2pretext.utils.images import ImageOptimizer, ImageReport
+from moodle2pretext.utils.output_sync import StagedOutput, SyncReport
+from moodle2pretext.utils.profiler import profiler
 from moodle2pretext.utils.ptx_writer import PtxWriter
 from moodle2pretext.assetManager import AssetManager
 
@@ -14,66 +19,162 @@ from moodle2pretext.assetManager import AssetManager
 class Course:
 
   assignments: list[Assignment]
+  # Number of assignments and questions written to the output
+  assignmentCount: int = 0
+  questionCount: int = 0
+  # What an incremental run changed in the output
+  outputReport: SyncReport | None = None
+  # The sizes of the images, when they are optimized
+  imageReport: ImageReport | None = None
 
   def __init__(self):
-    pass
+    self.options = ConversionOptions()
+    # Left empty in low memory mode, where assignments are released as soon
+    # as they are written
+    self.assignments = []
 
   @staticmethod
   def fromZip(
       moodle_backup: Path,
       output_location: Path,
-      overwrite: bool = False) -> Self:
+      overwrite: bool = False,
+      options: ConversionOptions | None = None) -> Self:
     course = Course()
-    with tarOpen(moodle_backup, "r:gz") as tar:
-      with TemporaryDirectory() as directory:
-        course.prepareAssetManager(tar, directory)
-        course.processAllQuestions()
-        course.processAllAssignments(tar)
-        course.processSections(tar)
-        course.sortAssignmentsBySection()
-        course.preparePtxResources(directory)
-        shutil.copytree(directory, output_location, dirs_exist_ok=overwrite)
+    if options is not None:
+      course.options = options
+    conversionCache.resize(course.options.htmlCacheSize)
+    hits, misses = conversionCache.hits, conversionCache.misses
+    output = StagedOutput(
+        output_location, overwrite, course.options.incremental)
+    with output:
+      directory = output.directory
+      # Members are spooled next to the output, so that assets are linked
+      # into it rather than copied a second time
+      archive = profiler.call(
+          "stage", "readArchive", openBackup, moodle_backup, output.workDir)
+      with archive:
+        profiler.call(
+            "stage",
+            "prepareAssetManager",
+            course.prepareAssetManager,
+            archive,
+            directory)
+        profiler.call(
+            "stage", "findReferencedEntries", course.findReferencedEntries)
+        profiler.call(
+            "stage", "processAllQuestions", course.processAllQuestions)
+        if course.options.lowMemory:
+          # Assignments are only built as the writer asks for them
+          profiler.call("stage", "processSections", course.processSections)
+          profiler.call("stage", "indexAssignments", course.indexAssignments)
+          assignments = course.streamAssignments()
+        else:
+          profiler.call(
+              "stage", "processAllAssignments", course.processAllAssignments)
+          profiler.call("stage", "processSections", course.processSections)
+          profiler.call(
+              "stage",
+              "sortAssignmentsBySection",
+              course.sortAssignmentsBySection)
+          assignments = course.assignments
+        profiler.call(
+            "stage",
+            "preparePtxResources",
+            course.preparePtxResources,
+            directory,
+            assignments)
+      course.outputReport = profiler.call("stage", "publish", output.publish)
+    profiler.count("conversionCache.hits", conversionCache.hits - hits)
+    profiler.count("conversionCache.misses", conversionCache.misses - misses)
     return course
 
-  def prepareAssetManager(self, tar: TarFile, directory: str):
-    self.assetManager = AssetManager(tar, directory)
+  def prepareAssetManager(self, archive: BackupReader, directory: str):
+    images = None
+    if self.options.optimizeImages:
+      images = ImageOptimizer(self.options)
+      self.imageReport = images.report
+    self.assetManager = AssetManager(archive, directory, images)
 
-  def processAllQuestions(self):
-    questionsDoc = self.assetManager.parseXML("questions.xml")
-    self.questions = questionsDoc.getElementsByTagName("question_bank_entry")
+  def findReferencedEntries(self: Self) -> None:
+    """Collects the ids of the bank entries that some quiz uses."""
+    self.referencedEntries: set[str] = set()
+    for name in self.assetManager.archive.names(MemberRole.QUIZ):
+      self.referencedEntries.update(
+          self.assetManager.iterTexts(name, "questionbankentryid"))
 
-  def processAllAssignments(self: Self, tar: TarFile) -> None:
-    regex = r"activities/quiz_[0-9]+/quiz\.xml"
+  def processAllQuestions(self):
+    # Stream the bank, building the question of each entry that a quiz uses
+    # as soon as its element is read. The element is released right after,
+    # and the other entries are never built at all.
+    self.questions = QuestionBank(keepQuestions=not self.options.lowMemory)
+    for entry in self.assetManager.iterElements("questions.xml",
+                                                "question_bank_entry"):
+      entryId = entry.get("id")
+      if entryId in self.referencedEntries:
+        self.questions.add(entryId, entry)
 
+  def processAllAssignments(self: Self) -> None:
     self.assignments = [
         Assignment.fromFile(doc, self.questions)
-        for doc in self.assetManager.parseList(regex)
+        for doc in self.assetManager.parseList(MemberRole.QUIZ)
+    ]
+    for assignment in self.assignments:
+      self.countAssignment(assignment)
+
+  def indexAssignments(self: Self) -> None:
+    """Orders the quiz files by section, reading only their module ids."""
+    names = self.assetManager.archive.names(MemberRole.QUIZ)
+    ids = [
+        self.assetManager.readAttributes(name, "activity")["moduleid"]
+        for name in names
+    ]
+    self.quizFiles = [
+        names[index] for index in sectionOrder(ids, self.sections)
     ]
 
-  def processSections(self: Self, tar: TarFile) -> None:
-    regex = r"sections/section_[0-9]+/section\.xml"
+  def streamAssignments(self: Self) -> Iterator[Assignment]:
+    """Builds the assignments one at a time, in section order. Nothing
+    else keeps a reference to an assignment once the next one is built."""
+    for document in self.assetManager.parseEach(self.quizFiles):
+      assignment = Assignment.fromFile(document, self.questions)
+      self.countAssignment(assignment)
+      yield assignment
+      # The converted HTML and the DOMs are full of reference cycles, which
+      # would otherwise pile up until the next full collection
+      del assignment
+      gc.collect()
+
+  def countAssignment(self: Self, assignment: Assignment) -> None:
+    self.assignmentCount += 1
+    self.questionCount += len(assignment.questions)
+
+  def processSections(self: Self) -> None:
     self.sections = [
-        Section.fromFile(doc) for doc in self.assetManager.parseList(regex)
+        Section.fromFile(doc)
+        for doc in self.assetManager.parseList(MemberRole.SECTION)
     ]
     self.sections.sort(key=lambda s: s.number)
 
   def sortAssignmentsBySection(self: Self) -> None:
-    assignmentsById = {
-        assignment.id: assignment
-        for assignment in self.assignments
-    }
-
-    orderedAssignments = [
-        assignmentsById[contentId]
-        for section in self.sections
-        for contentId in section.contents
-        if contentId in assignmentsById
-    ]
-    # Add to the end any assignments not present in sections
-    for assignment in self.assignments:
-      if assignment not in orderedAssignments:
-        orderedAssignments.append(assignment)
-    self.assignments = orderedAssignments
+    order = sectionOrder(
+        [assignment.id for assignment in self.assignments], self.sections)
+    self.assignments = [self.assignments[index] for index in order]
+
+  def preparePtxResources(
+      self: Self, directory: str, assignments: Iterable[Assignment]) -> None:
+    PtxWriter(self.assetManager, self.options).process(assignments)
+
 
-  def preparePtxResources(self: Self, directory: str) -> None:
-    PtxWriter(self.assetManager).process(self.assignments)
+def sectionOrder(ids: list[str], sections: list[Section]) -> list[int]:
+  """The positions of the ids, in the order the sections list them."""
+  positions = {id: index for index, id in enumerate(ids)}
+  order = [
+      positions[contentId]
+      for section in sections
+      for contentId in section.contents
+      if contentId in positions
+  ]
+  # Add to the end any ids not present in sections
+  listed = set(order)
+  order.extend(index for index in range(len(ids)) if index not in listed)
+  return order
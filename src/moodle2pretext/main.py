@@ -1,18 +1,174 @@
 import typer
 from pathlib import Path
-from typing import Annotated
-from moodle2pretext.course import Course
-
-
-def main(
-    moodle_backup: Annotated[Path,
-                             typer.Argument(
-                                 help="The backup file exported from Moodle.",
-                                 exists=True,
-                                 dir_okay=False,
-                                 readable=True,
-                                 resolve_path=True,
-                             )],
+from typing import Annotated, TYPE_CHECKING
+
+if TYPE_CHECKING:
+  from moodle2pretext.options import ConversionOptions
+
+app = typer.Typer()
+
+# Options shared by the commands, which all turn them into the same
+# ConversionOptions
+Jobs = Annotated[
+    int,
+    typer.Option(
+        "--jobs",
+        "-j",
+        min=1,
+        help=
+        "Number of worker processes rendering the assignments of each course.")]
+ExecJobs = Annotated[
+    int | None,
+    typer.Option(
+        min=1,
+        help=
+        "Number of CodeRunner example cases each course runs at the same time, and of interpreters kept ready to run them. Defaults to the number of cores, divided among the courses converted at the same time."
+    )]
+ExecCache = Annotated[
+    bool,
+    typer.Option(
+        help="Reuse the results of CodeRunner example cases from previous runs."
+    )]
+ExecTimeout = Annotated[
+    float,
+    typer.Option(
+        min=0,
+        help="Seconds each CodeRunner example case may run for, 0 for no limit."
+    )]
+ExecCpu = Annotated[
+    int,
+    typer.Option(
+        min=0,
+        help=
+        "Seconds of CPU time each CodeRunner example case may use, 0 for no limit."
+    )]
+ExecMemory = Annotated[
+    int,
+    typer.Option(
+        min=0,
+        help=
+        "Megabytes of memory each CodeRunner example case may use, 0 for no limit."
+    )]
+ExecOutput = Annotated[
+    int,
+    typer.Option(
+        min=0,
+        help="Kilobytes each CodeRunner example case may write, 0 for no limit."
+    )]
+ExecNetwork = Annotated[
+    bool, typer.Option(help="Let CodeRunner example cases use the network.")]
+FormatFiles = Annotated[
+    bool,
+    typer.Option(
+        "--format/--no-format",
+        help=
+        "Format the generated files. Without it they are still valid XML, and the conversion is faster."
+    )]
+FormatJobs = Annotated[
+    int,
+    typer.Option(
+        min=0,
+        help=
+        "Number of worker processes formatting files while the next assignment is rendered."
+    )]
+Incremental = Annotated[
+    bool,
+    typer.Option(
+        help=
+        "Update existing projects in place, only writing the files that changed and removing generated files that are gone."
+    )]
+LowMemory = Annotated[
+    bool,
+    typer.Option(
+        help=
+        "Convert one quiz at a time and release it once written, so that memory use does not grow with the number of quizzes."
+    )]
+OptimizeImages = Annotated[
+    bool,
+    typer.Option(
+        help=
+        "Scale down and compress the PNG, JPEG and WebP images of the questions. Needs Pillow, installed with the images extra."
+    )]
+ImageMaxWidth = Annotated[
+    int,
+    typer.Option(min=1, help="Widest an optimized image may be, in pixels.")]
+ImageQuality = Annotated[
+    int,
+    typer.
+    Option(min=1, max=100, help="Quality of optimized JPEG and WebP images.")]
+ConversionCacheSize = Annotated[
+    int,
+    typer.Option(
+        min=0,
+        help=
+        "Megabytes of converted HTML fragments kept in memory for reuse, counting a byte per character, 0 to keep none. The trees of the fragments are kept too, and take several times as much."
+    )]
+ImageFormat = Annotated[
+    str | None,
+    typer.Option(
+        help=
+        "Convert optimized images to this format: png, jpeg or webp. By default each image keeps its format."
+    )]
+
+
+def conversionOptions(
+    jobs: int,
+    exec_jobs: int | None,
+    exec_cache: bool,
+    exec_timeout: float,
+    exec_cpu: int,
+    exec_memory: int,
+    exec_output: int,
+    exec_network: bool,
+    format_files: bool,
+    format_jobs: int,
+    incremental: bool,
+    low_memory: bool,
+    optimize_images: bool,
+    image_max_width: int,
+    image_quality: int,
+    image_format: str | None,
+    conversion_cache_size: int) -> "ConversionOptions":
+  """The ConversionOptions of the shared command line options."""
+  from moodle2pretext.options import ConversionOptions
+  from moodle2pretext.utils.images import IMAGE_FORMATS
+
+  if image_format is not None and image_format not in IMAGE_FORMATS:
+    raise typer.BadParameter(
+        f"expected one of: {', '.join(IMAGE_FORMATS)}",
+        param_hint="--image-format")
+  return ConversionOptions(
+      jobs=jobs,
+      execJobs=exec_jobs,
+      execCache=exec_cache,
+      execTimeout=exec_timeout or None,
+      execCpuSeconds=exec_cpu or None,
+      execMemoryBytes=exec_memory * 2**20 or None,
+      execOutputBytes=exec_output * 2**10 or None,
+      execNetwork=exec_network,
+      format=format_files,
+      formatJobs=format_jobs,
+      incremental=incremental,
+      lowMemory=low_memory,
+      optimizeImages=optimize_images,
+      imageMaxWidth=image_max_width,
+      imageQuality=image_quality,
+      imageFormat=image_format,
+      htmlCacheSize=conversion_cache_size * 2**20)
+
+
+@app.command()
+def convert(
+    moodle_backup: Annotated[
+        Path,
+        typer.Argument(
+            help=
+            "The backup file exported from Moodle, or a directory it was extracted to.",
+            exists=True,
+            dir_okay=True,
+            readable=True,
+            resolve_path=True,
+        )],
     output_location: Annotated[
         Path,
         typer.Argument(
@@ -27,16 +183,160 @@ def main(
         typer.Option(
             help=
             "If set, files in the destination will be overwritten. Otherwise (default), an error is thrown."
-        )] = False):
+        )] = False,
+    jobs: Jobs = 1,
+    exec_jobs: ExecJobs = None,
+    exec_cache: ExecCache = True,
+    exec_timeout: ExecTimeout = 20.0,
+    exec_cpu: ExecCpu = 10,
+    exec_memory: ExecMemory = 1024,
+    exec_output: ExecOutput = 1024,
+    exec_network: ExecNetwork = False,
+    format_files: FormatFiles = True,
+    format_jobs: FormatJobs = 1,
+    incremental: Incremental = False,
+    low_memory: LowMemory = False,
+    optimize_images: OptimizeImages = False,
+    image_max_width: ImageMaxWidth = 1600,
+    image_quality: ImageQuality = 85,
+    image_format: ImageFormat = None,
+    conversion_cache_size: ConversionCacheSize = 8,
+    profile: Annotated[
+        Path | None,
+        typer.Option(
+            help=
+            "Write the time and memory spent in each stage, assignment and question to this JSON file, and print a summary.",
+            dir_okay=False,
+            writable=True,
+            resolve_path=True,
+        )] = None):
   """
   Reads a Moodle backup file with path moodle_backup
   and produces a PreText project at the provided output_location
   """
-  Course.fromZip(moodle_backup, output_location, overwrite)
+  # The converter is only loaded once the arguments are known to be good
+  from moodle2pretext.course import Course
+  from moodle2pretext.utils.profiler import profiler
+
+  options = conversionOptions(
+      jobs,
+      exec_jobs,
+      exec_cache,
+      exec_timeout,
+      exec_cpu,
+      exec_memory,
+      exec_output,
+      exec_network,
+      format_files,
+      format_jobs,
+      incremental,
+      low_memory,
+      optimize_images,
+      image_max_width,
+      image_quality,
+      image_format,
+      conversion_cache_size)
+  if profile is not None:
+    profiler.start()
+  course = Course.fromZip(moodle_backup, output_location, overwrite, options)
+  if profile is not None:
+    profiler.stop()
+    profiler.write(profile)
+    print(profiler.summary())
+  if course.outputReport is not None:
+    for line in course.outputReport.lines():
+      print(line)
+    print(course.outputReport.summary())
+  if course.imageReport is not None:
+    print(course.imageReport.summary())
+
+
+@app.command()
+def batch(
+    backups: Annotated[
+        str,
+        typer.Argument(
+            help=
+            "A directory holding the .mbz backups to convert, or a glob pattern matching them."
+        )],
+    output_root: Annotated[
+        Path,
+        typer.Argument(
+            help=
+            "The directory in which to create a PreText project for each backup, named after it.",
+            file_okay=False,
+            dir_okay=True,
+            writable=True,
+            resolve_path=True,
+        )],
+    overwrite: Annotated[
+        bool,
+        typer.Option(
+            help="If set, existing projects of the courses will be overwritten."
+        )] = False,
+    course_jobs: Annotated[
+        int | None,
+        typer.Option(
+            "--course-jobs",
+            "-c",
+            min=1,
+            help=
+            "Number of courses converted at the same time. Defaults to the number of cores."
+        )] = None,
+    jobs: Jobs = 1,
+    exec_jobs: ExecJobs = None,
+    exec_cache: ExecCache = True,
+    exec_timeout: ExecTimeout = 20.0,
+    exec_cpu: ExecCpu = 10,
+    exec_memory: ExecMemory = 1024,
+    exec_output: ExecOutput = 1024,
+    exec_network: ExecNetwork = False,
+    format_files: FormatFiles = True,
+    format_jobs: FormatJobs = 1,
+    incremental: Incremental = False,
+    low_memory: LowMemory = False,
+    optimize_images: OptimizeImages = False,
+    image_max_width: ImageMaxWidth = 1600,
+    image_quality: ImageQuality = 85,
+    image_format: ImageFormat = None,
+    conversion_cache_size: ConversionCacheSize = 8):
+  """
+  Converts every Moodle backup found in backups, each into its own
+  PreText project under output_root
+  """
+  import os
+  from moodle2pretext.batch import convertAll, findBackups, formatSummary
+
+  found = findBackups(backups)
+  if not found:
+    raise typer.BadParameter(f"No backups found in {backups}")
+  options = conversionOptions(
+      jobs,
+      exec_jobs,
+      exec_cache,
+      exec_timeout,
+      exec_cpu,
+      exec_memory,
+      exec_output,
+      exec_network,
+      format_files,
+      format_jobs,
+      incremental,
+      low_memory,
+      optimize_images,
+      image_max_width,
+      image_quality,
+      image_format,
+      conversion_cache_size)
+  courseJobs = min(course_jobs or os.cpu_count() or 1, len(found))
+  results = convertAll(found, output_root, overwrite, options, courseJobs)
+  print(formatSummary(results))
+  if not all(result.succeeded for result in results):
+    raise typer.Exit(code=1)
 
 
 def run():
-  typer.run(main)
+  app()
 
 
 if __name__ == "__main__":
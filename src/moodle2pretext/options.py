@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+
+from moodle2pretext.utils.disk_cache import defaultCacheDir
+
+# Total length of the converted HTML fragments kept in memory by default
+DEFAULT_HTML_CACHE_SIZE = 8 * 1024 * 1024
+
+
+@dataclass
+class ConversionOptions:
+  """Settings that control how a Moodle backup is converted."""
+  # Number of worker processes rendering the assignment files
+  jobs: int = 1
+  # Number of CodeRunner example cases run at the same time, and of the
+  # interpreters kept ready to run them (default: one per core)
+  execJobs: int | None = None
+  # Whether to reuse the results of example cases from previous runs
+  execCache: bool = True
+  # Size limit of the example case results cache, in bytes
+  execCacheSize: int = 64 * 1024 * 1024
+  # Limits of every example case: seconds it may run for, seconds of CPU
+  # time, bytes of memory, and bytes of output (None for no limit). A case
+  # over a limit is stopped, and its result is "timeout" or "limit
+  # exceeded".
+  execTimeout: float | None = 20.0
+  execCpuSeconds: int | None = 10
+  execMemoryBytes: int | None = 1024 * 1024 * 1024
+  execOutputBytes: int | None = 1024 * 1024
+  # Whether example cases may use the network
+  execNetwork: bool = False
+  # Whether to format the generated files; without it they are still valid
+  # XML, only harder to read
+  format: bool = True
+  # Number of worker processes formatting files while the next assignment
+  # is rendered (0 formats them on the rendering process)
+  formatJobs: int = 1
+  # Whether to reuse the formatted files of previous runs
+  formatCache: bool = True
+  # Size limit of the formatted files cache, in bytes
+  formatCacheSize: int = 256 * 1024 * 1024
+  # Whether to update an existing output in place, writing only the files
+  # whose content changed and removing the ones no longer generated
+  incremental: bool = False
+  # Whether to convert one assignment at a time, releasing it once its file
+  # is written, so that peak memory does not grow with the number of quizzes
+  lowMemory: bool = False
+  # Whether to scale down and compress the images of the questions (needs
+  # Pillow, installed with the `images` extra)
+  optimizeImages: bool = False
+  # Widest an optimized image may be, in pixels
+  imageMaxWidth: int = 1600
+  # Quality of optimized JPEG and WebP images, from 1 to 100
+  imageQuality: int = 85
+  # Format optimized images are converted to: "png", "jpeg" or "webp" (None
+  # keeps the format of each image)
+  imageFormat: str | None = None
+  # Size limit of the optimized images cache, in bytes
+  imageCacheSize: int = 256 * 1024 * 1024
+  # Total length of the converted HTML fragments kept in memory for reuse,
+  # in characters. Each fragment also keeps the tree it was serialized from,
+  # which takes several times as much memory.
+  htmlCacheSize: int = DEFAULT_HTML_CACHE_SIZE
+  # Directory holding the caches that persist across runs
+  cacheDir: str = field(default_factory=defaultCacheDir)
@@ -1,4 +1,7 @@
 from xml.dom import Node
+
+from lxml import etree
+
 from moodle2pretext.question.coderunner_question import CodeRunnerQuestion
 from moodle2pretext.question.fillin import FillInQuestion
 from moodle2pretext.question.matching_question import MatchingQuestion
@@ -6,6 +9,7 @@ from moodle2pretext.question.multiplechoice import MultipleChoiceQuestion
 from moodle2pretext.question.exercisegroup_question import ExerciseGroupQuestion
 from moodle2pretext.question.question import Question
 from moodle2pretext.utils import getLast, getFirstText
+from moodle2pretext.utils.xml_stream import elementToDom, toDom
 
 
 def questionFromEntry(entry: Node) -> Question:
@@ -27,3 +31,20 @@ def questionFromEntry(entry: Node) -> Question:
       return MultipleChoiceQuestion.fromEntry(questionEntry)
     case _:
       raise RuntimeError("Unknown question type (" + qType + ")!")
+
+
+def questionFromXml(xml: bytes) -> Question:
+  """Builds the question from a serialized question_bank_entry element."""
+  return questionFromDom(toDom(xml))
+
+
+def questionFromElement(element: etree._Element) -> Question:
+  """Builds the question from a streamed question_bank_entry element."""
+  return questionFromDom(elementToDom(element))
+
+
+def questionFromDom(entry: Node) -> Question:
+  try:
+    return questionFromEntry(entry)
+  finally:
+    entry.ownerDocument.unlink()
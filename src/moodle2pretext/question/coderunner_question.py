@@ -2,7 +2,22 @@ from dataclasses import dataclass
 from typing import Self, Optional
 from xml.dom import Node
 from moodle2pretext.question.question import Question
-from moodle2pretext.utils import getFirst, getFirstText
+from moodle2pretext.utils.fields import FieldExtractor
+
+TEST_CASE_FIELDS = FieldExtractor(
+    testCode="testcode",
+    expected="expected",
+    stdInput="stdin",
+    useAsExample="useasexample",
+    display="display")
+
+CODERUNNER_FIELDS = FieldExtractor(
+    template="coderunner_option/template",
+    name="name",
+    questionText="questiontext",
+    type="coderunnertype",
+    preload="answerpreload",
+    answer="answer")
 
 
 class TestCase:
@@ -35,12 +50,13 @@ class TestCase:
 
   @staticmethod
   def fromNode(tc: Node) -> Self:
+    fields = TEST_CASE_FIELDS.extract(tc)
     return TestCase(
-        getFirstText(tc, "testcode"),
-        getFirstText(tc, "expected"),
-        getFirstText(tc, "stdin"),
-        getFirstText(tc, "useasexample") == "1",
-        getFirstText(tc, "display") == "SHOW")
+        fields["testCode"],
+        fields["expected"],
+        fields["stdInput"],
+        fields["useAsExample"] == "1",
+        fields["display"] == "SHOW")
 
 
 class CodeRunnerQuestion(Question):
@@ -76,7 +92,8 @@ class CodeRunnerQuestion(Question):
 
   @staticmethod
   def fromEntry(questionEntry: Node) -> Self:
-    template = getFirstText(questionEntry, ["coderunner_option", "template"])
+    fields = CODERUNNER_FIELDS.extract(questionEntry)
+    template = fields.pop("template")
     preamble = None
     if template != "$@NULL@$":
       index = template.find("{{ STUDENT_ANSWER }}")
@@ -84,13 +101,9 @@ class CodeRunnerQuestion(Question):
         preamble = template[0:index]
     return CodeRunnerQuestion(
         id=questionEntry.getAttribute("id"),
-        name=getFirstText(questionEntry, "name"),
-        questionText=getFirstText(questionEntry, "questiontext"),
-        type=getFirstText(questionEntry, "coderunnertype"),
-        preload=getFirstText(questionEntry, "answerpreload"),
-        answer=getFirstText(questionEntry, "answer"),
         preamble=preamble,
         testCases=[
             TestCase.fromNode(tc)
             for tc in questionEntry.getElementsByTagName("coderunner_testcase")
-        ])
+        ],
+        **fields)
@@ -2,13 +2,19 @@ from dataclasses import dataclass
 from typing import Self, TypeAlias
 from xml.dom import Node
 
-from moodle2pretext.question.question import Question
-from moodle2pretext.utils import getFirst, getFirstText
+from moodle2pretext.question.question import Question, QUESTION_FIELDS
+from moodle2pretext.utils import getFirst
+from moodle2pretext.utils.fields import FieldExtractor
 from moodle2pretext.utils.html import pretextify
 
 # either a string RegEx or (number, tolerance)
 conditionType: TypeAlias = str | tuple[float, float]
 
+ANSWER_FIELDS = FieldExtractor(
+    text="answertext", fraction="fraction", feedback="feedback")
+
+TOLERANCE_FIELDS = FieldExtractor(answer="answer", tolerance="tolerance")
+
 
 class FillInQuestion(Question):
   # Implicitly first answer is the "correct" one
@@ -33,29 +39,30 @@ class FillInQuestion(Question):
 
   @staticmethod
   def fromShortAnswerEntry(questionEntry: Node) -> Self:
+    fields = QUESTION_FIELDS.extract(questionEntry)
     return FillInQuestion(
         id=questionEntry.getAttribute("id"),
-        name=getFirstText(questionEntry, "name"),
-        questionText=getFirstText(questionEntry, "questiontext"),
-        answers=makeShortAnswers(questionEntry.getElementsByTagName("answer")))
+        answers=makeShortAnswers(questionEntry.getElementsByTagName("answer")),
+        **fields)
 
   @staticmethod
   def fromNumericalEntry(questionEntry: Node) -> Self:
+    fields = QUESTION_FIELDS.extract(questionEntry)
     return FillInQuestion(
         id=questionEntry.getAttribute("id"),
-        name=getFirstText(questionEntry, "name"),
-        questionText=getFirstText(questionEntry, "questiontext"),
         answers=makeNumericalAnswers(
             getFirst(questionEntry, "answers"),
-            getFirst(questionEntry, "numerical_records")))
+            getFirst(questionEntry, "numerical_records")),
+        **fields)
 
 
 def makeShortAnswers(answerNodes: list[Node]) -> list[tuple[str, str]]:
   triples = [
       (
-          getFirstText(node, "answertext"),
-          float(getFirstText(node, "fraction")),
-          pretextify(getFirstText(node, "feedback"))) for node in answerNodes
+          fields["text"],
+          float(fields["fraction"]),
+          pretextify(fields["feedback"]))
+      for fields in map(ANSWER_FIELDS.extract, answerNodes)
   ]
   triples.sort(key=lambda tr: tr[1], reverse=True)
   return [(text, feedback) for (text, _, feedback) in triples]
@@ -64,18 +71,21 @@ def makeShortAnswers(answerNodes: list[Node]) -> list[tuple[str, str]]:
 def makeNumericalAnswers(
     answersNode: Node,
     numericalRecords: Node) -> list[tuple[tuple[float, float], str]]:
-  answers = [
-      (
-          node.attributes["id"].value,
-          float(getFirstText(node, "answertext")),
-          float(getFirstText(node, "fraction")),
-          pretextify(getFirstText(node, "feedback")))
-      for node in answersNode.getElementsByTagName("answer")
-  ]
+  answers = []
+  for node in answersNode.getElementsByTagName("answer"):
+    fields = ANSWER_FIELDS.extract(node)
+    answers.append(
+        (
+            node.attributes["id"].value,
+            float(fields["text"]),
+            float(fields["fraction"]),
+            pretextify(fields["feedback"])))
   answers.sort(key=lambda tr: tr[2], reverse=True)
   tolerances = {
-      getFirstText(node, "answer"): float(getFirstText(node, "tolerance"))
-      for node in numericalRecords.getElementsByTagName("numerical_record")
+      fields["answer"]: float(fields["tolerance"])
+      for fields in map(
+          TOLERANCE_FIELDS.extract, numericalRecords.getElementsByTagName(
+              "numerical_record"))
   }
 
   return [
@@ -3,7 +3,17 @@ from typing import Self
 from xml.dom import Node
 
 from moodle2pretext.question.question import Question
-from moodle2pretext.utils import getFirst, getFirstText, getFirstHtml
+from moodle2pretext.utils import getFirst
+from moodle2pretext.utils.fields import FieldExtractor
+from moodle2pretext.utils.html import pretextify
+
+MULTICHOICE_FIELDS = FieldExtractor(
+    single="plugin_qtype_multichoice_question/multichoice/single",
+    name="name",
+    questionText="questiontext")
+
+CHOICE_FIELDS = FieldExtractor(
+    statement="answertext", feedback="feedback", fraction="fraction")
 
 
 @dataclass
@@ -35,22 +45,20 @@ class MultipleChoiceQuestion(Question):
             questionEntry, ["plugin_qtype_multichoice_question", "answers"]).
         getElementsByTagName("answer")
     ]
-    allowMultipleAnswers = int(
-        getFirstText(
-            questionEntry,
-            ["plugin_qtype_multichoice_question", "multichoice", "single"
-            ])) == 0
+    fields = MULTICHOICE_FIELDS.extract(questionEntry)
+    allowMultipleAnswers = int(fields["single"]) == 0
 
     return MultipleChoiceQuestion(
         id=questionEntry.getAttribute("id"),
-        name=getFirstText(questionEntry, "name"),
-        questionText=getFirstText(questionEntry, "questiontext"),
+        name=fields["name"],
+        questionText=fields["questionText"],
         choices=choices,
         allowMultipleAnswers=allowMultipleAnswers)
 
 
 def makeChoice(node: Node) -> tuple[str, bool]:
+  fields = CHOICE_FIELDS.extract(node)
   return Choice(
-      getFirstHtml(node, "answertext", int(node.getAttribute("id"))),
-      getFirstHtml(node, "feedback"),
-      float(getFirstText(node, "fraction")) > 0)
+      pretextify(fields["statement"], int(node.getAttribute("id"))),
+      pretextify(fields["feedback"]),
+      float(fields["fraction"]) > 0)
@@ -2,10 +2,10 @@ import sys
 from typing import Optional, Self
 from xml.dom import Node
 
-import bs4
+from moodle2pretext.utils.fields import FieldExtractor
+from moodle2pretext.utils.html import pretextifyWithTitle
 
-from moodle2pretext.utils import getFirstText
-from moodle2pretext.utils.html import pretextify, simplifyHTML
+QUESTION_FIELDS = FieldExtractor(name="name", questionText="questiontext")
 
 
 class Question:
@@ -25,8 +25,7 @@ class Question:
   def fromEntry(questionEntry: Node) -> Self:
     return Question(
         id=questionEntry.getAttribute("id"),
-        name=getFirstText(questionEntry, "name"),
-        questionText=getFirstText(questionEntry, "questiontext"))
+        **QUESTION_FIELDS.extract(questionEntry))
 
 
 def processQuestionText(text: str) -> tuple[str, str | None]:
@@ -34,13 +33,4 @@ def processQuestionText(text: str) -> tuple[str, str | None]:
 
   Returns a tuple of the content and the title.
   """
-  simplified = pretextify(text)
-  soup = bs4.BeautifulSoup(simplified, "html.parser")
-  titleTag = soup.find("h3")
-  if (titleTag):
-    title = titleTag.get_text()
-    titleTag.extract()
-    # Need to pretextify again to remove any empty p tags that just got
-    # created
-    return pretextify(str(soup).strip()), title
-  return simplified, None
+  return pretextifyWithTitle(text)
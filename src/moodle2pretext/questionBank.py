@@ -0,0 +1,46 @@
+from typing import Self
+
+from lxml import etree
+
+from moodle2pretext.question import Question, questionFromElement, questionFromXml
+from moodle2pretext.utils.profiler import profiler
+
+
+class QuestionBank:
+  """The question bank entries of a course, indexed by their id.
+
+  Each question is built once, from its streamed element as it is added,
+  and that same object is handed to every quiz that references the entry.
+
+  With keepQuestions unset, only the serialized entries stay in memory,
+  and questions are instead built anew every time a quiz asks for them.
+  """
+
+  def __init__(self: Self, keepQuestions: bool = True):
+    self.entries: dict[str, bytes] = {}
+    self.questions: dict[str, Question] = {}
+    self.keepQuestions = keepQuestions
+
+  def __contains__(self: Self, entryId: str) -> bool:
+    return entryId in self.entries or entryId in self.questions
+
+  def __len__(self: Self) -> int:
+    return len(self.entries) + len(self.questions)
+
+  def add(self: Self, entryId: str, entry: etree._Element) -> None:
+    if self.keepQuestions:
+      self.questions[entryId] = profiler.call(
+          "parse", entryId, questionFromElement, entry)
+      self.entries.pop(entryId, None)
+    else:
+      self.entries[entryId] = etree.tostring(entry)
+      self.questions.pop(entryId, None)
+
+  def get(self: Self, entryId: str) -> Question:
+    if entryId in self.questions:
+      return self.questions[entryId]
+    return profiler.call(
+        "parse", entryId, questionFromXml, self.entries[entryId])
+
+  def resolve(self: Self, entryIds: list[str]) -> list[Question]:
+    return [self.get(entryId) for entryId in entryIds]
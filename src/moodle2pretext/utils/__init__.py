@@ -1,12 +1,16 @@
 from xml.dom import Node
 
-from moodle2pretext.utils.html import pretextify
-
 
 def getText(node: Node) -> str:
-  if 'data' in dir(node):
-    return node.data
-  return ''.join([getText(child) for child in node.childNodes])
+  parts = []
+  stack = [node]
+  while stack:
+    current = stack.pop()
+    if hasattr(current, "data"):
+      parts.append(current.data)
+    else:
+      stack.extend(reversed(current.childNodes))
+  return ''.join(parts)
 
 
 def getFirst(node: Node, tagName: str | list[str]) -> Node:
@@ -45,6 +49,8 @@ def getFirstInt(node: Node, tagName: str | list[str]) -> str:
 
 def getFirstHtml(
     node: Node, tagName: str | list[str], itemId: int | None = None) -> str:
+  # Imported here, so that light utils modules don't load the HTML parser
+  from moodle2pretext.utils.html import pretextify
   return pretextify(getFirstText(node, tagName), itemId)
 
 
@@ -1,5 +1,7 @@
 """Module that handles preparing code blocks for CodeRunner questions"""
 
+from functools import cache
+
 from jinja2 import Environment, PackageLoader
 
 from moodle2pretext.question.coderunner_question import CodeRunnerQuestion
@@ -8,9 +10,7 @@ from moodle2pretext.question.coderunner_question import CodeRunnerQuestion
 class CodeWriter():
 
   def __init__(self) -> None:
-    self.env = Environment(loader=PackageLoader("moodle2pretext.utils"))
-    self.env.filters['indent'] = indent
-    self.env.tests['is_python_program'] = is_python_program
+    self.env = sharedEnvironment()
     self.codeRunnerPreamble = self.env.get_template(
         "codeRunner-preamble.py.jinja")
     self.codeRunnerInput = self.env.get_template("codeRunner-code.py.jinja")
@@ -31,6 +31,16 @@ class CodeWriter():
     return self.codeRunnerTests.render(question=question, testing=False)
 
 
+@cache
+def sharedEnvironment() -> Environment:
+  """The template environment, shared by all writers of this process, so
+  that templates are loaded and compiled once."""
+  env = Environment(loader=PackageLoader("moodle2pretext.utils"))
+  env.filters['indent'] = indent
+  env.tests['is_python_program'] = is_python_program
+  return env
+
+
 def indent(value, spaces: int | str = 4, includeFirstLine=False):
   if isinstance(spaces, int):
     spaces = " " * spaces
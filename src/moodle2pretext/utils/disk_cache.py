@@ -0,0 +1,116 @@
+"""Module with a persistent, size-bounded cache of bytes on disk"""
+
+from hashlib import sha256
+import os
+from os import path
+import tempfile
+import threading
+from typing import Self
+
+
+def defaultCacheDir() -> str:
+  base = os.environ.get("XDG_CACHE_HOME") or path.join(
+      path.expanduser("~"), ".cache")
+  return path.join(base, "moodle2pretext")
+
+
+def makeKey(*parts: str | bytes) -> str:
+  """Hashes the parts into a key. Each part is length-prefixed, so that
+  different splits of the same bytes give different keys."""
+  digest = sha256()
+  for part in parts:
+    if isinstance(part, str):
+      part = part.encode("utf-8")
+    digest.update(f"{len(part)}:".encode("ascii"))
+    digest.update(part)
+  return digest.hexdigest()
+
+
+class DiskCache:
+  """Values stored in files named by their key under a directory.
+
+  When the total size goes over maxBytes, the least recently used entries
+  are removed. Writes are atomic, so several processes can share a cache,
+  and several threads can share an instance.
+  """
+
+  def __init__(self: Self, directory: str, maxBytes: int):
+    self.directory = directory
+    self.maxBytes = maxBytes
+    self.size: int | None = None
+    self.lock = threading.Lock()
+
+  def __getstate__(self: Self) -> dict:
+    return {key: value for key, value in self.__dict__.items() if key != "lock"}
+
+  def __setstate__(self: Self, state: dict) -> None:
+    self.__dict__.update(state)
+    self.lock = threading.Lock()
+
+  def pathTo(self: Self, key: str) -> str:
+    return path.join(self.directory, key[:2], key)
+
+  def get(self: Self, key: str) -> bytes | None:
+    try:
+      with open(self.pathTo(key), "rb") as f:
+        value = f.read()
+      # Mark the entry as recently used
+      os.utime(self.pathTo(key))
+    except OSError:
+      return None
+    return value
+
+  def put(self: Self, key: str, value: bytes) -> None:
+    target = self.pathTo(key)
+    os.makedirs(path.dirname(target), exist_ok=True)
+    fd, tempPath = tempfile.mkstemp(dir=path.dirname(target), suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        f.write(value)
+      with self.lock:
+        size = self.currentSize()
+        try:
+          # The entry replaced no longer counts
+          size -= os.stat(target).st_size
+        except FileNotFoundError:
+          pass
+        os.replace(tempPath, target)
+        self.size = size + len(value)
+        if self.size > self.maxBytes:
+          self.evict()
+    except BaseException:
+      if path.exists(tempPath):
+        os.unlink(tempPath)
+      raise
+
+  def entries(self: Self) -> list[os.DirEntry]:
+    found = []
+    if not path.isdir(self.directory):
+      return found
+    for bucket in os.scandir(self.directory):
+      if bucket.is_dir():
+        found.extend(
+            entry for entry in os.scandir(bucket.path)
+            if entry.is_file() and not entry.name.endswith(".tmp"))
+    return found
+
+  def currentSize(self: Self) -> int:
+    if self.size is None:
+      self.size = sum(entry.stat().st_size for entry in self.entries())
+    return self.size
+
+  def evict(self: Self) -> None:
+    entries = []
+    for entry in self.entries():
+      stat = entry.stat()
+      entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    self.size = sum(size for _, size, _ in entries)
+    for _, size, entryPath in entries:
+      if self.size <= self.maxBytes:
+        break
+      try:
+        os.unlink(entryPath)
+      except OSError:
+        continue
+      self.size -= size
@@ -0,0 +1,79 @@
+"""Module that extracts many fields of a Moodle entry in one traversal.
+
+A question type declares the paths to the fields it needs once:
+
+    FIELDS = FieldExtractor(
+        name="name",
+        single="plugin_qtype_multichoice_question/multichoice/single")
+
+and `FIELDS.extract(entry)` then walks the entry a single time, filling in
+the text of every field. A path follows the same rules as `getFirstText`:
+each of its tags is the first element with that name inside the element
+found for the previous tag, and a missing tag is a
+`RuntimeError("No child tag: ...")`.
+"""
+
+from xml.dom import Node
+from typing import Self
+
+
+class FieldPath:
+  """The progress of one path during a traversal."""
+
+  def __init__(self: Self, tags: list[str]):
+    self.tags = tags
+    # Index of the next tag to find
+    self.step = 0
+    # Depth of the element found for the previous tag
+    self.anchorDepth = 0
+    self.parts: list[str] | None = None
+    self.done = False
+
+  @property
+  def missing(self: Self) -> str:
+    return self.tags[self.step]
+
+
+class FieldExtractor:
+
+  def __init__(self: Self, **paths: str | list[str]):
+    self.paths = {
+        field: path.split("/") if isinstance(path, str) else list(path)
+        for field, path in paths.items()
+    }
+
+  def extract(self: Self, node: Node) -> dict[str, str]:
+    """Returns the text of each field, by field name."""
+    progress = {field: FieldPath(tags) for field, tags in self.paths.items()}
+    # Paths still looking for a tag, and paths collecting their text
+    searching = list(progress.values())
+    collecting: list[FieldPath] = []
+    stack = [(child, 1) for child in reversed(node.childNodes)]
+    while stack and (searching or collecting):
+      current, depth = stack.pop()
+      # Leaving the subtree of an anchor ends its path, found or not
+      searching = [p for p in searching if depth > p.anchorDepth]
+      if collecting:
+        for path in collecting:
+          if depth <= path.anchorDepth:
+            path.done = True
+        collecting = [p for p in collecting if not p.done]
+      if current.nodeType == Node.ELEMENT_NODE:
+        for path in searching:
+          if path.missing == current.tagName:
+            path.step += 1
+            path.anchorDepth = depth
+            if path.step == len(path.tags):
+              path.parts = []
+              collecting.append(path)
+        searching = [p for p in searching if p.parts is None]
+      elif hasattr(current, "data"):
+        for path in collecting:
+          path.parts.append(current.data)
+      stack.extend((child, depth + 1) for child in reversed(current.childNodes))
+    fields = {}
+    for field, path in progress.items():
+      if path.parts is None:
+        raise RuntimeError("No child tag: " + path.missing)
+      fields[field] = "".join(path.parts)
+    return fields
@@ -0,0 +1,147 @@
+"""Module that formats the generated PreTeXt files before they are written.
+
+Formatting is pure Python and a large part of the time spent on each
+assignment, so it runs in worker processes while the next assignment is
+rendered. Formatted files are kept on disk, keyed on the unformatted XML,
+so that files that did not change are not formatted again.
+"""
+
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
+from multiprocessing import get_all_start_methods, get_context
+from multiprocessing.context import BaseContext
+from os import path
+from typing import Self
+
+from ptx_formatter import formatPretext
+
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.utils.disk_cache import DiskCache, makeKey
+from moodle2pretext.utils.profiler import Span, profiler
+
+# Number of files each worker process may have queued up
+PENDING_PER_JOB = 4
+
+
+@cache
+def formatterVersion() -> str:
+  try:
+    return version("ptx_formatter")
+  except PackageNotFoundError:
+    return "unknown"
+
+
+class FormatCache:
+  """Formatted files, kept on disk across conversions."""
+
+  def __init__(self: Self, cache: DiskCache):
+    self.cache = cache
+
+  def key(self: Self, xml: str) -> str:
+    return makeKey(formatterVersion(), xml)
+
+  def get(self: Self, key: str) -> str | None:
+    value = self.cache.get(key)
+    return None if value is None else value.decode("utf-8")
+
+  def put(self: Self, key: str, formatted: str) -> None:
+    self.cache.put(key, formatted.encode("utf-8"))
+
+
+def workerContext() -> BaseContext:
+  """How worker processes are started. Pools start while other threads of
+  the conversion are running, which forking does not survive safely."""
+  if "forkserver" in get_all_start_methods():
+    return get_context("forkserver")
+  return get_context("spawn")
+
+
+def formatFile(name: str,
+               xml: str,
+               profile: bool = False) -> tuple[str, list[Span]]:
+  """Worker process entry point for formatting one file.
+
+  Returns the formatted file, and the spans recorded if profile is set.
+  """
+  if profile:
+    profiler.start(traceMemory=False)
+  formatted = profiler.call("format", name, formatPretext, xml)
+  return formatted, profiler.spans if profile else []
+
+
+class Formatter:
+  """Formats files and hands each result to a callback.
+
+  With jobs set to 0, files are formatted as they are submitted. Otherwise
+  they are formatted by that many worker processes, and the callbacks run
+  in the calling thread, in submission order, during later submissions or
+  when the formatter finishes.
+  """
+
+  def __init__(self: Self, options: ConversionOptions, jobs: int):
+    self.enabled = options.format
+    self.jobs = jobs
+    self.cache = None
+    if options.format and options.formatCache:
+      self.cache = FormatCache(
+          DiskCache(
+              path.join(options.cacheDir, "format"), options.formatCacheSize))
+    self.pool: ProcessPoolExecutor | None = None
+    self.pending: deque[tuple[str, Future, Callable[[str], None]]] = deque()
+
+  def __enter__(self: Self) -> Self:
+    return self
+
+  def __exit__(self: Self, excType, excValue, traceback) -> None:
+    if excType is None:
+      self.finish()
+    elif self.pool is not None:
+      self.pool.shutdown(cancel_futures=True)
+
+  def submit(
+      self: Self, name: str, xml: str, done: Callable[[str], None]) -> None:
+    """Formats xml, named name, and calls done with the result."""
+    if not self.enabled:
+      done(xml)
+      return
+    key = self.cache.key(xml) if self.cache is not None else ""
+    formatted = self.cache.get(key) if self.cache is not None else None
+    if formatted is not None:
+      done(formatted)
+    elif self.jobs == 0:
+      done(self.store(key, profiler.call("format", name, formatPretext, xml)))
+    else:
+      if self.pool is None:
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.jobs, mp_context=workerContext())
+      self.pending.append(
+          (
+              key,
+              self.pool.submit(formatFile, name, xml, profiler.enabled),
+              done))
+      self.collect(PENDING_PER_JOB * self.jobs)
+
+  def collect(self: Self, limit: int = 0) -> None:
+    """Hands over the finished files at the front of the queue, waiting
+    for more until no more than limit are still queued."""
+    while self.pending and (len(self.pending) > limit or
+                            self.pending[0][1].done()):
+      key, future, done = self.pending.popleft()
+      formatted, spans = future.result()
+      profiler.merge(spans)
+      done(self.store(key, formatted))
+
+  def store(self: Self, key: str, formatted: str) -> str:
+    if self.cache is not None:
+      self.cache.put(key, formatted)
+    return formatted
+
+  def finish(self: Self) -> None:
+    """Waits for every file submitted, and stops the worker processes."""
+    self.collect()
+    if self.pool is not None:
+      self.pool.shutdown()
+      self.pool = None
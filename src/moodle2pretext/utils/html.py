@@ -1,23 +1,100 @@
+import copy
 from xml.dom import Node
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, PageElement
 
-from ptx_formatter import formatPretext
+from moodle2pretext.options import DEFAULT_HTML_CACHE_SIZE
+from moodle2pretext.utils.lru_cache import LruCache
+from moodle2pretext.utils.profiler import profiler
 
 
-def simplifyHTML(html: str) -> str:
+class PretextFragment(str):
+  """The result of converting a Moodle HTML fragment.
+
+  It is the serialized PreTeXt, and also carries the tree it was
+  serialized from, so that the output writer can splice in copies of the
+  nodes instead of parsing the string again. Fragments are shared through
+  the conversion cache, so the tree itself is never handed out.
+  """
+
+  def __new__(cls, soup: BeautifulSoup):
+    fragment = super().__new__(cls, str(soup))
+    fragment._soup = soup
+    return fragment
+
+  def __reduce__(self):
+    # Trees don't travel well between processes, the string does
+    return (parseFragment, (str(self),))
+
+  def copyNodes(self) -> list[PageElement]:
+    return [copy.copy(node) for node in self._soup.contents]
+
+
+def fragmentLength(converted: PretextFragment | tuple) -> int:
+  """The size of a converted fragment in the conversion cache: its length,
+  which its tree grows with."""
+  fragment = converted[0] if isinstance(converted, tuple) else converted
+  return max(len(fragment), 1)
+
+
+# Converted fragments, keyed on the conversion and its arguments, up to a
+# total length
+conversionCache: LruCache = LruCache(DEFAULT_HTML_CACHE_SIZE, fragmentLength)
+
+
+def parseFragment(pretext: str) -> PretextFragment:
+  """Rebuilds a fragment from PreTeXt that was already converted."""
+  return PretextFragment(BeautifulSoup(pretext, 'html.parser'))
+
+
+def simplifyHTML(html: str) -> PretextFragment:
+  return conversionCache.lookup(
+      ("simplify", html, None),
+      lambda: profiler.call("html", "simplifyHTML", convertSimplified, html))
+
+
+def pretextify(html: str, contextId: int | None = None) -> PretextFragment:
+  return conversionCache.lookup(
+      ("pretextify", html, contextId), lambda: profiler.call(
+          "html", "pretextify", convertPretext, html, contextId))
+
+
+def pretextifyWithTitle(html: str) -> tuple[PretextFragment, str | None]:
+  """Converts the fragment and extracts its first h3 tag as a title."""
+  return conversionCache.lookup(
+      ("title", html, None), lambda: profiler.call(
+          "html", "pretextifyWithTitle", convertPretextWithTitle, html))
+
+
+def convertSimplified(html: str) -> PretextFragment:
   simplifier = HtmlSimplifier(html)
   simplifier.simplify()
   # simplifier.printTopLevels()
-  return str(simplifier)
+  return PretextFragment(simplifier.soup)
 
 
-def pretextify(html: str, contextId: int | None = None) -> str:
+def convertPretext(html: str, contextId: int | None) -> PretextFragment:
   simplifier = HtmlSimplifier(html)
   simplifier.simplify()
   simplifier.pretextify()
   if contextId is not None:
     simplifier.addIdToImages(contextId)
-  return str(simplifier)
+  return PretextFragment(simplifier.soup)
+
+
+def convertPretextWithTitle(html: str) -> tuple[PretextFragment, str | None]:
+  # Everything happens on the one tree the fragment is parsed into
+  simplifier = HtmlSimplifier(html)
+  simplifier.simplify()
+  simplifier.pretextify()
+  titleTag = simplifier.soup.find("h3")
+  if titleTag is None:
+    return PretextFragment(simplifier.soup), None
+  title = titleTag.get_text()
+  titleTag.extract()
+  # Need to process again to remove any empty p tags that just got created
+  simplifier.simplify()
+  simplifier.pretextify()
+  return PretextFragment(simplifier.soup), title
 
 
 class HtmlSimplifier:
@@ -143,7 +220,10 @@ class HtmlSimplifier:
 
   def putStringContentInNewTag(self, tag: Node, newName: str) -> Node:
     newTag = self.soup.new_tag(newName)
-    newTag.string = tag.get_text()
+    text = tag.get_text()
+    # Leave empty tags childless, as they would be when parsed
+    if text != "":
+      newTag.string = text
     tag.replace_with(newTag)
     return newTag
 
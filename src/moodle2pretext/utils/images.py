@@ -0,0 +1,205 @@
+"""Module that shrinks the images of a course before they are written.
+
+Moodle images are often screenshots thousands of pixels wide, shown at a
+fraction of that. With `optimizeImages` set, every PNG, JPEG or WebP image
+wider than `imageMaxWidth` is scaled down, and each one is compressed
+again, converted to `imageFormat` if that is set. A converted image gets
+the extension of its format added to its name, so `pic.png` becomes
+`pic.png.webp`. An image that would not get any smaller is written as it
+is, under its own name, and so is an image Pillow cannot read. Animated
+images keep their animation only when they are not converted.
+
+Optimized images are kept on disk, keyed on the content hash of the
+original and the settings, so later runs skip the images that did not
+change. Pillow is only needed when images are optimized, and is installed
+with the `images` extra.
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import cache
+from io import BytesIO
+from os import path
+from typing import BinaryIO, Self
+
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.utils.disk_cache import DiskCache, makeKey
+
+# Pillow format of each mime type that can be optimized
+IMAGE_TYPES = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP"}
+# Formats images can be converted to, and the extension of each
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+# Stored in the cache for images that are better left as they are
+KEEP_ORIGINAL = b""
+
+
+@cache
+def loadPillow():
+  try:
+    from PIL import Image, ImageOps
+  except ImportError:
+    raise RuntimeError(
+        "Optimizing images needs Pillow: pip install 'moodle2pretext[images]'"
+    ) from None
+  return Image, ImageOps
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+  maxWidth: int = 1600
+  quality: int = 85
+  # One of IMAGE_FORMATS, or None to keep the format of each image
+  format: str | None = None
+
+  def __post_init__(self: Self):
+    if self.format is not None and self.format not in IMAGE_FORMATS:
+      raise ValueError(
+          f"Unknown image format {self.format}, "
+          f"expected one of: {', '.join(IMAGE_FORMATS)}")
+
+  @staticmethod
+  def fromOptions(options: ConversionOptions) -> Self:
+    return ImageSettings(
+        options.imageMaxWidth, options.imageQuality, options.imageFormat)
+
+  def targetFormat(self: Self, mimeType: str) -> str:
+    return IMAGE_TYPES[mimeType] if self.format is None else self.format.upper()
+
+  def rename(self: Self, fileName: str) -> str:
+    """The name of a file after it is converted. The original extension is
+    kept, so that files differing only in it do not get the same name."""
+    if self.format is None:
+      return fileName
+    return fileName + IMAGE_FORMATS[self.format]
+
+
+@dataclass
+class ImageReport:
+  # Size of each image before and after optimizing, by content hash
+  images: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+  def add(self: Self, contentHash: str, original: int, written: int) -> None:
+    self.images[contentHash] = (original, written)
+
+  def merge(self: Self, other: Self) -> None:
+    """Adds the images of a report from another process. Images written by
+    both are only counted once."""
+    self.images.update(other.images)
+
+  @property
+  def originalBytes(self: Self) -> int:
+    return sum(original for original, _ in self.images.values())
+
+  @property
+  def writtenBytes(self: Self) -> int:
+    return sum(written for _, written in self.images.values())
+
+  @property
+  def savedBytes(self: Self) -> int:
+    return self.originalBytes - self.writtenBytes
+
+  def summary(self: Self) -> str:
+    return (
+        f"{len(self.images)} images: "
+        f"{self.originalBytes / 2**20:.1f} MB reduced to "
+        f"{self.writtenBytes / 2**20:.1f} MB, "
+        f"{self.savedBytes / 2**20:.1f} MB saved")
+
+
+def optimizeImage(
+    source: BinaryIO, mimeType: str, settings: ImageSettings) -> bytes:
+  """The image in source, scaled down and compressed again. Animated
+  images that keep their format are returned as they are."""
+  Image, ImageOps = loadPillow()
+  with Image.open(source) as image:
+    if getattr(image, "is_animated", False) and settings.format is None:
+      source.seek(0)
+      return source.read()
+    # Saving drops the EXIF orientation, so it is applied to the pixels
+    image = ImageOps.exif_transpose(image)
+    if image.width > settings.maxWidth:
+      height = max(1, round(image.height * settings.maxWidth / image.width))
+      image = image.resize(
+          (settings.maxWidth, height), Image.Resampling.LANCZOS)
+    targetFormat = settings.targetFormat(mimeType)
+    if targetFormat == "JPEG" and image.mode not in ("RGB", "L"):
+      image = image.convert("RGB")
+    saveOptions = {
+        "PNG": {
+            "optimize": True
+        },
+        "JPEG":
+            {
+                "quality": settings.quality,
+                "optimize": True,
+                "progressive": True
+            },
+        "WEBP": {
+            "quality": settings.quality, "method": 6
+        },
+    }[targetFormat]
+    out = BytesIO()
+    image.save(out, targetFormat, **saveOptions)
+    return out.getvalue()
+
+
+class ImageOptimizer:
+  """Optimizes images, reusing the results of previous runs."""
+
+  def __init__(self: Self, options: ConversionOptions):
+    self.settings = ImageSettings.fromOptions(options)
+    # Fail before the conversion starts if Pillow is missing
+    Image, _ = loadPillow()
+    self.version = Image.__version__
+    self.cache = DiskCache(
+        path.join(options.cacheDir, "images"), options.imageCacheSize)
+    self.report = ImageReport()
+
+  def __getstate__(self: Self) -> dict:
+    # Worker processes report the images they write separately
+    return {**self.__dict__, "report": ImageReport()}
+
+  def accepts(self: Self, mimeType: str) -> bool:
+    return mimeType in IMAGE_TYPES
+
+  @property
+  def converts(self: Self) -> bool:
+    return self.settings.format is not None
+
+  def rename(self: Self, fileName: str) -> str:
+    return self.settings.rename(fileName)
+
+  def optimize(
+      self: Self,
+      contentHash: str,
+      mimeType: str,
+      size: int,
+      openSource: Callable[[], BinaryIO]) -> bytes | None:
+    """The optimized contents of the image with the content hash, or None
+    if the original is better kept. The original is only opened, with
+    openSource, when the cache does not have the result.
+
+    Records the image in the report.
+    """
+    key = makeKey(
+        self.version,
+        contentHash,
+        str(self.settings.maxWidth),
+        str(self.settings.quality),
+        self.settings.format or "")
+    optimized = self.cache.get(key)
+    if optimized is None:
+      try:
+        with openSource() as source:
+          optimized = optimizeImage(source, mimeType, self.settings)
+      except Exception:
+        # Images Pillow cannot read are written as they are
+        optimized = KEEP_ORIGINAL
+      if len(optimized) >= size:
+        optimized = KEEP_ORIGINAL
+      self.cache.put(key, optimized)
+    if optimized == KEEP_ORIGINAL:
+      self.report.add(contentHash, size, size)
+      return None
+    self.report.add(contentHash, size, len(optimized))
+    return optimized
@@ -0,0 +1,297 @@
+"""Module that keeps a pool of warm Python interpreters for running code.
+
+Starting a new python3 process for every test case costs far more than
+the test case itself. Instead, each worker of the pool is a long lived
+interpreter that has already paid its startup cost. For every case, the
+worker forks a child that sets up its stdin, working directory and output
+capture, runs the code and exits. Cases therefore never share any state,
+and each one starts from the same warm worker. A child that runs for
+longer than its timeout is killed, along with its own children.
+"""
+
+from dataclasses import dataclass
+import json
+import os
+import subprocess
+import threading
+from typing import Self
+
+from moodle2pretext.utils.sandbox import SANDBOX_SOURCE, ExecutionPolicy
+
+PYTHON = "python3"
+
+# Source of the worker interpreters. Requests and responses are exchanged
+# as one JSON object per line over the worker's stdin and stdout.
+WORKER_SOURCE = SANDBOX_SOURCE + r'''
+import atexit, json, os, select, signal, sys, tempfile, time, traceback, types
+# Modules that test code commonly uses, imported once per worker
+import collections, functools, itertools, math, random, re, string
+
+
+def runChild(job, paths):
+  status = 1
+  # Exit handlers belong to the worker, the child must not run them
+  atexit._clear()
+  try:
+    for fd, (filename, flags) in enumerate(paths):
+      opened = os.open(filename, flags)
+      os.dup2(opened, fd)
+      os.close(opened)
+    os.chdir(job["cwd"])
+    if job["policy"] is not None:
+      enterSandbox(job["policy"])
+    sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", closefd=False)
+    sys.argv = ["-c"]
+    main = types.ModuleType("__main__")
+    sys.modules["__main__"] = main
+    try:
+      exec(compile(job["code"], "<string>", "exec"), main.__dict__)
+      status = 0
+    except SystemExit as exit:
+      if exit.code is None or isinstance(exit.code, int):
+        status = exit.code or 0
+      else:
+        print(exit.code, file=sys.stderr)
+    except BaseException:
+      traceback.print_exc()
+    atexit._run_exitfuncs()
+  except BaseException:
+    traceback.print_exc()
+  finally:
+    try:
+      sys.stdout.flush()
+      sys.stderr.flush()
+    finally:
+      os._exit(status)
+
+
+def runJob(job, channels):
+  with tempfile.TemporaryDirectory() as ioDir:
+    stdinPath, stdoutPath, stderrPath = [
+        os.path.join(ioDir, name) for name in ("stdin", "stdout", "stderr")
+    ]
+    for filename, contents in [(stdinPath, job["stdin"]), (stdoutPath, ""),
+                               (stderrPath, "")]:
+      with open(filename, "w", encoding="utf-8") as f:
+        f.write(contents)
+    paths = [
+        (stdinPath, os.O_RDONLY),
+        (stdoutPath, os.O_WRONLY),
+        (stderrPath, os.O_WRONLY),
+    ]
+    pid = os.fork()
+    if pid == 0:
+      for channel in channels:
+        os.close(channel.fileno())
+      runChild(job, paths)
+    waitStatus, timedOut = waitFor(pid, job["timeout"])
+    outputs = []
+    for filename in (stdoutPath, stderrPath):
+      with open(filename, "r", encoding="utf-8", errors="replace") as f:
+        outputs.append(f.read())
+  return {
+      "returncode": os.waitstatus_to_exitcode(waitStatus),
+      "stdout": outputs[0],
+      "stderr": outputs[1],
+      "timedOut": timedOut,
+  }
+
+
+def waitFor(pid, timeout):
+  """Waits for a child, killing it and its group after timeout seconds.
+  Returns its wait status, and whether it was killed."""
+  if timeout is None:
+    return os.waitpid(pid, 0)[1], False
+  if hasattr(os, "pidfd_open"):
+    # Becomes readable when the child exits
+    pidfd = os.pidfd_open(pid)
+    try:
+      exited, _, _ = select.select([pidfd], [], [], timeout)
+    finally:
+      os.close(pidfd)
+    if exited:
+      return os.waitpid(pid, 0)[1], False
+    return killChild(pid), True
+  deadline = time.monotonic() + timeout
+  delay = 0.001
+  while True:
+    done, waitStatus = os.waitpid(pid, os.WNOHANG)
+    if done:
+      return waitStatus, False
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      break
+    time.sleep(min(delay, remaining))
+    delay = min(2 * delay, 0.05)
+  return killChild(pid), True
+
+
+def killChild(pid):
+  try:
+    os.killpg(pid, signal.SIGKILL)
+  except ProcessLookupError:
+    # The child has not made its group yet
+    os.kill(pid, signal.SIGKILL)
+  return os.waitpid(pid, 0)[1]
+
+
+def serve():
+  requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+  responses = os.fdopen(os.dup(1), "w", encoding="utf-8")
+  devnull = os.open(os.devnull, os.O_RDWR)
+  os.dup2(devnull, 0)
+  os.dup2(devnull, 1)
+  for line in requests:
+    response = runJob(json.loads(line), (requests, responses))
+    responses.write(json.dumps(response) + "\n")
+    responses.flush()
+
+
+serve()
+'''
+
+
+@dataclass
+class CompletedRun:
+  returncode: int
+  stdout: str
+  stderr: str
+  # Whether the run was killed for going over its timeout
+  timedOut: bool = False
+
+
+class WorkerDied(RuntimeError):
+  pass
+
+
+class Worker:
+  """A warm interpreter that forks a fresh child for every job."""
+
+  def __init__(self: Self):
+    self.process = subprocess.Popen(
+        [PYTHON, "-c", WORKER_SOURCE],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8")
+    self.jobsRun = 0
+
+  def run(
+      self: Self,
+      code: str,
+      stdin: str,
+      cwd: str,
+      policy: ExecutionPolicy | None = None) -> CompletedRun:
+    job = {
+        "code": code,
+        "stdin": stdin,
+        "cwd": cwd,
+        "policy": policy.toDict() if policy is not None else None,
+        "timeout": policy.timeout if policy is not None else None,
+    }
+    try:
+      self.process.stdin.write(json.dumps(job) + "\n")
+      self.process.stdin.flush()
+      line = self.process.stdout.readline()
+    except (BrokenPipeError, OSError) as error:
+      raise WorkerDied("Interpreter worker died") from error
+    if line == "":
+      raise WorkerDied("Interpreter worker died")
+    self.jobsRun += 1
+    return CompletedRun(**json.loads(line))
+
+  def close(self: Self) -> None:
+    for stream in (self.process.stdin, self.process.stdout):
+      try:
+        stream.close()
+      except OSError:
+        pass
+    try:
+      self.process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+      self.process.kill()
+      self.process.wait()
+
+
+class InterpreterPool:
+  """A pool of at most `size` warm interpreter workers.
+
+  Workers are started on demand and replaced after `maxJobsPerWorker`
+  jobs. The pool can be shared by several threads.
+  """
+
+  def __init__(self: Self, size: int | None = None, maxJobsPerWorker=500):
+    self.size = size or os.cpu_count() or 1
+    self.maxJobsPerWorker = maxJobsPerWorker
+    self.idle: list[Worker] = []
+    self.started = 0
+    self.closed = False
+    self.available = threading.Condition()
+    # A forked copy of the pool must not talk to its parent's workers
+    self.pid = os.getpid()
+
+  def run(
+      self: Self,
+      code: str,
+      stdin: str,
+      cwd: str,
+      policy: ExecutionPolicy | None = None) -> CompletedRun:
+    """Runs code in a fresh child, under the limits of policy if given."""
+    # A worker that died is replaced, and the job retried once
+    for attempt in range(2):
+      worker = self.acquire()
+      try:
+        result = worker.run(code, stdin, cwd, policy)
+      except WorkerDied:
+        self.discard(worker)
+        if attempt > 0:
+          raise
+        continue
+      except BaseException:
+        self.discard(worker)
+        raise
+      self.release(worker)
+      return result
+
+  def acquire(self: Self) -> Worker:
+    with self.available:
+      while not self.idle and self.started >= self.size and not self.closed:
+        self.available.wait()
+      if self.closed:
+        raise RuntimeError("The interpreter pool has been closed")
+      if self.idle:
+        return self.idle.pop()
+      self.started += 1
+    try:
+      return Worker()
+    except BaseException:
+      self.forget()
+      raise
+
+  def release(self: Self, worker: Worker) -> None:
+    if worker.jobsRun < self.maxJobsPerWorker:
+      with self.available:
+        if not self.closed:
+          self.idle.append(worker)
+          self.available.notify()
+          return
+    self.discard(worker)
+
+  def discard(self: Self, worker: Worker) -> None:
+    worker.close()
+    self.forget()
+
+  def forget(self: Self) -> None:
+    with self.available:
+      self.started -= 1
+      self.available.notify()
+
+  def close(self: Self) -> None:
+    with self.available:
+      self.closed = True
+      workers, self.idle = self.idle, []
+      self.available.notify_all()
+    for worker in workers:
+      worker.close()
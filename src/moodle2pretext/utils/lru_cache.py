@@ -0,0 +1,69 @@
+"""Module with a bounded, least recently used in-memory cache"""
+
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+import threading
+from typing import Generic, Self, TypeVar
+
+T = TypeVar("T")
+
+
+class LruCache(Generic[T]):
+  """Keeps values up to a total size of maxSize, dropping the least
+  recently used first.
+
+  The size of each value is given by sizeOf, and is 1 by default, so that
+  maxSize is a number of values. Counts the hits and misses of lookups.
+  The cached values are shared by everyone looking up the same key, so
+  they should be immutable.
+  """
+
+  def __init__(
+      self: Self, maxSize: int, sizeOf: Callable[[T], int] | None = None):
+    self.maxSize = maxSize
+    self.sizeOf = sizeOf
+    self.values: OrderedDict[Hashable, T] = OrderedDict()
+    self.sizes: dict[Hashable, int] = {}
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  def __len__(self: Self) -> int:
+    return len(self.values)
+
+  def lookup(self: Self, key: Hashable, compute: Callable[[], T]) -> T:
+    """Returns the value for the key, computing and storing it if needed."""
+    with self.lock:
+      if key in self.values:
+        self.hits += 1
+        self.values.move_to_end(key)
+        return self.values[key]
+      self.misses += 1
+    value = compute()
+    size = 1 if self.sizeOf is None else self.sizeOf(value)
+    with self.lock:
+      if 0 < self.maxSize and size <= self.maxSize and key not in self.values:
+        self.values[key] = value
+        self.sizes[key] = size
+        self.size += size
+        self.shrink()
+    return value
+
+  def resize(self: Self, maxSize: int) -> None:
+    with self.lock:
+      self.maxSize = maxSize
+      self.shrink()
+
+  def clear(self: Self) -> None:
+    with self.lock:
+      self.values.clear()
+      self.sizes.clear()
+      self.size = 0
+      self.hits = 0
+      self.misses = 0
+
+  def shrink(self: Self) -> None:
+    while self.size > max(self.maxSize, 0):
+      key, _ = self.values.popitem(last=False)
+      self.size -= self.sizes.pop(key)
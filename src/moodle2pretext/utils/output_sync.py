@@ -0,0 +1,264 @@
+"""Module that builds the output next to its destination and publishes it.
+
+The project is written into a staging directory on the same filesystem as
+the output location, and then swapped in with a single rename, so readers
+never see a half written project and no file is copied a second time.
+
+Files of a previous output that the conversion does not produce are kept,
+by linking them into the staging directory, and so are its empty
+directories and symbolic links. Files the conversion writes where the
+previous output has a link are moved through the link, as copying over
+the previous output would. In incremental mode, files whose content is
+already in place are linked from the previous output too, so that they
+keep their modification times and incremental builds downstream can skip
+them.
+
+When output_location is itself a link, the directory it points to is
+replaced, and the link is left alone.
+"""
+
+import ctypes
+from dataclasses import dataclass, field
+from hashlib import sha256
+import os
+from os import path
+import shutil
+import tempfile
+from typing import Self
+
+from moodle2pretext.assetManager import linkOrCopy
+
+# Directories of the output that are generated entirely by the conversion.
+# In incremental mode, files in them that the conversion no longer
+# produces are removed.
+MANAGED_DIRS = ("source", "assets")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+@dataclass
+class SyncReport:
+  added: list[str] = field(default_factory=list)
+  changed: list[str] = field(default_factory=list)
+  removed: list[str] = field(default_factory=list)
+  unchanged: list[str] = field(default_factory=list)
+
+  def summary(self: Self) -> str:
+    return (
+        f"{len(self.added)} added, {len(self.changed)} changed, "
+        f"{len(self.removed)} removed, {len(self.unchanged)} unchanged")
+
+  def lines(self: Self) -> list[str]:
+    return [
+        f"{mark} {filename}" for mark, filenames in
+        [("A", self.added), ("M", self.changed), ("D", self.removed)]
+        for filename in filenames
+    ]
+
+
+class StagedOutput:
+  """A staging directory that replaces output_location when published.
+
+  Used as a context manager: the staging directory is removed if the
+  conversion fails before publishing it.
+  """
+
+  def __init__(
+      self: Self,
+      outputLocation: str,
+      overwrite: bool = False,
+      incremental: bool = False,
+      managedDirs: tuple[str, ...] = MANAGED_DIRS):
+    self.requestedLocation = path.abspath(outputLocation)
+    self.outputLocation = path.realpath(outputLocation)
+    self.overwrite = overwrite or incremental
+    self.incremental = incremental
+    self.managedDirs = managedDirs
+    self.directory: str | None = None
+    # Scratch space on the file system of the output, so that files put
+    # there can be linked into the project instead of copied
+    self.workDir: str | None = None
+
+  def __enter__(self: Self) -> Self:
+    if path.lexists(self.requestedLocation) and not self.overwrite:
+      raise FileExistsError(f"Output already exists: {self.requestedLocation}")
+    parent, name = path.split(self.outputLocation)
+    os.makedirs(parent, exist_ok=True)
+    self.directory = tempfile.mkdtemp(dir=parent, prefix=f".{name}.staging-")
+    self.workDir = tempfile.mkdtemp(dir=parent, prefix=f".{name}.work-")
+    # mkdtemp makes the directory private, the project should not be
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(self.directory, 0o777 & ~umask)
+    return self
+
+  def __exit__(self: Self, excType, excValue, traceback) -> None:
+    for directory in (self.directory, self.workDir):
+      if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+    self.directory = None
+    self.workDir = None
+
+  def publish(self: Self) -> SyncReport | None:
+    """Moves the staged project to the output location.
+
+    Returns what changed compared to the previous output, in incremental
+    mode.
+    """
+    staging = self.directory
+    report = SyncReport() if self.incremental else None
+    if not path.isdir(self.outputLocation):
+      if report is not None:
+        report.added.extend(listFiles(staging))
+      os.rename(staging, self.outputLocation)
+      self.directory = None
+      return report
+    self.carryOver(self.outputLocation, report)
+    shutil.copymode(self.outputLocation, staging)
+    exchange(staging, self.outputLocation)
+    # The staging path now holds the previous output, removed on exit
+    return report
+
+  def carryOver(self: Self, previous: str, report: SyncReport | None) -> None:
+    staging = self.directory
+    self.keepLinks(previous, report)
+    generated = set(listFiles(staging))
+    previousFiles, _, emptyDirs = listEntries(previous)
+    for filename in previousFiles:
+      previousFile = path.join(previous, filename)
+      stagedFile = path.join(staging, filename)
+      if filename not in generated:
+        if report is not None and self.isManaged(filename):
+          report.removed.append(filename)
+          continue
+        linkInto(previousFile, stagedFile)
+      elif report is not None:
+        if sameContent(stagedFile, previousFile):
+          report.unchanged.append(filename)
+          linkInto(previousFile, stagedFile)
+        else:
+          report.changed.append(filename)
+    for directory in emptyDirs:
+      if report is None or not self.isManaged(directory):
+        os.makedirs(path.join(staging, directory), exist_ok=True)
+    if report is not None:
+      known = set(report.changed) | set(report.unchanged)
+      report.added.extend(
+          filename for filename in sorted(generated) if filename not in known)
+
+  def keepLinks(self: Self, previous: str, report: SyncReport | None) -> None:
+    """Recreates the links of the previous output in the staging directory,
+    moving what the conversion wrote in their place through them."""
+    staging = self.directory
+    for name in listEntries(previous)[1]:
+      link = path.join(previous, name)
+      staged = path.join(staging, name)
+      if path.lexists(staged):
+        if not path.exists(link) or path.isdir(link) != path.isdir(staged):
+          # What the conversion wrote replaces the link
+          continue
+        writeThrough(staged, path.realpath(link), name, report)
+        if path.isdir(staged):
+          shutil.rmtree(staged)
+        else:
+          os.unlink(staged)
+      os.makedirs(path.dirname(staged), exist_ok=True)
+      os.symlink(os.readlink(link), staged)
+
+  def isManaged(self: Self, filename: str) -> bool:
+    return filename.split(os.sep, 1)[0] in self.managedDirs
+
+
+def exchange(first: str, second: str) -> None:
+  """Atomically swaps two paths, where the platform allows it."""
+  try:
+    renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+  except (AttributeError, OSError):
+    renameat2 = None
+  if renameat2 is not None:
+    result = renameat2(
+        AT_FDCWD,
+        os.fsencode(first),
+        AT_FDCWD,
+        os.fsencode(second),
+        RENAME_EXCHANGE)
+    if result == 0:
+      return
+  # Without an exchange, second is briefly missing between the renames
+  parent, name = path.split(second)
+  aside = tempfile.mkdtemp(dir=parent, prefix=f".{name}.old-")
+  os.rename(second, path.join(aside, name))
+  os.rename(first, second)
+  os.rename(path.join(aside, name), first)
+  os.rmdir(aside)
+
+
+def writeThrough(
+    staged: str, target: str, name: str, report: SyncReport | None) -> None:
+  """Moves the staged file, or the files of the staged directory, to
+  target, where a link of the previous output points."""
+  if path.isdir(staged):
+    moves = [
+        (
+            path.join(staged, filename),
+            path.join(target, filename),
+            path.join(name, filename)) for filename in listFiles(staged)
+    ]
+  else:
+    moves = [(staged, target, name)]
+  for source, destination, filename in moves:
+    if report is not None:
+      if not path.exists(destination):
+        report.added.append(filename)
+      elif sameContent(source, destination):
+        report.unchanged.append(filename)
+        continue
+      else:
+        report.changed.append(filename)
+    os.makedirs(path.dirname(destination), exist_ok=True)
+    shutil.move(source, destination)
+
+
+def linkInto(source: str, target: str) -> None:
+  os.makedirs(path.dirname(target), exist_ok=True)
+  if path.lexists(target):
+    os.unlink(target)
+  linkOrCopy(source, target)
+
+
+def fileHash(filename: str) -> bytes:
+  digest = sha256()
+  with open(filename, "rb") as f:
+    while chunk := f.read(HASH_CHUNK_SIZE):
+      digest.update(chunk)
+  return digest.digest()
+
+
+def sameContent(first: str, second: str) -> bool:
+  if os.stat(first).st_size != os.stat(second).st_size:
+    return False
+  return fileHash(first) == fileHash(second)
+
+
+def listEntries(directory: str) -> tuple[list[str], list[str], list[str]]:
+  """The paths of the files, the links and the empty directories under
+  directory, relative to it. Links to directories are not followed."""
+  files, links, emptyDirs = [], [], []
+  for root, dirs, filenames in os.walk(directory):
+    dirs.sort()
+    if root != directory and not dirs and not filenames:
+      emptyDirs.append(path.relpath(root, directory))
+    linkedDirs = [name for name in dirs if path.islink(path.join(root, name))]
+    for name in sorted(filenames + linkedDirs):
+      entry = path.join(root, name)
+      found = links if path.islink(entry) else files
+      found.append(path.relpath(entry, directory))
+  return files, links, emptyDirs
+
+
+def listFiles(directory: str) -> list[str]:
+  """The paths of all the files under directory, relative to it."""
+  return listEntries(directory)[0]
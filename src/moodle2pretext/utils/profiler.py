@@ -0,0 +1,209 @@
+"""Module that records where a conversion spends its time and memory.
+
+Code marks the work it does with spans:
+
+    with profiler.span("stage", "processAllQuestions"):
+      ...
+
+Each span records its wall time, CPU time and, when memory is traced, the
+peak of the memory allocated while it was open (from tracemalloc). Code
+can also add to named counters, such as the hits of a cache. The profiler
+is disabled by default, and spans and counters then cost a single check.
+"""
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import threading
+import time
+import tracemalloc
+from typing import Iterator, Self
+
+# Categories whose spans are ranked individually in the summary
+RANKED_CATEGORIES = ("question", "assignment")
+
+
+@dataclass
+class Span:
+  category: str
+  name: str
+  # Number of spans this one is nested in
+  depth: int
+  wall: float
+  cpu: float
+  # Peak of the memory allocated while the span was open, in bytes
+  peakMemory: int | None
+
+
+@dataclass
+class OpenSpan:
+  startMemory: int
+  # Highest absolute peak of the spans nested in this one
+  childPeak: int = 0
+
+
+class Profiler:
+
+  def __init__(self: Self):
+    self.enabled = False
+    self.traceMemory = False
+    self.spans: list[Span] = []
+    self.stack: list[OpenSpan] = []
+    self.counters: dict[str, int] = {}
+    self.lock = threading.Lock()
+    self.mainThread = threading.main_thread()
+
+  def start(self: Self, traceMemory: bool = True) -> None:
+    """Enables the profiler, discarding any spans recorded before."""
+    self.enabled = True
+    self.traceMemory = traceMemory
+    self.spans = []
+    self.stack = []
+    self.counters = {}
+    self.mainThread = threading.current_thread()
+    if traceMemory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  def stop(self: Self) -> None:
+    self.enabled = False
+    if self.traceMemory and tracemalloc.is_tracing():
+      tracemalloc.stop()
+
+  @contextmanager
+  def span(self: Self, category: str, name: str) -> Iterator[None]:
+    if not self.enabled:
+      yield
+      return
+    # Spans of other threads overlap with the ones of the main thread, so
+    # they only record their own time and never memory
+    if threading.current_thread() is not self.mainThread:
+      yield from self.threadSpan(category, name)
+      return
+    depth = len(self.stack)
+    self.openSpan()
+    start = time.perf_counter()
+    startCpu = time.process_time()
+    try:
+      yield
+    finally:
+      wall = time.perf_counter() - start
+      cpu = time.process_time() - startCpu
+      peakMemory = self.closeSpan()
+      with self.lock:
+        self.spans.append(Span(category, name, depth, wall, cpu, peakMemory))
+
+  def call(self: Self, category: str, name: str, function, *args):
+    """Calls function with args in a span, and returns its result."""
+    with self.span(category, name):
+      return function(*args)
+
+  def count(self: Self, name: str, amount: int = 1) -> None:
+    if not self.enabled:
+      return
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + amount
+
+  def threadSpan(self: Self, category: str, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    startCpu = time.thread_time()
+    try:
+      yield
+    finally:
+      wall = time.perf_counter() - start
+      cpu = time.thread_time() - startCpu
+      with self.lock:
+        self.spans.append(
+            Span(category, name, len(self.stack), wall, cpu, None))
+
+  def openSpan(self: Self) -> None:
+    if not self.traceMemory:
+      self.stack.append(OpenSpan(0))
+      return
+    current, peak = tracemalloc.get_traced_memory()
+    if self.stack:
+      self.stack[-1].childPeak = max(self.stack[-1].childPeak, peak)
+    tracemalloc.reset_peak()
+    self.stack.append(OpenSpan(current))
+
+  def closeSpan(self: Self) -> int | None:
+    opened = self.stack.pop()
+    if not self.traceMemory:
+      return None
+    _, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, opened.childPeak)
+    if self.stack:
+      self.stack[-1].childPeak = max(self.stack[-1].childPeak, peak)
+    tracemalloc.reset_peak()
+    return peak - opened.startMemory
+
+  def merge(self: Self, spans: list[Span]) -> None:
+    """Adds spans recorded by another process, nested in the open ones."""
+    depth = len(self.stack)
+    with self.lock:
+      for span in spans:
+        span.depth += depth
+        self.spans.append(span)
+
+  def totals(self: Self) -> dict[str, dict[str, float]]:
+    """Total wall and CPU time of the outermost spans of each category."""
+    totals: dict[str, dict[str, float]] = {}
+    # Spans are recorded when they close, so going backwards every span
+    # comes after the ones it is nested in
+    ancestors: list[str] = []
+    for span in reversed(self.spans):
+      del ancestors[span.depth:]
+      if span.category not in ancestors:
+        total = totals.setdefault(
+            span.category, {
+                "count": 0, "wall": 0.0, "cpu": 0.0
+            })
+        total["count"] += 1
+        total["wall"] += span.wall
+        total["cpu"] += span.cpu
+      ancestors.append(span.category)
+    return totals
+
+  def toDict(self: Self) -> dict:
+    return {
+        "traceMemory": self.traceMemory,
+        "totals": self.totals(),
+        "spans": [asdict(span) for span in self.spans],
+        "counters": self.counters,
+    }
+
+  def write(self: Self, filename: str) -> None:
+    with open(filename, "w") as f:
+      json.dump(self.toDict(), f, indent=2)
+
+  def summary(self: Self, top: int = 10) -> str:
+    lines = [f"{'stage':<28}{'wall (s)':>10}{'cpu (s)':>10}{'peak (MB)':>11}"]
+    for span in self.spans:
+      if span.category == "stage":
+        lines.append(self.formatSpan(span.name, span))
+    lines.append("")
+    lines.append(f"{'category':<28}{'count':>10}{'wall (s)':>10}")
+    for category, total in sorted(self.totals().items()):
+      lines.append(f"{category:<28}{total['count']:>10}{total['wall']:>10.3f}")
+    if self.counters:
+      lines.append("")
+      lines.append(f"{'counter':<28}{'count':>10}")
+      for name, count in sorted(self.counters.items()):
+        lines.append(f"{name[:27]:<28}{count:>10}")
+    for category in RANKED_CATEGORIES:
+      ranked = sorted(
+          (span for span in self.spans if span.category == category),
+          key=lambda span: span.wall,
+          reverse=True)[:top]
+      if ranked:
+        lines.append("")
+        lines.append(f"slowest {category}s")
+        lines.extend(self.formatSpan(span.name, span) for span in ranked)
+    return "\n".join(lines)
+
+  def formatSpan(self: Self, label: str, span: Span) -> str:
+    peak = "" if span.peakMemory is None else f"{span.peakMemory / 2**20:.1f}"
+    return f"{label[:27]:<28}{span.wall:>10.3f}{span.cpu:>10.3f}{peak:>11}"
+
+
+# The profiler of this process
+profiler = Profiler()
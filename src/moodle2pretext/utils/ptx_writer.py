@@ -1,46 +1,167 @@
-from typing import Dict, Iterable
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from typing import Dict, Iterable, Iterator
 from urllib.parse import unquote, quote
 from bs4 import BeautifulSoup, NavigableString
 import bs4
 import re
 
-from ptx_formatter import formatPretext
-
 from moodle2pretext.question import *
 from moodle2pretext.assignment import Assignment
 from moodle2pretext.question.multiplechoice import Choice
 from moodle2pretext.utils import yesOrNo
 from moodle2pretext.utils.code_writer import CodeWriter
-from moodle2pretext.utils.python_code_runner import PythonCodeRunner
+from moodle2pretext.utils.disk_cache import DiskCache
+from moodle2pretext.utils.formatting import Formatter, formatPretext, workerContext
+from moodle2pretext.utils.html import PretextFragment
+from moodle2pretext.utils.images import ImageReport
+from moodle2pretext.utils.profiler import Span, profiler
+from moodle2pretext.utils.python_code_runner import ExecutionCache, PythonCodeRunner, TestRunResult, defaultBackend
+from moodle2pretext.utils.sandbox import ExecutionPolicy
 from moodle2pretext.assetManager import AssetManager
+from moodle2pretext.options import ConversionOptions
 
 # Pattern for which characters in a ID are to be
 # replaced by dash
 PATTERN = re.compile(r"[\W]+")
 # Pattern to search for links to file assets
 FILE_MATCHER = re.compile(r"@@PLUGINFILE@@/([^?\n]*)")
+# Number of assignments each worker process may have queued up
+PENDING_PER_JOB = 2
 
 
 class PtxWriter:
 
-  def __init__(self, assetManager: AssetManager):
+  def __init__(
+      self,
+      assetManager: AssetManager,
+      options: ConversionOptions | None = None):
     self.soup = BeautifulSoup(features="xml")
     self.seenIds = {}
     self.codeWriter = CodeWriter()
     self.assetManager = assetManager
+    self.options = options or ConversionOptions()
+    # Results of the CodeRunner example cases, by question id
+    self.exampleResults: dict[str, list[TestRunResult]] = {}
+    # When assignments are rendered in parallel, each worker process formats
+    # its own files
+    self.formatter = Formatter(
+        self.options, 0 if self.options.jobs > 1 else self.options.formatJobs)
 
   def createAssignmentFile(self, assignment: Assignment, filename: str) -> None:
-    sectionTag = self.makeAssignment(assignment)
-    ptxContents = formatPretext(str(sectionTag))
-    self.assetManager.createSourceFile(filename, ptxContents)
-
-  def generateAssignmentFiles(self, assignments: list[Assignment]):
+    with profiler.span("assignment", assignment.name):
+      sectionTag = self.makeAssignment(assignment)
+      self.writeSourceFile(filename, str(sectionTag))
+
+  def writeSourceFile(self, filename: str, xml: str) -> None:
+    """Formats xml and writes it to filename, possibly at a later time."""
+    self.formatter.submit(
+        filename,
+        xml, lambda formatted: self.assetManager.createSourceFile(
+            filename, formatted))
+
+  def generateAssignmentFiles(self, assignments: Iterable[Assignment]):
+    if self.options.jobs > 1:
+      yield from self.generateAssignmentFilesInParallel(assignments)
+      return
     for idx, assignment in enumerate(assignments):
-      filename = f"sec-{idx}-{self.makeIdLike(assignment.name)}.ptx"
+      filename = self.makeAssignmentFilename(idx, assignment)
+      self.prepareExampleResults(assignment)
       self.createAssignmentFile(assignment, filename)
       yield filename
 
-  def generateChapter(self, assignments: list[Assignment]):
+  def generateAssignmentFilesInParallel(
+      self, assignments: Iterable[Assignment]):
+    """Renders each assignment file in a worker process.
+
+    Each worker starts from the ids a serial run would have seen before
+    reaching its assignment, so the generated ids are exactly the same.
+    Only a few assignments per worker are submitted ahead of the files
+    written, so that they are not all held in memory at once.
+
+    The asset manager and the options are sent once to each worker, and
+    each assignment only comes with the ids and example results it uses.
+    """
+    with ProcessPoolExecutor(max_workers=self.options.jobs,
+                             mp_context=workerContext(),
+                             initializer=startRenderWorker,
+                             initargs=(self.assetManager,
+                                       self.options)) as pool:
+      futures = deque()
+      for idx, assignment in enumerate(assignments):
+        if len(futures) >= PENDING_PER_JOB * self.options.jobs:
+          yield self.collectAssignmentFile(futures.popleft())
+        filename = self.makeAssignmentFilename(idx, assignment)
+        futures.append(
+            pool.submit(
+                renderAssignmentFile,
+                assignment,
+                filename,
+                self.seenIdsOf(assignment),
+                self.prepareExampleResults(assignment),
+                profiler.enabled,
+                profiler.traceMemory))
+        self.reserveAssignmentIds(assignment)
+      while futures:
+        yield self.collectAssignmentFile(futures.popleft())
+
+  def collectAssignmentFile(self, future) -> str:
+    filename, spans, images = future.result()
+    profiler.merge(spans)
+    if images is not None:
+      self.assetManager.images.report.merge(images)
+    return filename
+
+  def prepareExampleResults(
+      self, assignment: Assignment) -> dict[str, list[TestRunResult]]:
+    """The example results that rendering assignment needs.
+
+    In low memory mode, they are only run now, and replace the ones of the
+    previous assignment.
+    """
+    if self.options.lowMemory:
+      self.exampleResults = {}
+      self.runAllExamples([assignment])
+    return {
+        question.id: self.exampleResults[question.id]
+        for question in findCodeRunnerQuestions(assignment.questions)
+        if question.id in self.exampleResults
+    }
+
+  def makeAssignmentFilename(self, idx: int, assignment: Assignment) -> str:
+    return f"sec-{idx}-{self.makeIdLike(assignment.name)}.ptx"
+
+  def reserveAssignmentIds(self, assignment: Assignment) -> None:
+    """Claims the ids that makeAssignment would, in the same order."""
+    self.makeUniqueId("sec", assignment.name)
+    for question in assignment.questions:
+      self.reserveQuestionIds(question)
+
+  def seenIdsOf(self, assignment: Assignment) -> dict[str, int]:
+    """The counts of the ids that makeAssignment would claim, so far."""
+    names = [assignment.name]
+    questions = list(assignment.questions)
+    while questions:
+      question = questions.pop()
+      names.append(question.name)
+      if isinstance(question, ExerciseGroupQuestion):
+        questions.extend(question.exercises)
+    encodedIds = {self.makeIdLike(name) for name in names}
+    return {
+        encodedId: self.seenIds[encodedId]
+        for encodedId in encodedIds
+        if encodedId in self.seenIds
+    }
+
+  def reserveQuestionIds(self, question: Question) -> None:
+    self.makeUniqueId("exer", question.name)
+    if isinstance(question, ExerciseGroupQuestion):
+      for exercise in question.exercises:
+        self.reserveQuestionIds(exercise)
+
+  def generateChapter(self, assignments: Iterable[Assignment]):
     yield self.makeTag("title", "Chapter Title")
     for filename in self.generateAssignmentFiles(assignments):
       yield self.makeTag("xi:include", "", {"href": f"./{filename}"})
@@ -51,11 +172,54 @@ class PtxWriter:
         [self.makeTag("book", [self.makeTag("title", "Exercises"), chapter])], {
             "xml:lang": "en-US", "xmlns:xi": "http://www.w3.org/2001/XInclude"
         })
-    self.assetManager.createSourceFile("main.ptx", formatPretext(str(ptxTag)))
-
-  def process(self, assignments: list[Assignment]):
-    chapter = self.makeTag("chapter", self.generateChapter(assignments))
-    self.createMainFile(chapter)
+    self.writeSourceFile("main.ptx", str(ptxTag))
+
+  def process(self, assignments: Iterable[Assignment]):
+    # In low memory mode, assignments may be a generator that builds each
+    # one as it is needed, so examples are run one assignment at a time
+    if not self.options.lowMemory:
+      self.runAllExamples(assignments)
+    with self.assetExports():
+      with self.formatter:
+        chapter = self.makeTag("chapter", self.generateChapter(assignments))
+        self.createMainFile(chapter)
+
+  @contextmanager
+  def assetExports(self) -> Iterator[None]:
+    """Waits at the end for the assets that were located to be written."""
+    try:
+      yield
+    except BaseException:
+      self.assetManager.cancelExports()
+      raise
+    self.assetManager.finishExports()
+
+  def runAllExamples(self, assignments: list[Assignment]) -> None:
+    """Runs the example cases of every CodeRunner question up front,
+    concurrently, so that rendering never waits on them."""
+    questions = {
+        question.id: question
+        for assignment in assignments
+        for question in findCodeRunnerQuestions(assignment.questions)
+    }
+    for question in questions.values():
+      question.datafiles = self.assetManager.locateDatafiles(question.id)
+    with profiler.span("exec", "runAllExamples"):
+      self.exampleResults.update(
+          self.makeCodeRunner().runAllExampleCases(
+              questions.values(), self.options.execJobs))
+
+  def makeCodeRunner(self) -> PythonCodeRunner:
+    cache = None
+    if self.options.execCache:
+      cache = ExecutionCache(
+          DiskCache(
+              path.join(self.options.cacheDir, "exec"),
+              self.options.execCacheSize))
+    return PythonCodeRunner(
+        defaultBackend(self.options.execJobs),
+        cache,
+        ExecutionPolicy.fromOptions(self.options))
 
   def makeAssignment(self, assignment):
     assignmentId = self.makeUniqueId("sec", assignment.name)
@@ -80,7 +244,9 @@ class PtxWriter:
       content: str | Iterable[Node],
       attrs: Dict[str, str] = {}) -> Node:
     tag = self.soup.new_tag(tagName, attrs=attrs)
-    if isinstance(content, str):
+    if isinstance(content, PretextFragment):
+      tag.extend(content.copyNodes())
+    elif isinstance(content, str):
       tag.append(BeautifulSoup(content, "html.parser"))
     else:
       tag.extend(content)
@@ -88,6 +254,11 @@ class PtxWriter:
 
   def processQuestion(
       self, question: Question, assignmentId: str) -> bs4.element.Tag:
+    with profiler.span("question", question.name):
+      return self.renderQuestion(question, assignmentId)
+
+  def renderQuestion(
+      self, question: Question, assignmentId: str) -> bs4.element.Tag:
     attrs = {
         "xml:id": self.makeUniqueId("exer", question.name),
         "label": f"exe-{assignmentId}-{question.id}"
@@ -98,8 +269,10 @@ class PtxWriter:
       if question.title is not None:
         exerciseTag.append(self.makeTag("title", question.title))
       exerciseTag.append(self.makeTag("introduction", question.questionText))
-      for question in question.exercises:
-        exerciseTag.append(self.processQuestion(question, assignmentId))
+      # Sub-exercises fix their own links, so fix ours before adding them
+      exerciseTag = self.fixAssetLinks(exerciseTag, question.id)
+      for exercise in question.exercises:
+        exerciseTag.append(self.processQuestion(exercise, assignmentId))
     else:
       exerciseTag = self.makeTag("exercise", [], attrs=attrs)
       if question.title is not None:
@@ -128,7 +301,7 @@ class PtxWriter:
         list(exerciseTag.children)[-1].extend(
             self.getCodeRunnerExamples(question))
         exerciseTag.append(self.getCodeRunnerParts(question))
-    exerciseTag = self.fixAssetLinks(exerciseTag, question.id)
+      exerciseTag = self.fixAssetLinks(exerciseTag, question.id)
     return exerciseTag
 
   def fixAssetLinks(
@@ -188,7 +361,12 @@ class PtxWriter:
 # TODO: Allow other languages?
 
   def getCodeRunnerExamples(self, question: CodeRunnerQuestion) -> list[Node]:
-    results = PythonCodeRunner().runExampleCases(question)
+    results = self.exampleResults.get(question.id)
+    if results is None:
+      results = PythonCodeRunner(
+          defaultBackend(self.options.execJobs),
+          policy=ExecutionPolicy.fromOptions(
+              self.options)).runExampleCases(question)
 
     if len(results) == 0:
       return [self.makeTag("p", "For example:")]
@@ -269,3 +447,51 @@ class PtxWriter:
 
   def makeIdLike(self, s: str) -> str:
     return PATTERN.sub("-", s)
+
+
+def findCodeRunnerQuestions(
+    questions: list[Question]) -> Iterable[CodeRunnerQuestion]:
+  for question in questions:
+    if isinstance(question, CodeRunnerQuestion):
+      yield question
+    elif isinstance(question, ExerciseGroupQuestion):
+      yield from findCodeRunnerQuestions(question.exercises)
+
+
+# The asset manager and options of a worker process, set by
+# startRenderWorker
+workerState: tuple[AssetManager, ConversionOptions] | None = None
+
+
+def startRenderWorker(
+    assetManager: AssetManager, options: ConversionOptions) -> None:
+  """Worker process initializer, keeping what every assignment needs."""
+  global workerState
+  workerState = (assetManager, options)
+
+
+def renderAssignmentFile(
+    assignment: Assignment,
+    filename: str,
+    seenIds: dict[str, int],
+    exampleResults: dict[str, list[TestRunResult]],
+    profile: bool = False,
+    traceMemory: bool = False) -> tuple[str, list[Span], ImageReport | None]:
+  """Worker process entry point for rendering one assignment file.
+
+  Returns the filename, the spans recorded if profile is set, and the
+  images optimized for it if images are.
+  """
+  assetManager, options = workerState
+  if profile:
+    profiler.start(traceMemory)
+  writer = PtxWriter(assetManager, options)
+  writer.seenIds = seenIds
+  writer.exampleResults = exampleResults
+  with writer.assetExports(), writer.formatter:
+    writer.createAssignmentFile(assignment, filename)
+  images = None
+  if assetManager.images is not None:
+    images = assetManager.images.report
+    assetManager.images.report = ImageReport()
+  return filename, profiler.spans if profile else [], images
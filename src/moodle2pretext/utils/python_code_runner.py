@@ -1,10 +1,175 @@
 from moodle2pretext.question.coderunner_question import CodeRunnerQuestion, TestCase
+from moodle2pretext.utils.disk_cache import DiskCache, makeKey
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.utils.interpreter_pool import PYTHON, CompletedRun, InterpreterPool
+from moodle2pretext.utils.profiler import profiler
+from moodle2pretext.utils.sandbox import LIMIT_EXCEEDED, SANDBOX_SOURCE, TIMEOUT, ExecutionPolicy, exceededLimit
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
+from io import TextIOWrapper
+import atexit
+import json
+import signal
 import subprocess
 import tempfile
 import os.path
 
 TestRunResult = tuple[str, str, str]
 
+# Source of the program that applies a policy, given as JSON in its first
+# argument, and then runs the code in its second argument as `python -c`
+# would
+LAUNCHER_SOURCE = SANDBOX_SOURCE + r'''
+import json, types
+policy, code = json.loads(sys.argv[1]), sys.argv[2]
+if policy is not None:
+  enterSandbox(policy)
+sys.argv = ["-c"]
+main = types.ModuleType("__main__")
+sys.modules["__main__"] = main
+exec(compile(code, "<string>", "exec"), main.__dict__)
+'''
+
+
+class SubprocessBackend:
+  """Runs every program in a brand new python3 process."""
+
+  def run(
+      self,
+      code: str,
+      stdin: str,
+      cwd: str,
+      policy: ExecutionPolicy | None = None) -> CompletedRun:
+    # Outputs go to files, which the policy can limit the size of
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+      process = subprocess.Popen(
+          [
+              PYTHON,
+              "-c",
+              LAUNCHER_SOURCE,
+              json.dumps(policy.toDict() if policy is not None else None),
+              code
+          ],
+          cwd=cwd,
+          stdin=subprocess.PIPE,
+          stdout=out,
+          stderr=err,
+          text=True,
+          start_new_session=True)
+      timedOut = False
+      try:
+        process.communicate(
+            stdin, timeout=policy.timeout if policy is not None else None)
+      except subprocess.TimeoutExpired:
+        timedOut = True
+        killGroup(process)
+        process.wait()
+      outputs = []
+      for f in (out, err):
+        f.seek(0)
+        outputs.append(readOutput(f, policy))
+    return CompletedRun(process.returncode, *outputs, timedOut)
+
+
+def killGroup(process: subprocess.Popen) -> None:
+  """Kills a process started in a new session, along with its children."""
+  if hasattr(os, "killpg"):
+    try:
+      os.killpg(process.pid, signal.SIGKILL)
+      return
+    except ProcessLookupError:
+      pass
+  process.kill()
+
+
+def readOutput(f, policy: ExecutionPolicy | None) -> str:
+  # Past the output limit the contents do not matter, and where the
+  # platform cannot limit the file they are not read
+  limit = -1
+  if policy is not None and policy.outputBytes is not None:
+    limit = policy.outputBytes + 1
+  text = TextIOWrapper(f, "utf-8", errors="replace")
+  contents = text.read(limit)
+  # The file is closed by its owner
+  text.detach()
+  return contents
+
+
+class PoolBackend:
+  """Runs every program in a child of a warm interpreter from a pool."""
+
+  def __init__(self, pool: InterpreterPool):
+    self.pool = pool
+
+  def run(
+      self,
+      code: str,
+      stdin: str,
+      cwd: str,
+      policy: ExecutionPolicy | None = None) -> CompletedRun:
+    return self.pool.run(code, stdin, cwd, policy)
+
+
+# Interpreter pools of this process, by size
+_sharedPools: dict[int, InterpreterPool] = {}
+
+
+def sharedPool(size: int | None = None) -> InterpreterPool:
+  """The interpreter pool with `size` workers (default: one per core)
+  shared by all runners of this process."""
+  size = size or os.cpu_count() or 1
+  pool = _sharedPools.get(size)
+  if pool is None or pool.pid != os.getpid():
+    pool = InterpreterPool(size)
+    atexit.register(pool.close)
+    _sharedPools[size] = pool
+  return pool
+
+
+def defaultBackend(size: int | None = None) -> SubprocessBackend | PoolBackend:
+  if hasattr(os, "fork"):
+    return PoolBackend(sharedPool(size))
+  return SubprocessBackend()
+
+
+@cache
+def interpreterVersion() -> str:
+  return subprocess.run(
+      [PYTHON, "-c", "import sys; print(sys.version)"],
+      capture_output=True,
+      text=True,
+      check=True).stdout
+
+
+class ExecutionCache:
+  """Results of successful runs, kept on disk across conversions.
+
+  Results are keyed on everything a run depends on: the full program, its
+  input, the contents of its datafiles, the limits it runs under and the
+  interpreter version.
+  """
+
+  def __init__(self, cache: DiskCache):
+    self.cache = cache
+
+  def key(
+      self,
+      code: str,
+      stdin: str,
+      datafiles: dict[str, str],
+      policy: ExecutionPolicy) -> str:
+    files = [part for item in sorted(datafiles.items()) for part in item]
+    limits = json.dumps(policy.toDict(), sort_keys=True)
+    return makeKey(interpreterVersion(), limits, code, stdin, *files)
+
+  def get(self, key: str) -> str | None:
+    value = self.cache.get(key)
+    return None if value is None else value.decode("utf-8")
+
+  def put(self, key: str, result: str) -> None:
+    self.cache.put(key, result.encode("utf-8"))
+
 
 class PythonCodeRunner:
   """
@@ -13,35 +178,88 @@ class PythonCodeRunner:
   environment
   """
 
+  def __init__(
+      self,
+      backend: SubprocessBackend | PoolBackend | None = None,
+      cache: ExecutionCache | None = None,
+      policy: ExecutionPolicy | None = None):
+    self.backend = backend if backend is not None else defaultBackend()
+    self.cache = cache
+    # The limits every case runs under
+    self.policy = policy or ExecutionPolicy.fromOptions(ConversionOptions())
+
   def runExampleCases(self,
                       question: CodeRunnerQuestion) -> list[TestRunResult]:
     """Returns a list of results of a run: (testcode, input, result)"""
-    correctCode = "\n".join([question.preamble or "", question.answer])
-    exampleCases = [c for c in question.testCases if c.useAsExample]
+    correctCode = getCorrectCode(question)
     return [
         self.runCase(correctCode, case, question.datafiles)
-        for case in exampleCases
+        for case in getExampleCases(question)
     ]
 
+  def runAllExampleCases(
+      self,
+      questions: Iterable[CodeRunnerQuestion],
+      concurrency: int | None = None) -> dict[str, list[TestRunResult]]:
+    """Runs the example cases of all the questions concurrently.
+
+    Returns the results of runExampleCases for each question, by question id.
+    At most `concurrency` cases run at the same time (default: one per core).
+    """
+    futures: dict[str, list[Future[TestRunResult]]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency or os.cpu_count()) as pool:
+      for question in questions:
+        correctCode = getCorrectCode(question)
+        futures[question.id] = [
+            pool.submit(
+                profiler.call,
+                "exec",
+                question.name,
+                self.runCase,
+                correctCode,
+                case,
+                question.datafiles) for case in getExampleCases(question)
+        ]
+    return {
+        questionId: [future.result() for future in results]
+        for questionId, results in futures.items()
+    }
+
   def runCase(
       self, code: str, case: TestCase, datafiles: dict[str,
                                                        str]) -> TestRunResult:
+    testCode = "\n".join([code, case.testCode])
+    if self.cache is not None:
+      key = self.cache.key(testCode, case.stdInput, datafiles, self.policy)
+      result = self.cache.get(key)
+      if result is not None:
+        return (case.testCode, case.stdInput, result)
     with tempfile.TemporaryDirectory() as tempDir:
       for fname, contents in datafiles.items():
         with open(os.path.join(tempDir, fname), "w") as f:
           f.write(contents)
-      testCode = "\n".join([code, case.testCode])
-      try:
-        res = subprocess.run(
-            ["python3", "-c", testCode],
-            cwd=tempDir,
-            capture_output=True,
-            text=True,
-            input=case.stdInput,
-            check=True)
+      res = self.backend.run(testCode, case.stdInput, tempDir, self.policy)
+      if res.timedOut:
+        print(f"Timed out after {self.policy.timeout}s!!!")
+        result = TIMEOUT
+      elif exceededLimit(self.policy, res.returncode, res.stdout, res.stderr):
+        print(res.stderr[-1000:])
+        print("Limit exceeded!!!")
+        result = LIMIT_EXCEEDED
+      elif res.returncode == 0:
         result = res.stdout.strip()
-      except subprocess.CalledProcessError as error:
-        print(error.stderr)
+        if self.cache is not None:
+          self.cache.put(key, result)
+      else:
+        print(res.stderr)
         print("Error!!!")
         result = "error"
     return (case.testCode, case.stdInput, result)
+
+
+def getCorrectCode(question: CodeRunnerQuestion) -> str:
+  return "\n".join([question.preamble or "", question.answer])
+
+
+def getExampleCases(question: CodeRunnerQuestion) -> list[TestCase]:
+  return [c for c in question.testCases if c.useAsExample]
@@ -0,0 +1,126 @@
+"""Module that limits what the code of CodeRunner examples may do.
+
+Every example case runs under an `ExecutionPolicy`: a wall clock timeout,
+after which the case and any process it started are killed, and limits on
+CPU time, memory, and the bytes written to its output and to files. Where
+the platform allows, the case also runs without network access.
+
+The limits are set in the process that runs the case, by SANDBOX_SOURCE,
+right before the code starts, so both backends share them. A case that
+goes over a limit gets the result "timeout" or "limit exceeded" instead of
+"error".
+"""
+
+from dataclasses import asdict, dataclass
+import errno
+import re
+import signal
+from typing import Self
+
+from moodle2pretext.options import ConversionOptions
+
+TIMEOUT = "timeout"
+LIMIT_EXCEEDED = "limit exceeded"
+
+# Signals that end a process that goes over its CPU time and file size
+# limits, or over the memory of the host
+LIMIT_SIGNALS = {
+    getattr(signal, name)
+    for name in ("SIGXCPU", "SIGXFSZ", "SIGKILL")
+    if hasattr(signal, name)
+}
+# Error a write past the file size limit fails with
+LIMIT_ERRORS = re.compile(rf"^OSError: \[Errno {errno.EFBIG}\]")
+
+
+@dataclass(frozen=True)
+class ExecutionPolicy:
+  """What a single example case may use. None means no limit."""
+  # Seconds a case may run, by the wall clock
+  timeout: float | None
+  # Seconds of CPU time a case may use
+  cpuSeconds: int | None
+  # Bytes of address space a case may use
+  memoryBytes: int | None
+  # Bytes a case may write to its output, and to any one file
+  outputBytes: int | None
+  # Whether a case may use the network
+  network: bool
+
+  @staticmethod
+  def fromOptions(options: ConversionOptions) -> Self:
+    return ExecutionPolicy(
+        options.execTimeout,
+        options.execCpuSeconds,
+        options.execMemoryBytes,
+        options.execOutputBytes,
+        options.execNetwork)
+
+  def toDict(self: Self) -> dict:
+    return asdict(self)
+
+
+def exceededLimit(
+    policy: ExecutionPolicy, returncode: int, stdout: str, stderr: str) -> bool:
+  """Whether a finished case went over one of its limits.
+
+  Output that reaches the limit counts as over it, as anything past the
+  limit was cut off, possibly without the case failing.
+  """
+  if returncode < 0 and -returncode in LIMIT_SIGNALS:
+    return True
+  if policy.outputBytes is not None and len(
+      stdout.encode("utf-8")) >= policy.outputBytes:
+    return True
+  lines = stderr.rstrip().splitlines()
+  if returncode == 0 or not lines:
+    return False
+  # Python reports going over the memory and file size limits as errors
+  return lines[-1].startswith("MemoryError") or LIMIT_ERRORS.search(
+      lines[-1]) is not None
+
+
+# Source of enterSandbox(policy), which applies a policy, given as a dict,
+# to the current process. Runs in the interpreters that run the cases,
+# which need not be the one running the conversion.
+SANDBOX_SOURCE = r'''
+import os, sys
+
+# Audit events of connections and name lookups
+NETWORK_EVENTS = {
+    "socket.bind", "socket.connect", "socket.getaddrinfo",
+    "socket.gethostbyaddr", "socket.gethostbyname", "socket.sendmsg",
+    "socket.sendto"
+}
+
+
+def blockNetwork(event, args):
+  if event in NETWORK_EVENTS:
+    raise PermissionError("Network access is disabled for example cases")
+
+
+def enterSandbox(policy):
+  # A group of its own, so that the case can be killed with its children
+  if hasattr(os, "setpgid") and os.getpgrp() != os.getpid():
+    os.setpgid(0, 0)
+  try:
+    import resource
+  except ImportError:
+    resource = None
+  if resource is not None:
+    cpuSeconds = policy["cpuSeconds"]
+    if cpuSeconds is not None:
+      # SIGXCPU at the soft limit, and SIGKILL a second later
+      resource.setrlimit(resource.RLIMIT_CPU, (cpuSeconds, cpuSeconds + 1))
+    for limit, value in [(resource.RLIMIT_AS, policy["memoryBytes"]),
+                         (resource.RLIMIT_FSIZE, policy["outputBytes"])]:
+      if value is not None:
+        resource.setrlimit(limit, (value, value))
+  if not policy["network"]:
+    # Without privileges only the code run by this interpreter is blocked
+    try:
+      os.unshare(os.CLONE_NEWNET)
+    except (AttributeError, OSError):
+      pass
+    sys.addaudithook(blockNetwork)
+'''
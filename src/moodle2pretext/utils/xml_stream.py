@@ -0,0 +1,73 @@
+"""Module that streams large Moodle XML documents one element at a time"""
+
+from collections.abc import Generator
+from typing import BinaryIO
+from xml.dom import Node
+from xml.dom.minidom import Document, parseString
+
+from lxml import etree
+
+
+def iterElements(source: BinaryIO,
+                 tag: str) -> Generator[etree._Element, None, None]:
+  """Yields every `tag` element of the document as soon as it is complete.
+
+  Each element is cleared once the caller is done with it, and so are the
+  already processed siblings, so that peak memory depends on the largest
+  single element rather than on the size of the document.
+  """
+  for _, element in etree.iterparse(source, events=("end",), tag=tag,
+                                    huge_tree=True):
+    yield element
+    element.clear(keep_tail=False)
+    while element.getprevious() is not None:
+      del element.getparent()[0]
+
+
+def iterTexts(source: BinaryIO, tag: str) -> Generator[str, None, None]:
+  """Yields the text of every `tag` element of the document."""
+  for element in iterElements(source, tag):
+    yield "".join(element.itertext())
+
+
+def readAttributes(source: BinaryIO, tag: str) -> dict[str, str]:
+  """The attributes of the first `tag` element, read without parsing the
+  rest of the document."""
+  for _, element in etree.iterparse(source, events=("start",), tag=tag,
+                                    huge_tree=True):
+    return dict(element.attrib)
+  raise RuntimeError("No child tag: " + tag)
+
+
+def toDom(xml: bytes) -> Node:
+  """Parses a serialized element into the minidom nodes the rest of the
+  code works with."""
+  return parseString(xml).documentElement
+
+
+def elementToDom(element: etree._Element) -> Node:
+  """Copies a streamed element into the minidom nodes the rest of the code
+  works with, without serializing and parsing it again. Comments and
+  processing instructions are left out."""
+  document = Document()
+  # Pairs of an element or a text and the node it goes into, in order
+  stack = [(element, document)]
+  while stack:
+    source, parent = stack.pop()
+    if isinstance(source, str):
+      parent.appendChild(document.createTextNode(source))
+      continue
+    node = document.createElement(source.tag)
+    for name, value in source.attrib.items():
+      node.setAttribute(name, value)
+    parent.appendChild(node)
+    contents = [source.text]
+    for child in source:
+      if isinstance(child.tag, str):
+        contents.append(child)
+      contents.append(child.tail)
+    stack.extend(
+        (item, node)
+        for item in reversed(contents)
+        if item is not None and item != "")
+  return document.documentElement
@@ -0,0 +1,110 @@
+import os
+from os import path
+import pickle
+from tempfile import TemporaryDirectory
+import unittest
+
+from moodle2pretext.archiveReader import ArchiveReader, BackupFormat, BackupReader, MemberRole, ZipReader, detectFormat, openBackup, roleOf
+from tests.backups import writeBackup
+
+MEMBERS = {
+    "activities/quiz_2/quiz.xml": b"<quiz>2</quiz>",
+    "files/ab/ab12": b"image bytes",
+    "moodle_backup.xml": b"<ignored/>",
+    "activities/quiz_1/quiz.xml": b"<quiz>1</quiz>",
+    "questions.xml": b"<questions/>",
+}
+
+
+class TestArchiveReader(unittest.TestCase):
+
+  def test_roles_of_members(self):
+    self.assertEqual(MemberRole.FILES, roleOf("files.xml"))
+    self.assertEqual(MemberRole.QUESTIONS, roleOf("questions.xml"))
+    self.assertEqual(MemberRole.QUIZ, roleOf("activities/quiz_12/quiz.xml"))
+    self.assertEqual(
+        MemberRole.SECTION, roleOf("sections/section_3/section.xml"))
+    self.assertEqual(MemberRole.ASSET, roleOf("files/ab/ab12cd"))
+    self.assertIsNone(roleOf("activities/quiz_12/grades.xml"))
+    self.assertIsNone(roleOf("moodle_backup.xml"))
+
+  def test_members_are_indexed_in_archive_order(self):
+    with TemporaryDirectory() as directory, TemporaryDirectory() as workDir:
+      backup = writeBackup(directory, MEMBERS)
+      archive = ArchiveReader(backup, workDir).read()
+      self.assertEqual(
+          ["activities/quiz_2/quiz.xml", "activities/quiz_1/quiz.xml"],
+          archive.names(MemberRole.QUIZ))
+      self.assertEqual(["files/ab/ab12"], archive.names(MemberRole.ASSET))
+      with archive.open("files/ab/ab12") as f:
+        self.assertEqual(b"image bytes", f.read())
+      with archive.open("questions.xml") as f:
+        self.assertEqual(b"<questions/>", f.read())
+      with self.assertRaises(KeyError):
+        archive.open("moodle_backup.xml")
+
+
+class TestBackupFormats(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = TemporaryDirectory()
+    self.workDir = TemporaryDirectory()
+
+  def tearDown(self):
+    self.directory.cleanup()
+    self.workDir.cleanup()
+
+  def backups(self) -> dict[BackupFormat, str]:
+    backups = {}
+    for backupFormat in BackupFormat:
+      directory = path.join(self.directory.name, backupFormat.value)
+      os.makedirs(directory)
+      backups[backupFormat] = writeBackup(directory, MEMBERS, backupFormat)
+    return backups
+
+  def test_formats_are_detected_by_their_contents(self):
+    for backupFormat, backup in self.backups().items():
+      self.assertEqual(backupFormat, detectFormat(backup))
+    unknown = path.join(self.directory.name, "unknown.mbz")
+    with open(unknown, "wb") as f:
+      f.write(b"not a backup")
+    with self.assertRaises(ValueError):
+      detectFormat(unknown)
+
+  def test_every_format_gives_the_same_members(self):
+    for backupFormat, backup in self.backups().items():
+      archive = openBackup(backup, self.workDir.name)
+      self.assertEqual(
+          ["files/ab/ab12"], archive.names(MemberRole.ASSET), backupFormat)
+      self.assertEqual(
+          {"activities/quiz_1/quiz.xml", "activities/quiz_2/quiz.xml"},
+          set(archive.names(MemberRole.QUIZ)),
+          backupFormat)
+      for name in ["files/ab/ab12", "questions.xml"]:
+        with archive.open(name) as f:
+          self.assertEqual(MEMBERS[name], f.read(), backupFormat)
+      with self.assertRaises(KeyError):
+        archive.open("moodle_backup.xml")
+
+  def test_zip_members_are_read_in_place(self):
+    backup = self.backups()[BackupFormat.ZIP]
+    archive = openBackup(backup, self.workDir.name)
+    self.assertIsInstance(archive, ZipReader)
+    self.assertEqual([], os.listdir(self.workDir.name))
+    # Worker processes get a copy without the open archive
+    copy = pickle.loads(pickle.dumps(archive))
+    self.assertIsNone(copy.zipFile)
+    with copy.open("files/ab/ab12") as f:
+      self.assertEqual(b"image bytes", f.read())
+
+  def test_zip_archive_is_closed_with_the_reader(self):
+    backup = self.backups()[BackupFormat.ZIP]
+    with openBackup(backup, self.workDir.name) as archive:
+      zipFile = archive.archive()
+      self.assertIs(zipFile, archive.archive())
+    self.assertIsNone(archive.zipFile)
+    self.assertIsNone(zipFile.fp)
+
+  def test_readers_must_read_and_open_members(self):
+    with self.assertRaises(TypeError):
+      BackupReader("backup.mbz")
@@ -0,0 +1,182 @@
+import os
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+import tracemalloc
+from unittest.mock import patch
+
+from lxml import etree
+
+from moodle2pretext.archiveReader import ArchiveReader, BackupFormat, DirectoryReader, ZipReader
+from moodle2pretext.assetManager import COPY_BUFFER_SIZE, Asset, AssetManager, cloneFile
+from tests.backups import fileEntry, filesXml, writeBackup
+
+IMAGE_HASH = "ab" + "1" * 38
+DATA_HASH = "cd" + "2" * 38
+
+FILES_XML = filesXml(
+    [
+        fileEntry(1, IMAGE_HASH, "pic.png"),
+        fileEntry(2, IMAGE_HASH, "copy.png", itemId=11),
+        fileEntry(3, DATA_HASH, "data.txt", fileArea="datafile"),
+        fileEntry(4, DATA_HASH, ".", fileArea="datafile"),
+    ])
+
+MEMBERS = {
+    "files.xml": FILES_XML,
+    f"files/ab/{IMAGE_HASH}": b"image bytes",
+    f"files/cd/{DATA_HASH}": b"some data",
+}
+
+
+class TestAssetManager(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+    directory = self.tempDir.name
+    workDir = path.join(directory, "work")
+    self.outDir = path.join(directory, "out")
+    archive = ArchiveReader(writeBackup(directory, MEMBERS), workDir).read()
+    self.manager = AssetManager(archive, self.outDir)
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def imagePath(self, filename: str) -> str:
+    return path.join(self.outDir, "assets", "images", filename)
+
+  def test_resources_are_written_once(self):
+    link = self.manager.locateResource(10, "pic.png")
+    self.assertEqual(path.join("images", "10-pic.png"), link)
+    self.manager.finishExports()
+    mtime = os.stat(self.imagePath("10-pic.png")).st_mtime_ns
+    self.assertEqual(link, self.manager.locateResource("10", "pic.png"))
+    self.assertEqual(mtime, os.stat(self.imagePath("10-pic.png")).st_mtime_ns)
+
+  def test_same_content_is_extracted_once(self):
+    self.manager.locateResource(10, "pic.png")
+    self.manager.locateResource(11, "copy.png")
+    self.manager.finishExports()
+    with open(self.imagePath("11-copy.png"), "rb") as f:
+      self.assertEqual(b"image bytes", f.read())
+    self.assertTrue(
+        path.samefile(
+            self.imagePath("10-pic.png"), self.imagePath("11-copy.png")))
+
+  def test_assets_are_read_from_streamed_elements(self):
+    asset = Asset.fromElement(
+        etree.fromstring(
+            fileEntry(3, DATA_HASH, "data.txt", fileArea="datafile")))
+    self.assertEqual(
+        Asset(
+            3, 10, DATA_HASH, "/", "data.txt", "datafile", 1, "image/png", 0,
+            0),
+        asset)
+    with self.assertRaises(RuntimeError):
+      Asset.fromElement(etree.fromstring('<file id="1"/>'))
+
+  def test_missing_resources_are_an_error(self):
+    with self.assertRaises(Exception):
+      self.manager.locateResource(12, "pic.png")
+
+  def test_datafiles_are_found_by_item(self):
+    self.assertEqual(
+        {"data.txt": "some data"}, self.manager.locateDatafiles(10))
+    self.assertEqual({}, self.manager.locateDatafiles(11))
+
+
+class TestAssetSources(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def extract(self) -> str:
+    return writeBackup(self.tempDir.name, MEMBERS, BackupFormat.DIRECTORY)
+
+  def test_assets_of_extracted_backups_are_cloned_not_read(self):
+    archive = DirectoryReader(self.extract()).read()
+    manager = AssetManager(archive, path.join(self.tempDir.name, "out"))
+    with patch.object(AssetManager, "getAssetAsFileHandler") as reading:
+      link = manager.locateResource(10, "pic.png")
+      manager.finishExports()
+    reading.assert_not_called()
+    with open(path.join(self.tempDir.name, "out", "assets", link), "rb") as f:
+      self.assertEqual(b"image bytes", f.read())
+    self.assertEqual({"data.txt": "some data"}, manager.locateDatafiles(10))
+
+  def test_assets_of_zip_backups_are_read(self):
+    backup = writeBackup(self.tempDir.name, MEMBERS, BackupFormat.ZIP)
+    manager = AssetManager(
+        ZipReader(backup).read(), path.join(self.tempDir.name, "out"))
+    link = manager.locateResource(10, "pic.png")
+    manager.finishExports()
+    with open(path.join(self.tempDir.name, "out", "assets", link), "rb") as f:
+      self.assertEqual(b"image bytes", f.read())
+
+  def test_failed_copies_leave_no_partial_file(self):
+    backup = writeBackup(self.tempDir.name, MEMBERS, BackupFormat.ZIP)
+    manager = AssetManager(
+        ZipReader(backup).read(), path.join(self.tempDir.name, "out"))
+
+    def failingCopy(source, target, length):
+      target.write(source.read(5))
+      raise OSError("read failed")
+
+    with patch("shutil.copyfileobj", failingCopy):
+      manager.locateResource(10, "pic.png")
+      with self.assertRaises(OSError):
+        manager.finishExports()
+    self.assertEqual(
+        [], os.listdir(path.join(self.tempDir.name, "out", "assets", "images")))
+
+  def test_large_assets_are_copied_in_chunks(self):
+    size = 16 * COPY_BUFFER_SIZE
+    backup = writeBackup(
+        self.tempDir.name, {
+            **MEMBERS, f"files/ab/{IMAGE_HASH}": b"x" * size
+        },
+        BackupFormat.ZIP)
+    manager = AssetManager(
+        ZipReader(backup).read(), path.join(self.tempDir.name, "out"))
+    tracemalloc.start()
+    try:
+      link = manager.locateResource(10, "pic.png")
+      manager.locateResource(11, "copy.png")
+      manager.finishExports()
+      peak = tracemalloc.get_traced_memory()[1]
+    finally:
+      tracemalloc.stop()
+    self.assertLess(peak, 4 * COPY_BUFFER_SIZE)
+    self.assertEqual(
+        size, path.getsize(path.join(self.tempDir.name, "out", "assets", link)))
+
+  def test_xml_is_read_through_a_memory_map(self):
+    archive = DirectoryReader(self.extract()).read()
+    with archive.openMapped("files.xml") as mapped:
+      self.assertEqual(FILES_XML, mapped.read())
+      self.assertEqual("mmap", type(mapped).__name__)
+
+  def test_cloned_files_have_the_same_contents(self):
+    source = path.join(self.tempDir.name, "source")
+    target = path.join(self.tempDir.name, "target")
+    with open(source, "wb") as f:
+      f.write(b"contents")
+    cloneFile(source, target)
+    with open(target, "rb") as f:
+      self.assertEqual(b"contents", f.read())
+
+  def test_cloning_over_a_link_leaves_its_source_alone(self):
+    source = path.join(self.tempDir.name, "source")
+    target = path.join(self.tempDir.name, "target")
+    with open(source, "wb") as f:
+      f.write(b"contents")
+    os.link(source, target)
+    cloneFile(source, target)
+    cloneFile(source, target)
+    with open(source, "rb") as f:
+      self.assertEqual(b"contents", f.read())
+    self.assertEqual(
+        ["source", "target"], sorted(os.listdir(self.tempDir.name)))
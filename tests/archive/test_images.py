@@ -0,0 +1,179 @@
+from importlib.util import find_spec
+from io import BytesIO
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from moodle2pretext.archiveReader import BackupFormat, DirectoryReader
+from moodle2pretext.assetManager import AssetManager
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.utils.images import ImageOptimizer, ImageReport, ImageSettings
+from tests.backups import fileEntry, filesXml, writeBackup
+
+HAS_PILLOW = find_spec("PIL") is not None
+if HAS_PILLOW:
+  from PIL import Image
+
+IMAGE_HASH = "ab" + "1" * 38
+JPEG_HASH = "cd" + "2" * 38
+
+
+def makePng(width: int, height: int) -> bytes:
+  out = BytesIO()
+  # A gradient, so that scaling it down changes its size
+  image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+  image.save(out, "PNG")
+  return out.getvalue()
+
+
+def makeJpeg(width: int, height: int) -> bytes:
+  out = BytesIO()
+  Image.linear_gradient("L").resize((width, height)).save(out, "JPEG")
+  return out.getvalue()
+
+
+class TestImageSettings(unittest.TestCase):
+
+  def test_unknown_formats_are_an_error(self):
+    with self.assertRaises(ValueError):
+      ImageSettings(format="bmp")
+
+  def test_converted_files_are_renamed(self):
+    self.assertEqual(
+        "10-pic.png.webp", ImageSettings(format="webp").rename("10-pic.png"))
+    self.assertEqual("10-pic.png", ImageSettings().rename("10-pic.png"))
+
+  def test_images_written_by_several_processes_are_counted_once(self):
+    report = ImageReport()
+    report.add("a", 100, 40)
+    other = ImageReport()
+    other.add("a", 100, 40)
+    other.add("b", 50, 50)
+    report.merge(other)
+    self.assertEqual(150, report.originalBytes)
+    self.assertEqual(60, report.savedBytes)
+
+
+@unittest.skipUnless(HAS_PILLOW, "Pillow is not installed")
+class TestImageOptimizer(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+    self.image = makePng(4000, 50)
+    self.writeBackup({"pic.png": ("image/png", IMAGE_HASH, self.image)})
+
+  def writeBackup(self, files: dict[str, tuple[str, str, bytes]]) -> None:
+    """Writes a backup with the files, by name, of item 10."""
+    entries = [
+        fileEntry(id, contentHash, name, mimeType=mimeType, size=len(contents))
+        for id, (name, (mimeType, contentHash,
+                        contents)) in enumerate(files.items())
+    ]
+    members = {
+        "files.xml": filesXml(entries),
+        **{
+            f"files/{contentHash[:2]}/{contentHash}": contents
+            for _, contentHash, contents in files.values()
+        }
+    }
+    self.backup = writeBackup(
+        self.tempDir.name, members, BackupFormat.DIRECTORY)
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def options(self, **settings) -> ConversionOptions:
+    return ConversionOptions(
+        **{
+            "optimizeImages": True,
+            "imageMaxWidth": 800,
+            "cacheDir": path.join(self.tempDir.name, "cache"),
+            **settings
+        })
+
+  def export(self, options: ConversionOptions, output: str = "out"):
+    """Writes the image, returning where and the optimizer used."""
+    images = ImageOptimizer(options)
+    manager = AssetManager(
+        DirectoryReader(self.backup).read(),
+        path.join(self.tempDir.name, output),
+        images)
+    link = manager.locateResource(10, "pic.png")
+    manager.finishExports()
+    return path.join(self.tempDir.name, output, "assets", link), images
+
+  def test_wide_images_are_scaled_down(self):
+    written, images = self.export(self.options())
+    with Image.open(written) as image:
+      self.assertEqual((800, 10), image.size)
+    self.assertEqual(len(self.image), images.report.originalBytes)
+    self.assertEqual(path.getsize(written), images.report.writtenBytes)
+    self.assertGreater(images.report.savedBytes, 0)
+
+  def test_optimized_images_are_reused_across_runs(self):
+    first, _ = self.export(self.options(), "first")
+    with patch("moodle2pretext.utils.images.optimizeImage") as optimizing:
+      second, images = self.export(self.options(), "second")
+    optimizing.assert_not_called()
+    with open(first, "rb") as a, open(second, "rb") as b:
+      self.assertEqual(a.read(), b.read())
+    self.assertGreater(images.report.savedBytes, 0)
+
+  def test_changed_settings_optimize_again(self):
+    self.export(self.options())
+    written, _ = self.export(self.options(imageMaxWidth=400), "narrower")
+    with Image.open(written) as image:
+      self.assertEqual(400, image.width)
+
+  def test_converted_images_are_renamed(self):
+    written, _ = self.export(self.options(imageFormat="webp"))
+    self.assertEqual("10-pic.png.webp", path.basename(written))
+    with Image.open(written) as image:
+      self.assertEqual("WEBP", image.format)
+
+  def test_images_that_cannot_be_converted_keep_their_name(self):
+    self.writeBackup({"pic.png": ("image/png", IMAGE_HASH, b"notapng!!")})
+    written, _ = self.export(self.options(imageFormat="webp"))
+    self.assertEqual("10-pic.png", path.basename(written))
+    with open(written, "rb") as f:
+      self.assertEqual(b"notapng!!", f.read())
+
+  def test_images_differing_in_extension_convert_to_different_files(self):
+    jpeg = makeJpeg(4000, 50)
+    self.writeBackup(
+        {
+            "pic.png": ("image/png", IMAGE_HASH, self.image),
+            "pic.jpg": ("image/jpeg", JPEG_HASH, jpeg),
+        })
+    manager = AssetManager(
+        DirectoryReader(self.backup).read(),
+        path.join(self.tempDir.name, "out"),
+        ImageOptimizer(self.options(imageFormat="webp")))
+    links = [
+        manager.locateResource(10, name) for name in ("pic.png", "pic.jpg")
+    ]
+    manager.finishExports()
+    self.assertEqual(
+        [
+            path.join("images", "10-pic.png.webp"),
+            path.join("images", "10-pic.jpg.webp")
+        ],
+        links)
+    for link in links:
+      with Image.open(path.join(self.tempDir.name, "out", "assets",
+                                link)) as image:
+        self.assertEqual("WEBP", image.format)
+
+  def test_images_that_do_not_shrink_are_kept(self):
+    images = ImageOptimizer(self.options())
+    optimized = images.optimize(
+        IMAGE_HASH, "image/png", 1, lambda: BytesIO(self.image))
+    self.assertIsNone(optimized)
+    self.assertEqual(0, images.report.savedBytes)
+
+  def test_unreadable_images_are_kept(self):
+    images = ImageOptimizer(self.options(imageFormat="webp"))
+    optimized = images.optimize(
+        IMAGE_HASH, "image/png", 9, lambda: BytesIO(b"not a png"))
+    self.assertIsNone(optimized)
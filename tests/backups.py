@@ -0,0 +1,67 @@
+"""Builders of small Moodle backups for the tests."""
+
+from io import BytesIO
+import os
+from os import path
+import tarfile
+from zipfile import ZipFile
+
+from moodle2pretext.archiveReader import BackupFormat
+
+
+def fileEntry(
+    id: int,
+    contentHash: str,
+    fileName: str,
+    itemId: int = 10,
+    fileArea: str = "questiontext",
+    mimeType: str = "image/png",
+    size: int = 1) -> str:
+  """The entry of files.xml describing one file of the backup."""
+  return f"""<file id="{id}">
+  <contenthash>{contentHash}</contenthash>
+  <itemid>{itemId}</itemid>
+  <filearea>{fileArea}</filearea>
+  <filepath>/</filepath>
+  <filename>{fileName}</filename>
+  <filesize>{size}</filesize>
+  <mimetype>{mimeType}</mimetype>
+  <timecreated>0</timecreated>
+  <timemodified>0</timemodified>
+</file>"""
+
+
+def filesXml(entries: list[str]) -> bytes:
+  return ("<files>" + "".join(entries) + "</files>").encode("utf-8")
+
+
+def writeBackup(
+    directory: str,
+    members: dict[str, bytes],
+    backupFormat: BackupFormat = BackupFormat.GZIP_TAR) -> str:
+  """Writes a backup of the members in directory, and returns its path.
+
+  Archives are written to backup.mbz, replacing any earlier one. Extracted
+  backups are written to the backup directory, over any earlier one.
+  """
+  if backupFormat == BackupFormat.DIRECTORY:
+    backup = path.join(directory, "backup")
+    for name, contents in members.items():
+      target = path.join(backup, name)
+      os.makedirs(path.dirname(target), exist_ok=True)
+      with open(target, "wb") as f:
+        f.write(contents)
+    return backup
+  backup = path.join(directory, "backup.mbz")
+  if backupFormat == BackupFormat.ZIP:
+    with ZipFile(backup, "w") as archive:
+      for name, contents in members.items():
+        archive.writestr(name, contents)
+    return backup
+  mode = "w:gz" if backupFormat == BackupFormat.GZIP_TAR else "w"
+  with tarfile.open(backup, mode) as tar:
+    for name, contents in members.items():
+      tarInfo = tarfile.TarInfo(name)
+      tarInfo.size = len(contents)
+      tar.addfile(tarInfo, BytesIO(contents))
+  return backup
@@ -0,0 +1,127 @@
+import os
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from typer.testing import CliRunner
+
+from benchmarks.synthetic_backup import BackupSpec, writeBackup
+from moodle2pretext.batch import convertAll, courseOptions, findBackups, formatSummary, outputLocations
+from moodle2pretext.main import app
+from moodle2pretext.options import ConversionOptions
+
+SPEC = BackupSpec(quizzes=2, sections=1, bankEntries=6, questionsPerQuiz=3)
+
+
+class TestBatch(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+    self.backupDir = path.join(self.tempDir.name, "backups")
+    self.outputRoot = path.join(self.tempDir.name, "out")
+    os.makedirs(self.backupDir)
+    for name in ["one", "two"]:
+      writeBackup(path.join(self.backupDir, f"{name}.mbz"), SPEC)
+    with open(path.join(self.backupDir, "broken.mbz"), "w") as f:
+      f.write("not a backup")
+    with open(path.join(self.backupDir, "notes.txt"), "w") as f:
+      f.write("not a backup either")
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def backup(self, name: str) -> str:
+    return path.join(self.backupDir, name)
+
+  def test_finds_backups_in_directory_or_by_pattern(self):
+    self.assertEqual(
+        [
+            self.backup("broken.mbz"),
+            self.backup("one.mbz"),
+            self.backup("two.mbz")
+        ],
+        findBackups(self.backupDir))
+    self.assertEqual(
+        [self.backup("one.mbz")],
+        findBackups(path.join(self.backupDir, "o*.mbz")))
+
+  def test_outputs_are_named_after_backups(self):
+    self.assertEqual(
+        [
+            path.join("out", "one"),
+            path.join("out", "one-2"),
+            path.join("out", "two")
+        ],
+        outputLocations(["a/one.mbz", "b/one.mbz", "two.mbz"], "out"))
+
+  def test_numbered_outputs_do_not_take_the_name_of_a_backup(self):
+    self.assertEqual(
+        [
+            path.join("out", "a"),
+            path.join("out", "a-3"),
+            path.join("out", "a-2"),
+            path.join("out", "a-4")
+        ],
+        outputLocations(["x/a.mbz", "y/a.mbz", "a-2.mbz", "z/a.mbz"], "out"))
+
+  def test_cores_are_split_between_courses(self):
+    options = ConversionOptions()
+    with patch("os.cpu_count", return_value=8):
+      self.assertEqual(2, courseOptions(options, 4).execJobs)
+      self.assertEqual(1, courseOptions(options, 16).execJobs)
+      self.assertIsNone(courseOptions(options, 1).execJobs)
+      self.assertEqual(
+          3, courseOptions(ConversionOptions(execJobs=3), 4).execJobs)
+
+  def test_failed_course_does_not_stop_the_others(self):
+    results = convertAll(
+        findBackups(self.backupDir),
+        self.outputRoot,
+        options=ConversionOptions(execCache=False, formatCache=False))
+    self.assertEqual([False, True, True], [r.succeeded for r in results])
+    self.assertEqual([0, 6, 6], [r.questions for r in results])
+    self.assertEqual(["one", "two"], sorted(os.listdir(self.outputRoot)))
+    summary = formatSummary(results)
+    self.assertIn("2 of 3 courses converted", summary)
+    self.assertIn(self.backup("broken.mbz"), summary)
+
+  def test_courses_convert_in_parallel_in_order(self):
+    backups = [self.backup("two.mbz"), self.backup("one.mbz")]
+    results = convertAll(
+        backups,
+        self.outputRoot,
+        options=ConversionOptions(execCache=False, formatCache=False),
+        courseJobs=2)
+    self.assertEqual(backups, [r.backup for r in results])
+    self.assertTrue(all(r.succeeded for r in results))
+    self.assertTrue(
+        path.exists(path.join(self.outputRoot, "one", "source", "main.ptx")))
+
+  def test_batch_command_takes_the_conversion_options(self):
+    with patch("moodle2pretext.batch.convertAll", return_value=[]) as convert:
+      result = CliRunner().invoke(
+          app,
+          [
+              "batch",
+              self.backupDir,
+              self.outputRoot,
+              "--no-exec-cache",
+              "--exec-memory",
+              "0",
+              "--format-jobs",
+              "2",
+              "--optimize-images",
+              "--image-format",
+              "webp",
+              "--conversion-cache-size",
+              "2"
+          ])
+    self.assertEqual(0, result.exit_code, result.output)
+    options = convert.call_args.args[3]
+    self.assertFalse(options.execCache)
+    self.assertIsNone(options.execMemoryBytes)
+    self.assertEqual(2, options.formatJobs)
+    self.assertTrue(options.optimizeImages)
+    self.assertEqual("webp", options.imageFormat)
+    self.assertEqual(2 * 2**20, options.htmlCacheSize)
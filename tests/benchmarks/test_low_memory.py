@@ -0,0 +1,94 @@
+import gc
+import os
+from os import path
+from tempfile import TemporaryDirectory
+import tracemalloc
+import unittest
+
+from benchmarks.synthetic_backup import BackupSpec, writeBackup
+from moodle2pretext.course import Course, sectionOrder
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.section import Section
+from moodle2pretext.utils.html import conversionCache
+
+# CodeRunner questions are left out, running their examples is slow
+TYPE_WEIGHTS = dict(
+    multichoice=4, match=1, shortanswer=2, numerical=1, description=1)
+
+
+def makeSpec(quizzes: int) -> BackupSpec:
+  return BackupSpec(
+      quizzes=quizzes,
+      sections=2,
+      bankEntries=40,
+      questionsPerQuiz=10,
+      typeWeights=TYPE_WEIGHTS,
+      imageRate=0.2,
+      imageBytes=64)
+
+
+def readTree(directory: str) -> dict[str, bytes]:
+  contents = {}
+  for root, _, files in os.walk(directory):
+    for filename in files:
+      with open(path.join(root, filename), "rb") as f:
+        contents[path.relpath(path.join(root, filename), directory)] = f.read()
+  return contents
+
+
+class TestLowMemory(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def convert(self, quizzes: int, lowMemory: bool) -> tuple[Course, str]:
+    name = f"course-{quizzes}-{lowMemory}"
+    backup = path.join(self.tempDir.name, f"{name}.mbz")
+    writeBackup(backup, makeSpec(quizzes))
+    output = path.join(self.tempDir.name, name)
+    course = Course.fromZip(
+        backup,
+        output,
+        options=ConversionOptions(
+            execCache=False,
+            formatCache=False,
+            lowMemory=lowMemory,
+            htmlCacheSize=64 * 1024))
+    return course, output
+
+  def peakMemory(self, quizzes: int) -> int:
+    conversionCache.clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+      self.convert(quizzes, lowMemory=True)
+      return tracemalloc.get_traced_memory()[1]
+    finally:
+      tracemalloc.stop()
+
+  def test_output_is_the_same_as_a_normal_run(self):
+    course, normal = self.convert(5, lowMemory=False)
+    lowCourse, low = self.convert(5, lowMemory=True)
+    self.assertEqual(readTree(normal), readTree(low))
+    self.assertEqual([], lowCourse.assignments)
+    self.assertEqual(5, lowCourse.assignmentCount)
+    self.assertEqual(course.questionCount, lowCourse.questionCount)
+
+  def test_peak_memory_does_not_grow_with_the_number_of_quizzes(self):
+    few = self.peakMemory(3)
+    many = self.peakMemory(12)
+    self.assertLess(many, few * 1.25)
+
+
+class TestSectionOrder(unittest.TestCase):
+
+  def test_ids_in_sections_come_first_in_section_order(self):
+    sections = [
+        Section(1, "one", "", ["30", "missing", "10"]),
+        Section(2, "two", "", ["40"])
+    ]
+    self.assertEqual(
+        [2, 0, 3, 1], sectionOrder(["10", "20", "30", "40"], sections))
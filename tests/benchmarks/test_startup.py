@@ -0,0 +1,11 @@
+import unittest
+
+from benchmarks.run import loadedHeavyModules
+
+
+class TestStartup(unittest.TestCase):
+
+  # The time budget depends on the machine, so it is only checked by the
+  # benchmarks (pdm run bench)
+  def test_command_line_loads_no_heavy_modules(self):
+    self.assertEqual([], loadedHeavyModules())
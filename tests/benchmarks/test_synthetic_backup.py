@@ -0,0 +1,93 @@
+import json
+import os
+from os import path
+import tarfile
+from tempfile import TemporaryDirectory
+import unittest
+
+from benchmarks.run import measure
+from benchmarks.synthetic_backup import QUESTION_TYPES, BackupSpec, writeBackup
+from moodle2pretext.course import Course
+from moodle2pretext.options import ConversionOptions
+
+SPEC = BackupSpec(
+    quizzes=3,
+    sections=2,
+    bankEntries=60,
+    questionsPerQuiz=6,
+    typeWeights={qType: 1
+                 for qType in QUESTION_TYPES},
+    imageRate=0.5,
+    imageBytes=64,
+    datafileRate=1)
+
+
+class TestSyntheticBackup(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+    self.backup = path.join(self.tempDir.name, "course.mbz")
+    self.writer = writeBackup(self.backup, SPEC)
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def test_backup_has_every_question_type(self):
+    self.assertEqual(set(QUESTION_TYPES), set(self.writer.questionTypes))
+    with tarfile.open(self.backup) as tar:
+      names = tar.getnames()
+    self.assertIn("questions.xml", names)
+    self.assertIn("files.xml", names)
+    self.assertEqual(
+        3, len([n for n in names if n.startswith("activities/quiz_")]))
+
+  def readMembers(self, backup: str) -> dict[str, bytes]:
+    with tarfile.open(backup) as tar:
+      return {
+          member.name: tar.extractfile(member).read()
+          for member in tar.getmembers()
+      }
+
+  def test_same_seed_gives_same_backup(self):
+    other = path.join(self.tempDir.name, "other.mbz")
+    writeBackup(other, SPEC)
+    self.assertEqual(self.readMembers(self.backup), self.readMembers(other))
+    self.assertEqual(self.readMembers(self.backup), self.writer.makeMembers())
+
+  def test_images_have_their_mime_type(self):
+    files = self.readMembers(self.backup)["files.xml"].decode("utf-8")
+    self.assertIn("<filename>figure", files)
+    self.assertIn("<mimetype>image/png</mimetype>", files)
+    self.assertNotIn("application/octet-stream", files)
+
+  def test_backup_converts_end_to_end(self):
+    output = path.join(self.tempDir.name, "out")
+    course = Course.fromZip(
+        self.backup,
+        output,
+        options=ConversionOptions(execCache=False, formatCache=False))
+    self.assertEqual(3, len(course.assignments))
+    self.assertEqual([6, 6, 6], [len(a.questions) for a in course.assignments])
+    sources = os.listdir(path.join(output, "source"))
+    self.assertEqual(4, len(sources))
+    self.assertIn("main.ptx", sources)
+
+  def test_only_entries_used_by_quizzes_are_kept(self):
+    course = Course.fromZip(
+        self.backup,
+        path.join(self.tempDir.name, "out"),
+        options=ConversionOptions(execCache=False, formatCache=False))
+    used = {
+        question.id
+        for assignment in course.assignments
+        for question in assignment.questions
+    }
+    self.assertLess(len(course.questions), SPEC.bankEntries)
+    self.assertEqual(len(used), len(course.questions))
+    self.assertEqual(len(course.referencedEntries), len(course.questions))
+
+  def test_measurements_are_json(self):
+    result = json.loads(json.dumps(measure(self.backup, self.tempDir.name)))
+    self.assertEqual(18, result["questions"])
+    self.assertGreater(result["peakRss"], 0)
+    self.assertIn("preparePtxResources", result["stages"])
@@ -0,0 +1,75 @@
+import unittest
+
+from moodle2pretext.options import DEFAULT_HTML_CACHE_SIZE
+
+from moodle2pretext.utils.html import conversionCache, pretextify, simplifyHTML
+from moodle2pretext.utils.lru_cache import LruCache
+
+
+class TestLruCache(unittest.TestCase):
+
+  def test_counts_hits_and_misses(self):
+    cache = LruCache(2)
+    self.assertEqual(1, cache.lookup("a", lambda: 1))
+    self.assertEqual(1, cache.lookup("a", lambda: 2))
+    self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+  def test_drops_least_recently_used(self):
+    cache = LruCache(2)
+    cache.lookup("a", lambda: 1)
+    cache.lookup("b", lambda: 2)
+    cache.lookup("a", lambda: 1)
+    cache.lookup("c", lambda: 3)
+    self.assertEqual(2, len(cache))
+    self.assertEqual(1, cache.lookup("a", lambda: 0))
+    self.assertEqual(4, cache.lookup("b", lambda: 4))
+
+  def test_size_bounds_the_total_size_of_values(self):
+    cache = LruCache(5, len)
+    cache.lookup("a", lambda: "aa")
+    cache.lookup("b", lambda: "bbb")
+    cache.lookup("c", lambda: "c")
+    self.assertEqual(["b", "c"], list(cache.values))
+    self.assertEqual(4, cache.size)
+    cache.lookup("d", lambda: "dddddd")
+    self.assertEqual(["b", "c"], list(cache.values))
+
+  def test_size_zero_stores_nothing(self):
+    cache = LruCache(0)
+    cache.lookup("a", lambda: 1)
+    self.assertEqual(0, len(cache))
+
+
+class TestConversionCache(unittest.TestCase):
+
+  def setUp(self):
+    conversionCache.clear()
+
+  def test_repeated_fragments_are_converted_once(self):
+    first = pretextify("<p>Correct!</p>")
+    second = pretextify("<p>Correct!</p>")
+    self.assertIs(first, second)
+    self.assertEqual((1, 1), (conversionCache.hits, conversionCache.misses))
+
+  def test_cache_is_bounded_by_the_length_of_fragments(self):
+    conversionCache.resize(40)
+    try:
+      for i in range(10):
+        pretextify(f"<p>Fragment {i}</p>")
+      self.assertLessEqual(conversionCache.size, 40)
+      self.assertEqual(
+          conversionCache.size, sum(map(len, conversionCache.values.values())))
+    finally:
+      conversionCache.resize(DEFAULT_HTML_CACHE_SIZE)
+
+  def test_key_includes_context_and_conversion(self):
+    html = "<p><img src='@@PLUGINFILE@@/a.png' alt=''></p>"
+    self.assertNotEqual(pretextify(html, 1), pretextify(html, 2))
+    self.assertIsNot(pretextify(html), simplifyHTML(html))
+
+  def test_cached_results_cannot_be_changed_through_their_nodes(self):
+    html = "<p>Incorrect</p>"
+    nodes = pretextify(html).copyNodes()
+    nodes[0].string = "changed"
+    self.assertEqual("<p>Incorrect</p>", pretextify(html))
+    self.assertEqual("<p>Incorrect</p>", str(pretextify(html).copyNodes()[0]))
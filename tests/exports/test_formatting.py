@@ -0,0 +1,76 @@
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from lxml import etree
+
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.utils.formatting import Formatter, formatPretext
+
+FILES = {
+    f"sec-{index}.ptx":
+        f'<section xml:id="sec-{index}"><title>Quiz {index}</title>'
+        f"<introduction><p>Intro {index}</p></introduction></section>"
+    for index in range(6)
+}
+
+
+def failingFormat(xml: str) -> str:
+  raise AssertionError("Should have come from the cache: " + xml)
+
+
+class TestFormatter(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def options(self, **kwargs) -> ConversionOptions:
+    return ConversionOptions(cacheDir=self.tempDir.name, **kwargs)
+
+  def formatAll(self, formatter: Formatter) -> dict[str, str]:
+    written = {}
+    with formatter:
+      for name, xml in FILES.items():
+        formatter.submit(
+            name,
+            xml, lambda formatted, name=name: written.update({name: formatted}))
+    return written
+
+  def test_worker_processes_give_the_same_files(self):
+    expected = {name: formatPretext(xml) for name, xml in FILES.items()}
+    formatter = Formatter(self.options(formatCache=False), jobs=2)
+    self.assertEqual(expected, self.formatAll(formatter))
+    self.assertIsNone(formatter.pool)
+
+  def test_worker_processes_are_not_forked(self):
+    formatter = Formatter(self.options(formatCache=False), jobs=1)
+    with formatter:
+      formatter.submit("sec-0.ptx", FILES["sec-0.ptx"], lambda formatted: None)
+      method = formatter.pool._mp_context.get_start_method()
+    self.assertIn(method, ("forkserver", "spawn"))
+
+  def test_no_format_keeps_the_xml(self):
+    formatter = Formatter(self.options(format=False), jobs=2)
+    self.assertEqual(FILES, self.formatAll(formatter))
+    self.assertIsNone(formatter.cache)
+    for xml in FILES.values():
+      etree.fromstring(xml)
+
+  def test_unchanged_files_are_not_formatted_again(self):
+    first = self.formatAll(Formatter(self.options(), jobs=0))
+    with patch("moodle2pretext.utils.formatting.formatPretext", failingFormat):
+      second = self.formatAll(Formatter(self.options(), jobs=0))
+    self.assertEqual(first, second)
+
+  def test_changed_files_are_formatted(self):
+    formatter = Formatter(self.options(), jobs=0)
+    self.formatAll(formatter)
+    written = []
+    with patch("moodle2pretext.utils.formatting.formatPretext",
+               lambda xml: "formatted"):
+      formatter.submit("new.ptx", "<section/>", written.append)
+    self.assertEqual(["formatted"], written)
@@ -0,0 +1,158 @@
+import os
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from moodle2pretext.utils.output_sync import StagedOutput, SyncReport
+
+
+def writeFiles(directory: str, files: dict[str, str]) -> None:
+  for filename, contents in files.items():
+    target = path.join(directory, filename)
+    os.makedirs(path.dirname(target), exist_ok=True)
+    with open(target, "w") as f:
+      f.write(contents)
+
+
+def readFile(filename: str) -> str:
+  with open(filename) as f:
+    return f.read()
+
+
+def publishFiles(
+    target: str,
+    files: dict[str, str],
+    overwrite=False,
+    incremental=False) -> SyncReport | None:
+  with StagedOutput(target, overwrite, incremental) as output:
+    writeFiles(output.directory, files)
+    return output.publish()
+
+
+class TestOutputSync(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+    self.target = path.join(self.tempDir.name, "target")
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def test_first_sync_adds_everything(self):
+    report = publishFiles(
+        self.target, {
+            "project.ptx": "p", "source/main.ptx": "m"
+        },
+        incremental=True)
+    self.assertEqual(
+        [path.join("project.ptx"), path.join("source", "main.ptx")],
+        report.added)
+    self.assertEqual("m", readFile(path.join(self.target, "source/main.ptx")))
+    self.assertEqual(["target"], os.listdir(self.tempDir.name))
+
+  def test_unchanged_files_keep_their_mtime(self):
+    publishFiles(self.target, {"source/main.ptx": "m", "source/sec.ptx": "s"})
+    mainFile = path.join(self.target, "source", "main.ptx")
+    os.utime(mainFile, ns=(0, 0))
+    report = publishFiles(
+        self.target, {
+            "source/main.ptx": "m", "source/sec.ptx": "changed"
+        },
+        incremental=True)
+    self.assertEqual([path.join("source", "main.ptx")], report.unchanged)
+    self.assertEqual([path.join("source", "sec.ptx")], report.changed)
+    self.assertEqual(0, os.stat(mainFile).st_mtime_ns)
+    self.assertEqual(
+        "changed", readFile(path.join(self.target, "source", "sec.ptx")))
+
+  def test_stale_files_are_removed_only_from_managed_dirs(self):
+    writeFiles(
+        self.target,
+        {
+            "source/old.ptx": "o",
+            "assets/images/old/pic.png": "i",
+            "notes.txt": "n"
+        })
+    report = publishFiles(
+        self.target, {"source/main.ptx": "m"}, incremental=True)
+    self.assertEqual(
+        [
+            path.join("assets", "images", "old", "pic.png"),
+            path.join("source", "old.ptx")
+        ],
+        report.removed)
+    self.assertFalse(path.exists(path.join(self.target, "assets")))
+    self.assertTrue(path.exists(path.join(self.target, "notes.txt")))
+
+  def test_overwrite_keeps_other_files_of_the_previous_output(self):
+    writeFiles(self.target, {"source/old.ptx": "o", "source/main.ptx": "x"})
+    self.assertIsNone(
+        publishFiles(self.target, {"source/main.ptx": "m"}, overwrite=True))
+    self.assertEqual("o", readFile(path.join(self.target, "source/old.ptx")))
+    self.assertEqual("m", readFile(path.join(self.target, "source/main.ptx")))
+    self.assertEqual(["target"], os.listdir(self.tempDir.name))
+
+  def test_existing_output_is_an_error_without_overwrite(self):
+    os.makedirs(self.target)
+    with self.assertRaises(FileExistsError):
+      publishFiles(self.target, {"source/main.ptx": "m"})
+
+  def test_failed_conversion_leaves_output_alone(self):
+    writeFiles(self.target, {"source/main.ptx": "x"})
+    with self.assertRaises(RuntimeError):
+      with StagedOutput(self.target, overwrite=True) as output:
+        writeFiles(output.directory, {"source/main.ptx": "m"})
+        raise RuntimeError("conversion failed")
+    self.assertEqual("x", readFile(path.join(self.target, "source/main.ptx")))
+    self.assertEqual(["target"], os.listdir(self.tempDir.name))
+
+  def test_swaps_without_renameat2(self):
+    writeFiles(self.target, {"source/main.ptx": "x"})
+    with patch("ctypes.CDLL", side_effect=OSError):
+      publishFiles(self.target, {"source/main.ptx": "m"}, overwrite=True)
+    self.assertEqual("m", readFile(path.join(self.target, "source/main.ptx")))
+    self.assertEqual(["target"], os.listdir(self.tempDir.name))
+
+  def test_overwrite_keeps_links_and_empty_directories(self):
+    shared = path.join(self.tempDir.name, "shared")
+    writeFiles(shared, {"logo.png": "l"})
+    writeFiles(self.target, {"source/main.ptx": "x"})
+    os.symlink(shared, path.join(self.target, "extra"))
+    os.makedirs(path.join(self.target, "drafts", "empty"))
+    publishFiles(self.target, {"source/main.ptx": "m"}, overwrite=True)
+    self.assertEqual(shared, os.readlink(path.join(self.target, "extra")))
+    self.assertEqual("l", readFile(path.join(self.target, "extra", "logo.png")))
+    self.assertTrue(path.isdir(path.join(self.target, "drafts", "empty")))
+
+  def test_files_written_under_a_link_go_through_it(self):
+    shared = path.join(self.tempDir.name, "shared")
+    writeFiles(shared, {"images/old.png": "o"})
+    writeFiles(self.target, {"source/main.ptx": "x"})
+    os.symlink(shared, path.join(self.target, "assets"))
+    report = publishFiles(
+        self.target, {
+            "source/main.ptx": "m", "assets/images/new.png": "n"
+        },
+        incremental=True)
+    self.assertTrue(path.islink(path.join(self.target, "assets")))
+    self.assertEqual("n", readFile(path.join(shared, "images", "new.png")))
+    self.assertEqual("o", readFile(path.join(shared, "images", "old.png")))
+    self.assertIn(path.join("assets", "images", "new.png"), report.added)
+
+  def test_output_location_that_is_a_link_is_kept(self):
+    real = path.join(self.tempDir.name, "real")
+    writeFiles(real, {"source/main.ptx": "x", "notes.txt": "n"})
+    os.symlink(real, self.target)
+    publishFiles(self.target, {"source/main.ptx": "m"}, overwrite=True)
+    self.assertEqual(real, os.readlink(self.target))
+    self.assertEqual("m", readFile(path.join(real, "source", "main.ptx")))
+    self.assertEqual("n", readFile(path.join(real, "notes.txt")))
+    self.assertEqual(["real", "target"], sorted(os.listdir(self.tempDir.name)))
+
+  def test_work_directory_is_beside_the_output(self):
+    with StagedOutput(self.target) as output:
+      self.assertEqual(self.tempDir.name, path.dirname(output.workDir))
+      writeFiles(output.directory, {"source/main.ptx": "m"})
+      output.publish()
+    self.assertEqual(["target"], os.listdir(self.tempDir.name))
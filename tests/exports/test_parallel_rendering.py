@@ -0,0 +1,108 @@
+import filecmp
+import os
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+
+from benchmarks.synthetic_backup import BackupSpec, writeBackup
+from moodle2pretext.assignment import Assignment
+from moodle2pretext.course import Course
+from moodle2pretext.options import ConversionOptions
+from moodle2pretext.question import Question
+from moodle2pretext.question.exercisegroup_question import ExerciseGroupQuestion
+from moodle2pretext.question.multiplechoice import Choice, MultipleChoiceQuestion
+from moodle2pretext.utils.html import pretextify
+from moodle2pretext.utils.ptx_writer import PtxWriter
+
+SPEC = BackupSpec(quizzes=4, sections=2, bankEntries=12, questionsPerQuiz=4)
+
+
+def makeAssignments() -> list[Assignment]:
+  shared = Question("1", "shared", "<p>Shared</p>")
+  group = ExerciseGroupQuestion(
+      "2",
+      "group",
+      "<p>Group</p>",
+      [
+          MultipleChoiceQuestion(
+              "2-0",
+              "group-0",
+              "<p>Sub</p>", [Choice("a", "", True)],
+              allowMultipleAnswers=False),
+          MultipleChoiceQuestion(
+              "2-1",
+              "shared",
+              "<p>Sub</p>", [Choice("a", "", True)],
+              allowMultipleAnswers=False)
+      ])
+  return [
+      Assignment("10", "Quiz", "<p>One</p>", [shared, group]),
+      Assignment("11", "Quiz", "<p>Two</p>", [group, shared]),
+  ]
+
+
+class TestParallelRendering(unittest.TestCase):
+
+  def test_reserved_ids_match_a_serial_run(self):
+    serial = PtxWriter(None)
+    reserved = PtxWriter(None)
+    for assignment in makeAssignments():
+      self.assertEqual(serial.seenIds, reserved.seenIds)
+      serial.makeAssignment(assignment)
+      reserved.reserveAssignmentIds(assignment)
+    self.assertEqual(serial.seenIds, reserved.seenIds)
+
+  def test_writer_seeded_with_reserved_ids_continues_numbering(self):
+    first, second = makeAssignments()
+    serial = PtxWriter(None)
+    serial.makeAssignment(first)
+    expected = serial.makeAssignment(second)
+
+    reserved = PtxWriter(None)
+    reserved.reserveAssignmentIds(first)
+    worker = PtxWriter(None)
+    worker.seenIds = dict(reserved.seenIds)
+    self.assertEqual(str(expected), str(worker.makeAssignment(second)))
+
+  def test_converted_fragments_are_spliced_like_parsed_strings(self):
+    fragment = pretextify("<p>Pick <img src='a.png' alt=''> <b>one</b></p>")
+    writer = PtxWriter(None)
+    self.assertEqual(
+        str(writer.makeTag("statement", str(fragment))),
+        str(writer.makeTag("statement", fragment)))
+
+
+class TestParallelConversion(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+    self.backup = path.join(self.tempDir.name, "course.mbz")
+    writeBackup(self.backup, SPEC)
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def convert(self, jobs: int) -> str:
+    output = path.join(self.tempDir.name, f"jobs-{jobs}")
+    Course.fromZip(
+        self.backup,
+        output,
+        options=ConversionOptions(
+            jobs=jobs, execCache=False, formatCache=False))
+    return output
+
+  def assertSameTree(self, first: str, second: str) -> None:
+    comparison = filecmp.dircmp(first, second)
+    self.assertEqual([], comparison.left_only + comparison.right_only)
+    _, mismatch, errors = filecmp.cmpfiles(
+        first, second, comparison.common_files, shallow=False)
+    self.assertEqual([], mismatch + errors)
+    for directory in comparison.common_dirs:
+      self.assertSameTree(
+          path.join(first, directory), path.join(second, directory))
+
+  def test_parallel_output_matches_a_serial_run(self):
+    serial = self.convert(1)
+    parallel = self.convert(2)
+    self.assertEqual(5, len(os.listdir(path.join(parallel, "source"))))
+    self.assertSameTree(serial, parallel)
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from moodle2pretext.utils.profiler import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+  def setUp(self):
+    self.profiler = Profiler()
+
+  def tearDown(self):
+    self.profiler.stop()
+
+  def test_disabled_profiler_records_nothing(self):
+    with self.profiler.span("stage", "one"):
+      pass
+    self.assertEqual([], self.profiler.spans)
+
+  def test_nested_spans_record_their_depth(self):
+    self.profiler.start(traceMemory=False)
+    with self.profiler.span("stage", "outer"):
+      with self.profiler.span("question", "inner"):
+        pass
+    self.assertEqual(
+        [("inner", 1), ("outer", 0)],
+        [(span.name, span.depth) for span in self.profiler.spans])
+    self.assertIsNone(self.profiler.spans[0].peakMemory)
+
+  def test_peak_memory_includes_nested_spans(self):
+    self.profiler.start()
+    with self.profiler.span("stage", "outer"):
+      with self.profiler.span("question", "inner"):
+        data = bytearray(4 * 2**20)
+        del data
+      self.profiler.call("question", "small", lambda: bytearray(1024))
+    inner, small, outer = self.profiler.spans
+    self.assertGreaterEqual(inner.peakMemory, 4 * 2**20)
+    self.assertLess(small.peakMemory, 2**20)
+    self.assertGreaterEqual(outer.peakMemory, inner.peakMemory)
+
+  def test_totals_count_outermost_spans_of_each_category(self):
+    self.profiler.start(traceMemory=False)
+    with self.profiler.span("question", "group"):
+      self.profiler.call("question", "part", lambda: None)
+      self.profiler.call("html", "pretextify", lambda: None)
+    totals = self.profiler.totals()
+    self.assertEqual(1, totals["question"]["count"])
+    self.assertEqual(1, totals["html"]["count"])
+
+  def test_spans_of_other_threads_are_nested_in_open_ones(self):
+    self.profiler.start()
+    with self.profiler.span("exec", "all"):
+      with ThreadPoolExecutor(2) as pool:
+        list(
+            pool.map(
+                lambda name: self.profiler.call("exec", name, lambda: None),
+                ["a", "b"]))
+    spans = self.profiler.spans
+    self.assertEqual({"a", "b"}, {span.name for span in spans[:2]})
+    self.assertEqual([1, 1, 0], [span.depth for span in spans])
+    self.assertEqual(1, self.profiler.totals()["exec"]["count"])
+
+  def test_summary_ranks_slowest_questions(self):
+    self.profiler.start(traceMemory=False)
+    self.profiler.call("question", "fast", lambda: None)
+    self.profiler.call("question", "slow", sum, range(10**6))
+    summary = self.profiler.summary().splitlines()
+    ranked = summary[summary.index("slowest questions") + 1:]
+    self.assertTrue(ranked[0].startswith("slow"))
+    self.assertTrue(ranked[1].startswith("fast"))
+
+  def test_counters_add_up_while_enabled(self):
+    self.profiler.count("cache.hits")
+    self.profiler.start(traceMemory=False)
+    self.profiler.count("cache.hits", 2)
+    self.profiler.count("cache.hits")
+    self.assertEqual({"cache.hits": 3}, self.profiler.toDict()["counters"])
+    self.assertIn("cache.hits", self.profiler.summary())
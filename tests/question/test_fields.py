@@ -0,0 +1,63 @@
+from os import path
+import unittest
+from xml.dom.minidom import parseString
+
+from moodle2pretext.utils import getFirstText
+from moodle2pretext.utils.fields import FieldExtractor
+
+EXAMPLES = [
+    "coderunner_example.xml",
+    "matching_example.xml",
+    "multichoice_example.xml",
+    "numerical_example.xml",
+    "shortanswer_example.xml",
+]
+
+
+def parseFile(filename):
+  with open(path.join(path.dirname(__file__), filename), encoding="utf-8") as f:
+    return parseString(f.read()).documentElement
+
+
+class TestFieldExtractor(unittest.TestCase):
+
+  def test_matches_get_first_text(self):
+    paths = dict(
+        name="name",
+        questionText="questiontext",
+        answer="answer",
+        single="plugin_qtype_multichoice_question/multichoice/single",
+        template="coderunner_option/template",
+        fraction="answers/answer/fraction")
+    for filename in EXAMPLES:
+      node = parseFile(filename)
+      found = {}
+      for field, tags in paths.items():
+        try:
+          found[field] = getFirstText(node, tags)
+        except RuntimeError:
+          pass
+      extractor = FieldExtractor(**{f: paths[f] for f in found})
+      self.assertEqual(found, extractor.extract(node), filename)
+
+  def test_later_tags_are_searched_inside_the_first_earlier_one(self):
+    node = parseString(
+        "<q><b>outer</b><a><c>1</c></a><a><b>inner</b></a></q>").documentElement
+    self.assertEqual({"text": "1"}, FieldExtractor(text="a/c").extract(node))
+    # Like getFirstText, only the first <a> is searched
+    with self.assertRaisesRegex(RuntimeError, "^No child tag: b$"):
+      FieldExtractor(text="a/b").extract(node)
+    with self.assertRaisesRegex(RuntimeError, "^No child tag: b$"):
+      getFirstText(node, "a/b")
+
+  def test_missing_tag_reports_first_missing_field(self):
+    node = parseString("<q><name>x</name></q>").documentElement
+    extractor = FieldExtractor(
+        name="name", single="multichoice/single", text="questiontext")
+    with self.assertRaisesRegex(RuntimeError, "^No child tag: multichoice$"):
+      extractor.extract(node)
+
+  def test_text_joins_nested_and_cdata_nodes(self):
+    node = parseString(
+        "<q><t>a<i>b<![CDATA[<c>]]></i>d</t><t>e</t></q>").documentElement
+    self.assertEqual({"text": "ab<c>d"}, FieldExtractor(text="t").extract(node))
@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 from moodle2pretext.question.question import processQuestionText
@@ -14,3 +15,10 @@ class TestQuestionCreation(unittest.TestCase):
     content, title = processQuestionText("<h4></h4>\n<h3>title here</h3><p>stuff</p>")
     self.assertEqual(title, "title here")
     self.assertEqual(content, "<p>stuff</p>")
+
+  def test_content_keeps_its_tree(self):
+    content, _ = processQuestionText(
+        "<h3>title here</h3><p>stuff <img src='a.png' alt=''></p>")
+    self.assertEqual(
+        str(content), "".join(str(node) for node in content.copyNodes()))
+    self.assertEqual(content, pickle.loads(pickle.dumps(content)))
@@ -0,0 +1,51 @@
+from os import path
+import unittest
+
+from lxml import etree
+
+from moodle2pretext.question import *
+from moodle2pretext.questionBank import QuestionBank
+
+
+def readEntry(entryId: str, filename: str) -> etree._Element:
+  with open(path.join(path.dirname(__file__), filename), "r",
+            encoding="utf-8") as f:
+    question = f.read().split("?>", 1)[1]
+  return etree.fromstring(
+      f'<question_bank_entry id="{entryId}">{question}</question_bank_entry>'.
+      encode("utf-8"))
+
+
+class TestQuestionBank(unittest.TestCase):
+
+  def setUp(self):
+    self.bank = QuestionBank()
+    self.bank.add("1", readEntry("1", "multichoice_example.xml"))
+    self.bank.add("2", readEntry("2", "shortanswer_example.xml"))
+
+  def test_questions_are_resolved_in_quiz_order(self):
+    questions = self.bank.resolve(["2", "1"])
+    self.assertIsInstance(questions[0], FillInQuestion)
+    self.assertIsInstance(questions[1], MultipleChoiceQuestion)
+
+  def test_questions_are_built_once_and_shared(self):
+    first = self.bank.resolve(["1", "2"])
+    second = self.bank.resolve(["1"])
+    self.assertIs(first[0], second[0])
+    self.assertNotIn("1", self.bank.entries)
+    self.assertIn("1", self.bank)
+    self.assertEqual(2, len(self.bank))
+
+  def test_unknown_entries_are_an_error(self):
+    with self.assertRaises(KeyError):
+      self.bank.get("3")
+
+  def test_questions_are_not_kept_when_asked(self):
+    bank = QuestionBank(keepQuestions=False)
+    bank.add("1", readEntry("1", "multichoice_example.xml"))
+    first = bank.get("1")
+    second = bank.get("1")
+    self.assertIsNot(first, second)
+    self.assertEqual(first.name, second.name)
+    self.assertEqual({}, bank.questions)
+    self.assertIn("1", bank.entries)
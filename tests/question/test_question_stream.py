@@ -0,0 +1,75 @@
+from io import BytesIO
+from os import path
+import unittest
+
+from lxml import etree
+
+from moodle2pretext.question import *
+from moodle2pretext.utils.xml_stream import elementToDom, iterElements, iterTexts, toDom
+
+
+def readExample(filename: str) -> str:
+  with open(path.join(path.dirname(__file__), filename), "r",
+            encoding="utf-8") as f:
+    return f.read().split("?>", 1)[1]
+
+
+def makeBank(*filenames: str) -> BytesIO:
+  entries = "".join(
+      f'<question_bank_entry id="{index}">{readExample(filename)}</question_bank_entry>'
+      for index, filename in enumerate(filenames))
+  return BytesIO(
+      f"<question_categories><question_bank_entries>{entries}</question_bank_entries></question_categories>"
+      .encode("utf-8"))
+
+
+class TestQuestionStream(unittest.TestCase):
+
+  def test_entries_are_yielded_one_at_a_time(self):
+    bank = makeBank("multichoice_example.xml", "shortanswer_example.xml")
+    ids = [
+        entry.get("id") for entry in iterElements(bank, "question_bank_entry")
+    ]
+    self.assertEqual(["0", "1"], ids)
+
+  def test_entries_are_cleared_after_use(self):
+    bank = makeBank("multichoice_example.xml", "shortanswer_example.xml")
+    entries = list(iterElements(bank, "question_bank_entry"))
+    self.assertEqual(0, len(entries[0]))
+    self.assertEqual(0, len(entries[1]))
+    self.assertIsNone(entries[1].getprevious())
+
+  def test_questions_built_from_streamed_entries(self):
+    bank = makeBank("multichoice_example.xml", "shortanswer_example.xml")
+    questions = [
+        questionFromElement(entry)
+        for entry in iterElements(bank, "question_bank_entry")
+    ]
+    self.assertIsInstance(questions[0], MultipleChoiceQuestion)
+    self.assertEqual("digraph_shortest_path_mc", questions[0].name)
+    self.assertIsInstance(questions[1], FillInQuestion)
+    self.assertEqual("pogil_1a_classname", questions[1].name)
+
+  def test_streamed_entries_copy_to_the_dom_they_would_parse_to(self):
+    bank = makeBank(
+        "multichoice_example.xml",
+        "coderunner_example.xml",
+        "matching_example.xml",
+        "numerical_example.xml")
+    for entry in iterElements(bank, "question_bank_entry"):
+      self.assertEqual(
+          toDom(etree.tostring(entry)).toxml(), elementToDom(entry).toxml())
+
+  def test_comments_are_left_out_of_the_dom(self):
+    entry = etree.fromstring(b"<a x='1'>one<!-- note -->two<b/>three</a>")
+    self.assertEqual(
+        '<a x="1">onetwo<b/>three</a>', elementToDom(entry).toxml())
+
+  def test_texts_of_every_tag_are_yielded(self):
+    quiz = BytesIO(
+        b"<quiz><question_instances>"
+        b"<question_instance><questionbankentryid>7</questionbankentryid>"
+        b"</question_instance>"
+        b"<question_instance><questionbankentryid>3</questionbankentryid>"
+        b"</question_instance></question_instances></quiz>")
+    self.assertEqual(["7", "3"], list(iterTexts(quiz, "questionbankentryid")))
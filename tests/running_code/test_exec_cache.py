@@ -0,0 +1,128 @@
+import os
+import pickle
+from tempfile import TemporaryDirectory
+from threading import Thread
+import unittest
+
+from moodle2pretext.question.coderunner_question import CodeRunnerQuestion, TestCase
+from moodle2pretext.utils.disk_cache import DiskCache
+from moodle2pretext.utils.python_code_runner import ExecutionCache, PythonCodeRunner, SubprocessBackend
+from moodle2pretext.utils.sandbox import TIMEOUT, ExecutionPolicy
+
+
+class FailingBackend:
+  """Backend for runs that are expected to come from the cache."""
+
+  def run(self, code, stdin, cwd):
+    raise AssertionError("Should not have run: " + code)
+
+
+def makeQuestion(answer: str) -> CodeRunnerQuestion:
+  question = CodeRunnerQuestion(
+      "id",
+      "Q1",
+      "Echo the input and the file",
+      "python?!?",
+      "",
+      answer,
+      "",
+      [
+          TestCase("", "Hi Haris", "Haris", True),
+          TestCase("", "Hi Barb", "Barb", True),
+      ])
+  question.datafiles = {"data.txt": "from the file"}
+  return question
+
+
+class TestExecutionCache(unittest.TestCase):
+
+  def setUp(self):
+    self.tempDir = TemporaryDirectory()
+
+  def tearDown(self):
+    self.tempDir.cleanup()
+
+  def makeCache(self, maxBytes=1024 * 1024) -> ExecutionCache:
+    return ExecutionCache(DiskCache(self.tempDir.name, maxBytes))
+
+  def test_cached_results_are_identical(self):
+    question = makeQuestion("print('Hi', input(), open('data.txt').read())")
+    first = PythonCodeRunner(SubprocessBackend(), self.makeCache())
+    expected = first.runExampleCases(question)
+    second = PythonCodeRunner(FailingBackend(), self.makeCache())
+    self.assertEqual(expected, second.runExampleCases(question))
+
+  def test_changes_to_the_datafiles_miss_the_cache(self):
+    question = makeQuestion("print(open('data.txt').read())")
+    PythonCodeRunner(SubprocessBackend(),
+                     self.makeCache()).runExampleCases(question)
+    question.datafiles = {"data.txt": "changed"}
+    results = PythonCodeRunner(SubprocessBackend(),
+                               self.makeCache()).runExampleCases(question)
+    self.assertEqual("changed", results[0][2])
+
+  def test_changes_to_the_limits_miss_the_cache(self):
+    question = makeQuestion("import time; time.sleep(1); print(input())")
+    loose = ExecutionPolicy(20, None, None, None, False)
+    PythonCodeRunner(SubprocessBackend(), self.makeCache(),
+                     loose).runExampleCases(question)
+    strict = ExecutionPolicy(0.5, None, None, None, False)
+    results = PythonCodeRunner(SubprocessBackend(), self.makeCache(),
+                               strict).runExampleCases(question)
+    self.assertEqual([TIMEOUT, TIMEOUT], [result for _, _, result in results])
+
+  def test_errors_are_not_cached(self):
+    question = makeQuestion("raise RuntimeError()")
+    PythonCodeRunner(SubprocessBackend(),
+                     self.makeCache()).runExampleCases(question)
+    cache = self.makeCache()
+    self.assertEqual(0, cache.cache.currentSize())
+
+
+class TestDiskCache(unittest.TestCase):
+
+  def test_least_recently_used_entries_are_evicted(self):
+    with TemporaryDirectory() as directory:
+      cache = DiskCache(directory, 10)
+      cache.put("aa1", b"1234")
+      cache.put("bb2", b"5678")
+      os.utime(cache.pathTo("aa1"), (0, 0))
+      os.utime(cache.pathTo("bb2"), (1, 1))
+      self.assertEqual(b"1234", cache.get("aa1"))
+      cache.put("cc3", b"9012")
+      self.assertEqual(b"1234", cache.get("aa1"))
+      self.assertIsNone(cache.get("bb2"))
+      self.assertEqual(b"9012", cache.get("cc3"))
+
+  def test_rewritten_entries_are_counted_once(self):
+    with TemporaryDirectory() as directory:
+      cache = DiskCache(directory, 10)
+      cache.put("aa1", b"1234")
+      cache.put("bb2", b"5678")
+      cache.put("aa1", b"12")
+      self.assertEqual(6, cache.currentSize())
+      self.assertEqual(b"5678", cache.get("bb2"))
+
+  def test_entries_written_by_threads_are_all_counted(self):
+    with TemporaryDirectory() as directory:
+      cache = DiskCache(directory, 10000)
+      threads = [
+          Thread(
+              target=lambda i=i:
+              [cache.put(f"{i:02}{j}", b"1234")
+               for j in range(20)])
+          for i in range(8)
+      ]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      self.assertEqual(8 * 20 * 4, cache.currentSize())
+      self.assertEqual(
+          cache.currentSize(), DiskCache(directory, 10000).currentSize())
+
+  def test_caches_can_be_sent_to_other_processes(self):
+    with TemporaryDirectory() as directory:
+      cache = pickle.loads(pickle.dumps(DiskCache(directory, 10)))
+      cache.put("aa1", b"1234")
+      self.assertEqual(b"1234", cache.get("aa1"))
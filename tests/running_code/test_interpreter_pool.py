@@ -0,0 +1,84 @@
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+
+from moodle2pretext.question.coderunner_question import CodeRunnerQuestion, TestCase
+from moodle2pretext.utils.interpreter_pool import InterpreterPool
+from moodle2pretext.utils.python_code_runner import PoolBackend, PythonCodeRunner, SubprocessBackend, sharedPool
+
+
+class TestInterpreterPool(unittest.TestCase):
+
+  def setUp(self):
+    self.pool = InterpreterPool(size=2, maxJobsPerWorker=3)
+    self.tempDir = TemporaryDirectory()
+
+  def tearDown(self):
+    self.pool.close()
+    self.tempDir.cleanup()
+
+  def run_code(self, code: str, stdin: str = ""):
+    return self.pool.run(code, stdin, self.tempDir.name)
+
+  def test_captures_stdout_and_reads_stdin(self):
+    run = self.run_code("print('Hi ' + input())", "Haris\n")
+    self.assertEqual(0, run.returncode)
+    self.assertEqual("Hi Haris\n", run.stdout)
+
+  def test_errors_are_reported(self):
+    run = self.run_code("raise ValueError('oops')")
+    self.assertNotEqual(0, run.returncode)
+    self.assertIn("ValueError: oops", run.stderr)
+
+  def test_exit_codes_are_kept(self):
+    self.assertEqual(3, self.run_code("import sys\nsys.exit(3)").returncode)
+    self.assertEqual(0, self.run_code("import sys\nsys.exit()").returncode)
+
+  def test_runs_in_the_given_directory(self):
+    with open(path.join(self.tempDir.name, "data.txt"), "w") as f:
+      f.write("contents")
+    run = self.run_code("print(open('data.txt').read())")
+    self.assertEqual("contents\n", run.stdout)
+
+  def test_cases_do_not_share_state(self):
+    self.run_code("import sys\nsys.leaked = True\nx = 5")
+    run = self.run_code(
+        "import sys\nprint(hasattr(sys, 'leaked'), 'x' in globals())")
+    self.assertEqual("False False\n", run.stdout)
+
+  def test_workers_are_recycled(self):
+    for index in range(7):
+      self.assertEqual(f"{index}\n", self.run_code(f"print({index})").stdout)
+    self.assertLessEqual(self.pool.started, 2)
+
+
+class TestRunnerBackends(unittest.TestCase):
+
+  def test_backends_agree(self):
+    question = CodeRunnerQuestion(
+        "id",
+        "Q1",
+        "Echo the input",
+        "python?!?",
+        "",
+        """print("Hi " + input())""",
+        "",
+        [
+            TestCase("", "Hi Haris", "Haris", True),
+            TestCase("raise RuntimeError()", "", "", True),
+        ])
+    pool = InterpreterPool(size=1)
+    try:
+      pooled = PythonCodeRunner(PoolBackend(pool)).runExampleCases(question)
+    finally:
+      pool.close()
+    fresh = PythonCodeRunner(SubprocessBackend()).runExampleCases(question)
+    self.assertEqual(fresh, pooled)
+    self.assertEqual(("", "Haris", "Hi Haris"), pooled[0])
+    self.assertEqual("error", pooled[1][2])
+
+  def test_shared_pools_have_the_requested_size(self):
+    pool = sharedPool(2)
+    self.assertEqual(2, pool.size)
+    self.assertIs(pool, sharedPool(2))
+    self.assertEqual(3, sharedPool(3).size)
@@ -81,3 +81,37 @@ def add():
     self.assertEqual(len(cases), 2)
     self.assertEqual(cases[0], ("print(add())", "2", "5"))
     self.assertEqual(cases[1], ("print(add())", "6", "9"))
+
+  def test_all_example_cases_run_together(self):
+    echo = CodeRunnerQuestion(
+        "echo",
+        "Q1",
+        "Echo the input",
+        "python?!?",
+        "",
+        """print("Hi " + input())""",
+        "",
+        [
+            TestCase("", "Hi Haris", "Haris", True),
+            TestCase("", "Hi Barb", "Barb", False),
+        ])
+    adder = CodeRunnerQuestion(
+        "adder",
+        "Q2",
+        "Write a function that adds 2 to x",
+        "python?!?",
+        "",
+        """def add(x):\n  return x + 2""",
+        "",
+        [
+            TestCase("print(add(2))", "4", "", True),
+            TestCase("print(add(6))", "8", "", True)
+        ])
+    runner = PythonCodeRunner()
+    results = runner.runAllExampleCases([echo, adder], concurrency=2)
+    self.assertEqual(
+        {
+            "echo": runner.runExampleCases(echo),
+            "adder": runner.runExampleCases(adder)
+        },
+        results)
@@ -0,0 +1,97 @@
+import importlib.util
+from tempfile import TemporaryDirectory
+import time
+import unittest
+
+from moodle2pretext.question.coderunner_question import CodeRunnerQuestion, TestCase
+from moodle2pretext.utils.interpreter_pool import InterpreterPool
+from moodle2pretext.utils.python_code_runner import PoolBackend, PythonCodeRunner, SubprocessBackend
+from moodle2pretext.utils.sandbox import LIMIT_EXCEEDED, TIMEOUT, ExecutionPolicy
+
+HAS_RESOURCE = importlib.util.find_spec("resource") is not None
+
+POLICY = ExecutionPolicy(
+    timeout=3.0,
+    cpuSeconds=1,
+    memoryBytes=256 * 2**20,
+    outputBytes=10000,
+    network=False)
+
+
+def makeQuestion(*testCodes: str) -> CodeRunnerQuestion:
+  return CodeRunnerQuestion(
+      "id",
+      "Q1",
+      "",
+      "python3",
+      "",
+      "",
+      "", [TestCase(code, "", "", True) for code in testCodes])
+
+
+class SandboxTests:
+  """Tests that every backend must pass."""
+
+  def makeBackend(self):
+    raise NotImplementedError
+
+  def setUp(self):
+    self.backend = self.makeBackend()
+    self.runner = PythonCodeRunner(self.backend, policy=POLICY)
+
+  def results(self, *testCodes: str) -> list[str]:
+    return [
+        result for _, _, result in self.runner.runExampleCases(
+            makeQuestion(*testCodes))
+    ]
+
+  def test_cases_within_the_limits_run_as_before(self):
+    self.assertEqual(["hi", "error"], self.results("print('hi')", "1/0"))
+
+  def test_cases_are_stopped_at_their_timeout(self):
+    start = time.perf_counter()
+    self.assertEqual(
+        [TIMEOUT],
+        self.results("import subprocess\nsubprocess.run(['sleep', '30'])"))
+    self.assertLess(time.perf_counter() - start, 10)
+
+  @unittest.skipUnless(HAS_RESOURCE, "Needs resource limits")
+  def test_cases_are_stopped_at_their_cpu_limit(self):
+    self.assertEqual([LIMIT_EXCEEDED], self.results("while True: pass"))
+
+  @unittest.skipUnless(HAS_RESOURCE, "Needs resource limits")
+  def test_cases_are_stopped_at_their_memory_limit(self):
+    self.assertEqual([LIMIT_EXCEEDED], self.results("x = bytearray(2**30)"))
+
+  def test_cases_are_stopped_at_their_output_limit(self):
+    self.assertEqual(
+        [LIMIT_EXCEEDED, LIMIT_EXCEEDED],
+        self.results("print('x' * 100000)", "while True: print('xxxxxxxx')"))
+
+  def test_cases_cannot_use_the_network(self):
+    self.assertEqual(
+        ["error"],
+        self.results(
+            "import socket\n"
+            "socket.create_connection(('127.0.0.1', 9), timeout=1)"))
+
+
+class TestSubprocessSandbox(SandboxTests, unittest.TestCase):
+
+  def makeBackend(self):
+    return SubprocessBackend()
+
+
+class TestPoolSandbox(SandboxTests, unittest.TestCase):
+
+  def makeBackend(self):
+    self.pool = InterpreterPool(size=2)
+    return PoolBackend(self.pool)
+
+  def tearDown(self):
+    self.pool.close()
+
+  def test_workers_survive_cases_that_are_stopped(self):
+    self.results("while True: pass", "import time\ntime.sleep(30)")
+    self.assertEqual(["hi"], self.results("print('hi')"))
+    self.assertEqual(1, self.pool.started)